@@ -0,0 +1,85 @@
+import json
+from pathlib import Path
+
+# directories with the unix sockets of the host, e.g. of docker or dbus
+UNIX_SOCKET_DIRECTORIES = ("/run", "/tmp/.X11-unix")  # noqa: S108
+
+
+class BwrapError(Exception):
+    pass
+
+
+def bwrap_command(path_to_srt_settings: Path, command: str, workspace: Path | None = None) -> list[str]:
+    """
+    Run the shell `command` with bubblewrap directly, instead of through the `srt` cli, which needs to start node first.
+    The srt settings are translated to the same isolation:
+    - no network at all. `allowedDomains` needs the proxy of srt, so it is not supported
+    - everything is read-only, besides the `allowWrite` paths (relative to the `workspace`) without the `denyWrite` ones
+    - the `denyRead` paths are hidden
+    - unix sockets of the host can not be reached, besides the `allowUnixSockets` ones. srt blocks creating unix sockets,
+      here the directories with the sockets of the host (`UNIX_SOCKET_DIRECTORIES`) are hidden instead, a separate
+      network namespace hides the abstract sockets
+    """
+
+    srt_settings = json.loads(path_to_srt_settings.read_text())
+    network = srt_settings.get("network", {})
+    filesystem = srt_settings.get("filesystem", {})
+    if network.get("allowedDomains"):
+        raise BwrapError("`network.allowedDomains` is not supported by the bwrap sandbox backend, use srt instead")
+
+    def paths(key: str, settings: dict) -> list[Path]:
+        # like srt: `~` is the home of the user, relative paths are relative to the workspace
+        resolved = []
+        for path in settings.get(key, []):
+            path = Path(path).expanduser()
+            if not path.is_absolute():
+                if workspace is None:
+                    continue
+                path = workspace / path
+            # bwrap can not mount over paths which do not exist
+            if path.exists():
+                resolved.append(path.resolve())
+        return resolved
+
+    cmd = [
+        "bwrap",
+        "--die-with-parent",
+        "--new-session",
+        "--unshare-net",
+        "--unshare-pid",
+        "--unshare-ipc",
+        "--unshare-uts",
+        "--ro-bind",
+        "/",
+        "/",
+        "--dev",
+        "/dev",
+        "--proc",
+        "/proc",
+    ]
+
+    # the empty directories mounted over the hidden ones, made read-only once everything is mounted
+    hidden: list[str] = []
+    for directory in UNIX_SOCKET_DIRECTORIES:
+        if Path(directory).is_dir():
+            cmd += ["--tmpfs", directory]
+            hidden.append(directory)
+    for path in paths("allowUnixSockets", network):
+        cmd += ["--bind", str(path), str(path)]
+
+    for path in paths("allowWrite", filesystem):
+        cmd += ["--bind", str(path), str(path)]
+    for path in paths("denyWrite", filesystem):
+        cmd += ["--ro-bind", str(path), str(path)]
+    for path in paths("denyRead", filesystem):
+        if path.is_dir():
+            cmd += ["--tmpfs", str(path)]
+            hidden.append(str(path))
+        else:
+            cmd += ["--ro-bind", "/dev/null", str(path)]
+
+    for directory in hidden:
+        cmd += ["--remount-ro", directory]
+    if workspace is not None:
+        cmd += ["--chdir", str(workspace)]
+    return [*cmd, "/bin/sh", "-c", command]
@@ -1,5 +1,7 @@
+import json
 import logging
 import subprocess  # noqa: S404
+import time
 from pathlib import Path
 from typing import Annotated
 
@@ -7,9 +9,11 @@ import typer
 from rich.console import Console
 from rich.table import Table
 
-from mcp_run_isolated_python.mcp_server import run_mcp
-from mcp_run_isolated_python.utils.logger import configure_logging, get_logger
-from mcp_run_isolated_python.utils.settings import Settings
+from mcp_run_isolated_python.environment_cache import EnvironmentCache, EnvironmentCacheError
+from mcp_run_isolated_python.utils.logger import LogFormat, configure_logging, get_logger
+from mcp_run_isolated_python.utils.otel import configure_telemetry
+from mcp_run_isolated_python.utils.settings import InterpreterProfile, SandboxBackend, Settings
+from mcp_run_isolated_python.utils.startup import startup_profile
 
 # todo tests
 
@@ -19,6 +23,10 @@ def run(
         Path | None,
         "Path to a settings file containing settings for the sandbox environment. View: `https://github.com/anthropic-experimental/sandbox-runtime?tab=readme-ov-file#configuration` for more information. There is a default settings file which will be used otherwise.",
     ] = None,
+    sandbox_backend: Annotated[
+        SandboxBackend,
+        "`srt`: run the sandboxes with the `srt` cli. `bwrap`: run them with bubblewrap directly, without starting node for every sandbox. The srt settings are translated, except `network.allowedDomains`.",
+    ] = "srt",
     python_version: Annotated[
         str,
         "Which python version to use for the virtual environment. Example: `3.13` ",
@@ -31,6 +39,18 @@ def run(
         Path | None,
         "If you already have a python virtual environment set up and want to use that instead of creating a new one, provide the path to the python executable in that virtual environment here. Note: Will overwrite `python_version` and `python_dependencies`. Example: `/path/to/venv/bin/python`",
     ] = None,
+    python_dependencies_lockfile: Annotated[
+        Path | None,
+        "A file with pinned requirements (e.g. from `uv pip compile`) to install instead of resolving `python_dependencies`. Example: `requirements.lock`",
+    ] = None,
+    profiles: Annotated[
+        Path | None,
+        'A json file with further python environments, which can be selected per call with the `profile` argument. Every profile gets its own pool of sandboxes. Example: `{"data": {"python_version": "3.12", "python_dependencies": ["pandas"], "worker_pool_size": 2}}`, further keys: `path_to_python`, `path_to_srt_settings`, `preload_python_dependencies`',
+    ] = None,
+    environment_cache_directory: Annotated[
+        Path | None,
+        "Where the python virtual environments are cached, so restarts with the same python version & dependencies reuse them. Can be shared by all servers on a host. If not provided, `<working_directory>/.environments` will be used.",
+    ] = None,
     working_directory: Annotated[
         Path | None,
         "The working directory to run the application in. If not provided, the current working directory will be used.",
@@ -39,6 +59,22 @@ def run(
         int,
         "The log level to use for the application. Example: `logging.INFO -> 20`",
     ] = logging.INFO,
+    log_format: Annotated[
+        LogFormat,
+        "`console` for humans, `json` for production: one json object per line, written by a background thread so logging never blocks a request.",
+    ] = "console",
+    log_max_field_length: Annotated[
+        int,
+        "Logged code & output longer than this is truncated, a hash of the full value is logged instead.",
+    ] = 1000,
+    log_sample_every: Annotated[
+        int,
+        "Only log every n-th info & debug message of the same kind, e.g. one per execution. Warnings & errors are always logged.",
+    ] = 1,
+    profile_startup: Annotated[
+        bool,
+        "Print how long the phases of the startup took, once the server is ready.",
+    ] = False,
     mcp_transport: Annotated[
         str,
         "Take a look at the FastMCP docs for options.",
@@ -63,6 +99,174 @@ def run(
         int,
         "The timeout in seconds for the execution of the python code. If the code takes longer than this to execute, it will be terminated.",
     ] = 30,
+    mcp_max_concurrent_executions: Annotated[
+        int | None,
+        "How many sandboxes are allowed to execute code at the same time. Further requests wait until a slot is free, the clients with the fewest running executions first. If not provided, the number of CPU cores will be used.",
+    ] = None,
+    mcp_max_queued_executions: Annotated[
+        int,
+        "How many requests can wait for a free slot. Further requests are rejected right away as the server is busy. Waiting counts against `mcp_code_timeout_seconds`, requests which could not finish in time anymore are rejected as well.",
+    ] = 100,
+    mcp_process_reaper_interval_seconds: Annotated[
+        int,
+        "How often processes the executed code left behind (e.g. daemons, which outlive their sandbox) are searched for & killed. Only on linux & not when the server is embedded with `code_sandbox`, then leftovers are only killed together with their sandbox.",
+    ] = 10,
+    mcp_workspace_directory: Annotated[
+        Path | None,
+        "Directory to create the scratch directories of the sandboxes in, e.g. on a tmpfs mount like `/dev/shm/mcp-run-isolated-python`. Everything in it is removed on startup! If not provided, `<working_directory>/workspaces` will be used.",
+    ] = None,
+    mcp_workspace_pool_size: Annotated[
+        int,
+        "How many empty scratch directories to create ahead of time.",
+    ] = 2,
+    mcp_worker_pool_size: Annotated[
+        int,
+        "How many sandboxes to keep started & waiting for code, so executions do not have to wait for the sandbox to start. `0` starts a new sandbox for every execution.",
+    ] = 0,
+    mcp_worker_max_runs: Annotated[
+        int,
+        "After how many executions a sandbox from the pool is replaced by a fresh one. Every execution runs in its own process forked from the sandbox, but executions in the same sandbox share its workspace directory (which is cleaned between runs). `1` gives every execution a fresh sandbox.",
+    ] = 1,
+    mcp_preload_python_dependencies: Annotated[
+        bool,
+        "Import the `python_dependencies` once when a sandbox is started, so executions do not have to import them again. Works best together with `mcp_worker_pool_size`.",
+    ] = False,
+    mcp_session_mode: Annotated[
+        bool,
+        "Give every MCP session its own persistent python interpreter, so variables, imports & files are kept between executions of the same client. Requires `--no-mcp-stateless`.",
+    ] = False,
+    mcp_session_idle_timeout_seconds: Annotated[
+        int,
+        "After how many seconds without an execution a session is stopped & its state is lost. Only used with `mcp_session_mode`.",
+    ] = 600,
+    mcp_max_sessions: Annotated[
+        int,
+        "How many sessions are kept at the same time. If the limit is reached, the least recently used session is stopped. Only used with `mcp_session_mode`.",
+    ] = 16,
+    mcp_max_stdout_bytes: Annotated[
+        int,
+        "How many bytes of stdout are returned. Longer output is truncated to its beginning & end.",
+    ] = 1024 * 1024,
+    mcp_max_stderr_bytes: Annotated[
+        int,
+        "How many bytes of stderr are returned. Longer output is truncated to its beginning & end.",
+    ] = 1024 * 1024,
+    mcp_attach_truncated_output: Annotated[
+        bool,
+        "If the output was truncated, additionally return the complete output as `stdout.txt` / `stderr.txt` files.",
+    ] = False,
+    mcp_max_return_value_bytes: Annotated[
+        int,
+        "How many bytes a value returned with `result(...)` can have. Larger values are discarded & the run fails.",
+    ] = 16 * 1024 * 1024,
+    mcp_return_last_expression: Annotated[
+        bool,
+        "Return the value of the last expression of the code, like a notebook cell does, as if it was passed to `result(...)`.",
+    ] = False,
+    mcp_output_file_store_directory: Annotated[
+        Path | None,
+        "Directory to keep large output files in. If provided, output files larger than `mcp_inline_output_file_max_bytes` are not returned inline, but as links to MCP resources, which the client can fetch if needed. If not provided, all files are returned inline. The files are kept in a subdirectory the server creates & empties on startup, nothing else in the directory is touched.",
+    ] = None,
+    mcp_inline_output_file_max_bytes: Annotated[
+        int,
+        "Output files up to this size are returned inline. Only used with `mcp_output_file_store_directory`.",
+    ] = 1024 * 1024,
+    mcp_output_file_store_max_bytes: Annotated[
+        int,
+        "How many bytes of output files are kept. If the limit is reached, the oldest files are removed. Only used with `mcp_output_file_store_directory`.",
+    ] = 1024 * 1024 * 1024,
+    mcp_output_file_store_ttl_seconds: Annotated[
+        int,
+        "After how many seconds a kept output file is removed. Only used with `mcp_output_file_store_directory`.",
+    ] = 60 * 60,
+    mcp_input_store_directory: Annotated[
+        Path | None,
+        "Enable input files: data is uploaded once with the `upload_input_file` tool (or `POST /inputs`) & made available read-only in the runs. Uploaded files are kept in this directory, addressed by their hash. Put it on the same filesystem as the workspaces: on filesystems with reflinks (btrfs, xfs, ...), files are staged without copying their content.",
+    ] = None,
+    mcp_input_store_max_bytes: Annotated[
+        int,
+        "How many bytes of input files are kept. If the limit is reached, the least recently used files are removed. Only used with `mcp_input_store_directory`.",
+    ] = 10 * 1024 * 1024 * 1024,
+    mcp_max_input_file_bytes: Annotated[
+        int,
+        "The maximum size of a single input file. Only used with `mcp_input_store_directory`.",
+    ] = 1024 * 1024 * 1024,
+    mcp_max_batch_size: Annotated[
+        int,
+        "How many code snippets can be executed with one call of the `run_python_code_batch` tool.",
+    ] = 100,
+    mcp_batch_max_concurrency: Annotated[
+        int | None,
+        "How many code snippets of one batch are executed at the same time. `mcp_max_concurrent_executions` applies as well. If not provided, the number of CPU cores will be used.",
+    ] = None,
+    mcp_preflight: Annotated[
+        bool,
+        "Check the code before executing it: syntax errors & imports of modules which are not installed (at the start of the code) fail right away, without starting a sandbox. Not with `mcp_executor_daemons`.",
+    ] = True,
+    mcp_preflight_cache_max_entries: Annotated[
+        int,
+        "How many results of the preflight check are cached.",
+    ] = 1000,
+    mcp_result_cache: Annotated[
+        bool,
+        "Cache the results of executions, so the same code is not executed again. Only use this if your code is deterministic! Timeouts & crashes are never cached, neither are executions in `mcp_session_mode`.",
+    ] = False,
+    mcp_result_cache_directory: Annotated[
+        Path | None,
+        "Directory to store the cached results in, so they survive restarts. If not provided, the results are only cached in memory.",
+    ] = None,
+    mcp_result_cache_max_entries: Annotated[
+        int,
+        "How many results are cached. If the limit is reached, the least recently used result is removed.",
+    ] = 1000,
+    mcp_result_cache_max_bytes: Annotated[
+        int,
+        "How many bytes of results (including output files) are cached. If the limit is reached, the least recently used result is removed.",
+    ] = 256 * 1024 * 1024,
+    mcp_result_cache_ttl_seconds: Annotated[
+        int,
+        "After how many seconds a cached result expires.",
+    ] = 24 * 60 * 60,
+    mcp_max_memory_bytes: Annotated[
+        int | None,
+        "Limit the memory (address space, including the python interpreter itself) of every run. Leave some room, numpy & co reserve a lot of address space upfront. Example: `1073741824 -> 1 GiB`",
+    ] = None,
+    mcp_max_cpu_seconds: Annotated[
+        int | None,
+        "Limit the cpu time of every run. Unlike `code_timeout_seconds`, time spent waiting (sleep, network, ...) does not count.",
+    ] = None,
+    mcp_max_processes: Annotated[
+        int | None,
+        "Limit the number of processes the code can start, to stop fork bombs. Note: This counts all processes of the user running the server, including the other sandboxes!",
+    ] = None,
+    mcp_max_output_directory_bytes: Annotated[
+        int | None,
+        "Limit the size of the files the code writes. Output files are discarded, if all of them together are larger.",
+    ] = None,
+    mcp_executor_daemons: Annotated[
+        list[str] | None,
+        "Execute the code on these executor daemons instead of locally, the least loaded one first. Can be given multiple times. Example: `unix:/run/executor.sock` or `sandbox-host-1:6500`",
+    ] = None,
+    mcp_executor_daemon_health_check_interval_seconds: Annotated[
+        int,
+        "How often the executor daemons are checked. Unhealthy daemons get no executions until they pass a check again.",
+    ] = 5,
+    serve_executor_daemon: Annotated[
+        str | None,
+        "Run as executor daemon on this address, instead of as MCP server. MCP servers send their executions here with `--mcp-executor-daemons`. Example: `unix:/run/executor.sock` or `0.0.0.0:6500`",
+    ] = None,
+    mcp_telemetry_file: Annotated[
+        Path | None,
+        "Append OpenTelemetry spans & metrics to this file as json lines. Needs the `telemetry` extra: `pip install mcp_run_isolated_python[telemetry]`",
+    ] = None,
+    mcp_prometheus_port: Annotated[
+        int | None,
+        "Serve the metrics for prometheus on this port, under `/metrics`. Needs the `telemetry` extra: `pip install mcp_run_isolated_python[telemetry]`",
+    ] = None,
+    mcp_telemetry_export_interval_seconds: Annotated[
+        int,
+        "How often metrics are written to `mcp_telemetry_file`.",
+    ] = 60,
 ):
     """
     Initialise the application by:
@@ -71,9 +275,17 @@ def run(
     Then, start it.
     """
 
+    # interpreter start & imports of the cli, mostly cpu bound
+    startup_profile.record("interpreter & cli imports (cpu time)", time.process_time())
+
     if python_dependencies is None:
         python_dependencies = []
-    configure_logging(log_level=log_level)
+    configure_logging(
+        log_level=log_level,
+        log_format=log_format,
+        max_field_length=log_max_field_length,
+        sample_every=log_sample_every,
+    )
     logger = get_logger(__name__)
 
     # print banner
@@ -88,22 +300,30 @@ def run(
     console = Console(force_terminal=True)
     console.print(table)
 
+    # stateless servers create a new session for every request
+    if mcp_session_mode and mcp_stateless:
+        logger.error("`mcp_session_mode` requires a stateful server. Please use `--no-mcp-stateless` and try again.")
+        return
+
     if working_directory is None:
         working_directory = Path.cwd()
     working_directory.mkdir(parents=True, exist_ok=True)
 
-    # create a virtual environment and install dependencies
+    # create a virtual environment and install dependencies, or reuse a cached one
+    environment_cache = EnvironmentCache(directory=environment_cache_directory or working_directory / ".environments")
     if path_to_python is None:
-        subprocess.run(["uv", "venv", "--python", python_version], cwd=working_directory, capture_output=True)  # noqa: S603, S607
-        if python_dependencies:
-            subprocess.run(["uv", "pip", "install", " ".join(python_dependencies)], cwd=working_directory)  # noqa: S603, S607
-
-        path_to_python = working_directory / ".venv" / "bin" / "python"
+        try:
+            path_to_python = environment_cache.get_or_create(
+                python_version=python_version, dependencies=python_dependencies, lockfile=python_dependencies_lockfile
+            )
+        except EnvironmentCacheError as e:
+            logger.error(f"Could not create the python environment: {e}")
+            return
 
     # verify that the provided python interpreter works
     else:
         p = subprocess.run([path_to_python, "--version"], cwd=working_directory, capture_output=True)  # noqa: S603
-        if p != 0:
+        if p.returncode != 0:
             logger.error(f"The provided python interpreter is not working. Please check the path and try again: {p}")
             return
 
@@ -119,6 +339,28 @@ def run(
         logger.error("The provided path to the settings file does not exist. Please check the path and try again.")
         return
 
+    interpreter_profiles = {}
+    if profiles is not None:
+        for name, profile in json.loads(profiles.read_text()).items():
+            profile_python = profile.get("path_to_python")
+            profile_dependencies = profile.get("python_dependencies", [])
+            if profile_python is None:
+                try:
+                    profile_python = environment_cache.get_or_create(
+                        python_version=profile.get("python_version", python_version), dependencies=profile_dependencies
+                    )
+                except EnvironmentCacheError as e:
+                    logger.error(f"Could not create the python environment of the profile `{name}`: {e}")
+                    return
+
+            interpreter_profiles[name] = InterpreterProfile(
+                path_to_python_interpreter=profile_python,
+                installed_python_dependencies=profile_dependencies,
+                path_to_srt_settings=profile.get("path_to_srt_settings"),
+                worker_pool_size=profile.get("worker_pool_size"),
+                preload_python_dependencies=profile.get("preload_python_dependencies"),
+            )
+
     # start the application
     settings = Settings(
         transport=mcp_transport,
@@ -129,10 +371,75 @@ def run(
         code_timeout_seconds=mcp_code_timeout_seconds,
         path_to_python_interpreter=path_to_python,
         path_to_srt_settings=path_to_srt_settings,
+        sandbox_backend=sandbox_backend,
         log_level=log_level,
+        log_format=log_format,
+        log_max_field_length=log_max_field_length,
+        log_sample_every=log_sample_every,
         installed_python_dependencies=python_dependencies,
+        profiles=interpreter_profiles,
         working_directory=working_directory,
+        max_concurrent_executions=mcp_max_concurrent_executions,
+        max_queued_executions=mcp_max_queued_executions,
+        process_reaper_interval_seconds=mcp_process_reaper_interval_seconds,
+        workspace_directory=mcp_workspace_directory,
+        workspace_pool_size=mcp_workspace_pool_size,
+        worker_pool_size=mcp_worker_pool_size,
+        worker_max_runs=mcp_worker_max_runs,
+        preload_python_dependencies=mcp_preload_python_dependencies,
+        session_mode=mcp_session_mode,
+        session_idle_timeout_seconds=mcp_session_idle_timeout_seconds,
+        max_sessions=mcp_max_sessions,
+        max_stdout_bytes=mcp_max_stdout_bytes,
+        max_stderr_bytes=mcp_max_stderr_bytes,
+        attach_truncated_output=mcp_attach_truncated_output,
+        max_return_value_bytes=mcp_max_return_value_bytes,
+        return_last_expression=mcp_return_last_expression,
+        output_file_store_directory=mcp_output_file_store_directory,
+        inline_output_file_max_bytes=mcp_inline_output_file_max_bytes,
+        output_file_store_max_bytes=mcp_output_file_store_max_bytes,
+        output_file_store_ttl_seconds=mcp_output_file_store_ttl_seconds,
+        input_store_directory=mcp_input_store_directory,
+        input_store_max_bytes=mcp_input_store_max_bytes,
+        max_input_file_bytes=mcp_max_input_file_bytes,
+        max_batch_size=mcp_max_batch_size,
+        batch_max_concurrency=mcp_batch_max_concurrency,
+        preflight=mcp_preflight,
+        preflight_cache_max_entries=mcp_preflight_cache_max_entries,
+        result_cache=mcp_result_cache,
+        result_cache_directory=mcp_result_cache_directory,
+        result_cache_max_entries=mcp_result_cache_max_entries,
+        result_cache_max_bytes=mcp_result_cache_max_bytes,
+        result_cache_ttl_seconds=mcp_result_cache_ttl_seconds,
+        max_memory_bytes=mcp_max_memory_bytes,
+        max_cpu_seconds=mcp_max_cpu_seconds,
+        max_processes=mcp_max_processes,
+        max_output_directory_bytes=mcp_max_output_directory_bytes,
+        executor_daemons=mcp_executor_daemons or [],
+        executor_daemon_health_check_interval_seconds=mcp_executor_daemon_health_check_interval_seconds,
+        profile_startup=profile_startup,
+        telemetry_file=mcp_telemetry_file,
+        prometheus_port=mcp_prometheus_port,
+        telemetry_export_interval_seconds=mcp_telemetry_export_interval_seconds,
     )
+    with startup_profile.phase("telemetry"):
+        configure_telemetry(
+            telemetry_file=settings.telemetry_file,
+            prometheus_host=settings.host,
+            prometheus_port=settings.prometheus_port,
+            export_interval_seconds=settings.telemetry_export_interval_seconds,
+        )
+
+    if serve_executor_daemon is not None:
+        from mcp_run_isolated_python.executor_daemon import run_executor_daemon
+
+        run_executor_daemon(settings=settings, address=serve_executor_daemon)
+        return
+
+    # fastmcp is the slowest import by far, it is only needed from here on
+    with startup_profile.phase("import mcp server (fastmcp)"):
+        from mcp_run_isolated_python.mcp_server import run_mcp
+
     run_mcp(settings=settings)
 
 
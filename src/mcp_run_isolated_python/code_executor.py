@@ -1,107 +1,874 @@
+import asyncio
+import base64
+import contextlib
+import mimetypes
 import os
-import shutil
-import subprocess  # noqa: S404
+import stat
 import sys
-import uuid
-from typing import Annotated, Literal
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Annotated, Any, BinaryIO, Literal, Protocol
 
 from fastmcp import Context
 from fastmcp.utilities.types import Audio, File, Image
-from filetype import guess
-from filetype.types import AUDIO, IMAGE
-from pydantic import BaseModel, PrivateAttr
+from mcp.types import BlobResourceContents, EmbeddedResource, ResourceLink, TextResourceContents
+from opentelemetry import trace
+from opentelemetry.trace import StatusCode
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr
 
+from mcp_run_isolated_python.bwrap import BwrapError
+from mcp_run_isolated_python.file_store import FileStore, StoredFile
+from mcp_run_isolated_python.input_store import InputStore, InputStoreError
+from mcp_run_isolated_python.output_capture import Stream
+from mcp_run_isolated_python.output_streamer import OutputStreamer
+from mcp_run_isolated_python.preflight import Preflight
+from mcp_run_isolated_python.result_cache import ResultCache
+from mcp_run_isolated_python.sandbox_worker import RETURN_VALUE_FORMATS, RETURN_VALUE_NAME
+from mcp_run_isolated_python.scheduler import QueueTimeoutError, Scheduler, SchedulerBusyError
+from mcp_run_isolated_python.sessions import SessionManager
 from mcp_run_isolated_python.utils.logger import get_logger
-from mcp_run_isolated_python.utils.settings import Settings
+from mcp_run_isolated_python.utils.otel import (
+    execution_duration_histogram,
+    executions_counter,
+    output_size_histogram,
+    tracer,
+)
+from mcp_run_isolated_python.utils.processes import process_reaper
+from mcp_run_isolated_python.utils.settings import DEFAULT_PROFILE, Settings
+from mcp_run_isolated_python.utils.startup import startup_profile
+from mcp_run_isolated_python.worker_pool import (
+    LimitExceeded,
+    SandboxWorker,
+    SandboxWorkerError,
+    WorkerPool,
+    WorkerRunResult,
+    sandbox_command,
+)
+from mcp_run_isolated_python.workspaces import WorkspaceManager
 
 logger = get_logger(__name__)
 
+# enough to guess the type of all formats known to `filetype`
+SNIFF_BYTES = 8192
+
+ReturnValueFormat = Literal["json", "npy", "arrow"]
+RETURN_VALUE_MIME_TYPES: dict[ReturnValueFormat, str] = {
+    "json": "application/json",
+    "npy": "application/x-npy",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def _open_output_directory(worker: SandboxWorker) -> int | None:
+    # the sandboxed code could have replaced it by a symlink to anywhere on the host
+    try:
+        return os.open(worker.output_path, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW)
+    except OSError:
+        return None
+
+
+def _open_regular_file(path: Path | str, dir_fd: int | None = None) -> BinaryIO | None:
+    """
+    Open a file written by the sandboxed code, if it is a regular one. Symlinks are never followed, they could point to
+    any file the server can read. Fifos, devices & co. are skipped as well.
+    """
+
+    try:
+        if not stat.S_ISREG(os.lstat(path, dir_fd=dir_fd).st_mode):
+            return None
+        fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK, dir_fd=dir_fd)
+    except OSError:
+        return None
+    # it could have been replaced in between
+    if not stat.S_ISREG(os.fstat(fd).st_mode):
+        os.close(fd)
+        return None
+    return os.fdopen(fd, "rb")
+
 
 class CodeExecutionResult(BaseModel):
     status: Literal["success", "failure"]
     output: str
     error: str | None = None
+    # the resource limit which stopped the code, e.g. to tell running out of memory from a timeout
+    limit_exceeded: LimitExceeded | None = None
+    # if the code returned a value with `result(...)`, it directly follows this result
+    return_value_format: ReturnValueFormat | None = None
+
+
+class BatchItemResult(CodeExecutionResult):
+    # position of the code snippet in the batch
+    index: int
+
+
+class OutputFile(BaseModel):
+    # bytes are base64 encoded, when cached as json
+    model_config = ConfigDict(ser_json_bytes="base64", val_json_bytes="base64")
+
+    kind: Literal["file", "image", "audio", "resource"]
+    name: str
+    format: str | None = None
+    data: bytes = b""
+    # only for files in the file store, which the client fetches as resource
+    stored_file: StoredFile | None = None
+
+    def to_mcp(self) -> File | Image | Audio | ResourceLink:
+        if self.stored_file is not None:
+            return ResourceLink(
+                type="resource_link",
+                uri=self.stored_file.uri,
+                name=self.stored_file.name,
+                mime_type=self.stored_file.mime_type,
+                size=self.stored_file.size,
+            )
+        if self.kind == "image":
+            return Image(data=self.data, format=self.format)
+        if self.kind == "audio":
+            return Audio(data=self.data, format=self.format)
+        return File(data=self.data, name=self.name, format=self.format)
+
+
+class ReturnValue(BaseModel):
+    # bytes are base64 encoded, when cached as json
+    model_config = ConfigDict(ser_json_bytes="base64", val_json_bytes="base64")
+
+    format: ReturnValueFormat
+    data: bytes
+
+    def to_mcp(self) -> EmbeddedResource:
+        uri = f"file:///{RETURN_VALUE_NAME.lstrip('.')}.{self.format}"
+        mime_type = RETURN_VALUE_MIME_TYPES[self.format]
+        if self.format == "json":
+            resource = TextResourceContents(uri=uri, mime_type=mime_type, text=self.data.decode())
+        else:
+            resource = BlobResourceContents(uri=uri, mime_type=mime_type, blob=base64.b64encode(self.data).decode())
+        return EmbeddedResource(type="resource", resource=resource)
+
+
+class ExecutionOutcome(BaseModel):
+    result: CodeExecutionResult
+    return_value: ReturnValue | None = None
+    files: list[OutputFile] = Field(default_factory=list)
+    # whether running the same code again is expected to give the same result
+    cacheable: bool = Field(False, exclude=True)
+
+    def to_responses(self) -> list[CodeExecutionResult | EmbeddedResource | File | Image | Audio | ResourceLink]:
+        # first item is the code execution result, followed by the returned value & the files
+        return [self.result, *self.extra_responses()]
+
+    def extra_responses(self) -> list[EmbeddedResource | File | Image | Audio | ResourceLink]:
+        responses: list[EmbeddedResource | File | Image | Audio | ResourceLink] = []
+        if self.return_value is not None:
+            responses.append(self.return_value.to_mcp())
+        responses.extend(file.to_mcp() for file in self.files)
+        return responses
+
+
+OnOutput = Callable[[Stream, bytes], Awaitable[None]]
+
+
+class ExecutorBackend(Protocol):
+    """
+    Where the code is executed: in local sandboxes (`CodeExecutor` itself) or on executor daemons (`Dispatcher`).
+    """
+
+    @property
+    def ready(self) -> bool: ...
+
+    @property
+    def max_concurrent_executions(self) -> int: ...
+
+    async def start(self): ...
+
+    async def stop(self): ...
+
+    async def execute(
+        self,
+        python_code: str,
+        session_id: str | None = None,
+        on_output: OnOutput | None = None,
+        input_files: dict[str, str] | None = None,
+        timeout: float | None = None,
+        imports: frozenset[str] = frozenset(),
+        profile: str = DEFAULT_PROFILE,
+    ) -> ExecutionOutcome:
+        """
+        Execute the code, without the result cache. `on_output` is called with the output while the code is running.
+        `input_files`: name -> id of an uploaded input file, staged into `./input`.
+        `timeout`: what is left of `settings.code_timeout_seconds`, including the time until a sandbox is free.
+        `imports`: the modules the code imports, a sandbox which has them loaded already is preferred.
+        `profile`: the interpreter profile of the sandbox, one of `settings.profile_names`.
+        """
+        ...
 
 
 class CodeExecutor(BaseModel):
+    """
+    The MCP tools. The code is executed by the backend: in local sandboxes by default, or on the executor daemons in
+    `settings.executor_daemons`.
+    """
+
     settings: Settings
 
     _pre_check_succeeded: bool | None = PrivateAttr(None)
+    _pre_check_lock: asyncio.Lock = PrivateAttr(default_factory=asyncio.Lock)
+    _semaphore: asyncio.Semaphore | None = PrivateAttr(None)
+    _ready: bool = PrivateAttr(False)
+    _start_task: asyncio.Task | None = PrivateAttr(None)
+    _workspaces: WorkspaceManager = PrivateAttr()
+    # every interpreter profile has its own warm workers, sessions & checks
+    _worker_pools: dict[str, WorkerPool] = PrivateAttr(default_factory=dict)
+    _session_managers: dict[str, SessionManager] = PrivateAttr(default_factory=dict)
+    _preflights: dict[str, Preflight] = PrivateAttr(default_factory=dict)
+    _result_cache: ResultCache | None = PrivateAttr(None)
+    _file_store: FileStore | None = PrivateAttr(None)
+    _input_store: InputStore | None = PrivateAttr(None)
+    _backend: ExecutorBackend | None = PrivateAttr(None)
+    _scheduler: Scheduler = PrivateAttr()
+    _active_executions: int = PrivateAttr(0)
+    _reaping: bool = PrivateAttr(False)
 
-    def run_python_code(
-        self,
-        python_code: Annotated[str, "The python code to execute"],
-        ctx: Context,
-    ) -> list[CodeExecutionResult | File | Image | Audio]:
-        if self._pre_check_succeeded is None:
-            logger.info("First run: Running pre-check to verify SRT CLI tool is available and working...")
+    def model_post_init(self, context: Any, /):
+        self._scheduler = Scheduler(settings=self.settings, capacity=lambda: self.backend.max_concurrent_executions)
+        if self.settings.executor_daemons:
+            # imported here, the dispatcher uses the models of this module
+            from mcp_run_isolated_python.dispatcher import Dispatcher
+
+            self._backend = Dispatcher(settings=self.settings, on_capacity_changed=self._scheduler.capacity_changed)
+        self._workspaces = WorkspaceManager(settings=self.settings)
+        for profile in self.settings.profile_names:
+            settings = self.settings.for_profile(profile)
+            self._worker_pools[profile] = WorkerPool(settings=settings, workspaces=self._workspaces)
+            self._session_managers[profile] = SessionManager(settings=settings, workspaces=self._workspaces)
+            # the executor daemons might use another interpreter than the one the server knows
+            if self.settings.preflight and self._backend is None:
+                self._preflights[profile] = Preflight(settings=settings)
+        if self.settings.result_cache:
+            self._result_cache = ResultCache(settings=self.settings)
+        if self.settings.output_file_store_directory is not None:
+            self._file_store = FileStore(settings=self.settings)
+        if self.settings.input_store_directory is not None:
+            self._input_store = InputStore(settings=self.settings)
+
+    @property
+    def file_store(self) -> FileStore | None:
+        return self._file_store
+
+    @property
+    def input_store(self) -> InputStore | None:
+        return self._input_store
+
+    @property
+    def backend(self) -> ExecutorBackend:
+        return self._backend or self
+
+    @property
+    def max_concurrent_executions(self) -> int:
+        return self.settings.max_concurrent_executions
+
+    @property
+    def ready(self) -> bool:
+        if self._backend is not None:
+            return self._ready and self._backend.ready
+        return self._ready
+
+    async def start(self):
+        """
+        Verify the sandbox is working, start the warm sandbox workers & run a warm-up execution.
+        """
+
+        if self._backend is not None:
+            await self._start_shared()
+            with startup_profile.phase("executor daemons"):
+                await self._backend.start()
+            self._ready = True
+            logger.info("Ready to execute code on the executor daemons")
+            return
+
+        with startup_profile.phase("sandbox pre-check"):
+            await self._run_pre_check()
+        with startup_profile.phase("workspaces"):
+            await self._workspaces.start()
+        if not self._reaping:
+            self._reaping = True
+            await process_reaper.start(self.settings.process_reaper_interval_seconds)
+        with startup_profile.phase("worker pool"):
+            for worker_pool in self._worker_pools.values():
+                await worker_pool.start()
+        if self._preflights:
+            with startup_profile.phase("preflight"):
+                await asyncio.gather(*(preflight.start() for preflight in self._preflights.values()))
+        await self._start_shared()
+        if self.settings.session_mode:
+            for session_manager in self._session_managers.values():
+                await session_manager.start()
+        with startup_profile.phase("warm-up execution"):
+            await asyncio.gather(*(self._warm_up(profile) for profile in self.settings.profile_names))
+
+        self._ready = True
+        logger.info("Ready to execute code")
+
+    async def _start_shared(self):
+        # used by all backends
+        if self._result_cache is not None:
+            with startup_profile.phase("result cache"):
+                await self._result_cache.start()
+        if self._file_store is not None:
+            with startup_profile.phase("file store"):
+                await self._file_store.start()
+        if self._input_store is not None:
+            with startup_profile.phase("input store"):
+                await self._input_store.start()
+
+    def start_in_background(self) -> asyncio.Task:
+        """
+        Start without blocking the server. Executions wait until the start finished, `ready` tells if it did.
+        """
+
+        self._start_task = asyncio.create_task(self.start())
+        return self._start_task
+
+    async def _warm_up(self, profile: str):
+        # the first execution has to load the sandbox & the interpreter from disk - better before the first request
+        try:
+            async with self._worker(session_id=None, profile=profile) as worker:
+                result = await worker.run("pass", timeout=self.settings.code_timeout_seconds)
+        except SandboxWorkerError as e:
+            logger.warning("Warm-up execution failed", profile=profile, error=str(e))
+            return
+
+        if result.returncode != 0:
+            logger.warning(
+                "Warm-up execution failed",
+                profile=profile,
+                returncode=result.returncode,
+                stderr=result.stderr.decode(),
+            )
+
+    async def stop(self):
+        self._ready = False
+        if self._backend is not None:
+            await self._backend.stop()
+        for worker_pool in self._worker_pools.values():
+            await worker_pool.stop()
+        for session_manager in self._session_managers.values():
+            await session_manager.stop()
+        await self._workspaces.stop()
+        if self._reaping:
+            self._reaping = False
+            await process_reaper.stop()
+
+    async def _run_pre_check(self):
+        async with self._pre_check_lock:
+            if self._pre_check_succeeded is not None:
+                return
+
+            backend = self.settings.sandbox_backend
+            logger.info(f"First run: Running pre-check to verify the {backend} sandbox is available and working...")
 
             # check that it actually works (all deps installed)
-            p = subprocess.run(("srt", "python -c '1+1'"), capture_output=True)
+            try:
+                p = await asyncio.create_subprocess_exec(
+                    *sandbox_command(self.settings, "python -c '1+1'"),
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+                _, stderr = await p.communicate()
+                error = stderr.decode() if p.returncode != 0 else None
+            except (OSError, BwrapError) as e:
+                error = str(e)
 
             # only run this once
-            self._pre_check_succeeded = p.returncode == 0
+            self._pre_check_succeeded = error is None
             if self._pre_check_succeeded:
-                logger.info("Pre-check for SRT CLI tool succeeded!")
+                logger.info(f"Pre-check for the {backend} sandbox succeeded!")
             else:
-                logger.error("Pre-check for SRT CLI tool failed", return_code=p.returncode, stderr=p.stderr.decode())
+                logger.error(f"Pre-check for the {backend} sandbox failed", error=error)
                 sys.exit(1)
 
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # created lazily, so the semaphore is bound to the loop the server is running in
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.settings.max_concurrent_executions)
+        return self._semaphore
+
+    async def run_python_code(
+        self,
+        python_code: Annotated[str, "The python code to execute"],
+        ctx: Context,
+        input_files: Annotated[
+            dict[str, str] | None,
+            "Uploaded input files to make available read-only as `./input/<name>`: name -> `input_id` of `upload_input_file`",
+        ] = None,
+        profile: Annotated[
+            str | None,
+            "The interpreter profile to execute the code with, see the tool description. If not provided, the default one is used",
+        ] = None,
+    ) -> list[CodeExecutionResult | EmbeddedResource | File | Image | Audio | ResourceLink]:
+        await self._ensure_pre_check_succeeded()
+        profile = self._check_profile(profile)
+
+        # in session mode, every MCP session keeps its own interpreter
+        session_id = ctx.session_id if self.settings.session_mode else None
+
+        outcome = await self._run(
+            python_code=python_code, ctx=ctx, session_id=session_id, input_files=input_files, profile=profile
+        )
+        return outcome.to_responses()
+
+    async def run_python_code_batch(
+        self,
+        python_codes: Annotated[list[str], "The python code snippets to execute, independent of each other"],
+        ctx: Context,
+        input_files: Annotated[
+            dict[str, str] | None,
+            "Uploaded input files to make available read-only as `./input/<name>`: name -> `input_id` of `upload_input_file`",
+        ] = None,
+        profile: Annotated[
+            str | None,
+            "The interpreter profile to execute the code with, see the tool description. If not provided, the default one is used",
+        ] = None,
+    ) -> list[BatchItemResult | EmbeddedResource | File | Image | Audio | ResourceLink]:
+        await self._ensure_pre_check_succeeded()
+        profile = self._check_profile(profile)
+
+        if len(python_codes) > self.settings.max_batch_size:
+            raise ValueError(f"Too many code snippets: {len(python_codes)} (max: {self.settings.max_batch_size})")
+
+        # every snippet has its own timeout, so a slow snippet does not hold up the others
+        semaphore = asyncio.Semaphore(self.settings.batch_max_concurrency)
+
+        async def run_item(index: int, python_code: str) -> ExecutionOutcome:
+            async with semaphore:
+                return await self._run(
+                    python_code=python_code, ctx=ctx, item=index, input_files=input_files, profile=profile
+                )
+
+        outcomes = await asyncio.gather(*(run_item(index, code) for index, code in enumerate(python_codes)))
+
+        # in input order, the returned value & the files of an item follow its result
+        responses: list[BatchItemResult | EmbeddedResource | File | Image | Audio | ResourceLink] = []
+        for index, outcome in enumerate(outcomes):
+            responses.append(BatchItemResult(index=index, **outcome.result.model_dump()))
+            responses.extend(outcome.extra_responses())
+        return responses
+
+    def _check_profile(self, profile: str | None) -> str:
+        profile = profile or DEFAULT_PROFILE
+        if profile not in self.settings.profile_names:
+            raise ValueError(f"Unknown profile `{profile}`, available: {', '.join(self.settings.profile_names)}")
+        return profile
+
+    async def wait_until_started(self):
+        if self._start_task is not None and not self._start_task.done():
+            await asyncio.shield(self._start_task)
+
+    async def _ensure_pre_check_succeeded(self):
+        await self.wait_until_started()
+
+        # the daemons run their own pre-check
+        if self._backend is not None:
+            return
+
+        if self._pre_check_succeeded is None:
+            await self._run_pre_check()
+
         if not self._pre_check_succeeded:
+            if self.settings.sandbox_backend == "bwrap":
+                raise RuntimeError(
+                    "Pre-check for the bwrap sandbox failed. Please install it: `apt-get install bubblewrap` & ensure it is working correctly"
+                )
             raise RuntimeError(
                 "Pre-check for SRT CLI tool failed. Please install it: `npm install -g @anthropic-ai/sandbox-runtime` & ensure it is working correctly"
             )
 
-        # create a temp working dir for the code to have write perms in
-        code_path = self.settings.working_directory / uuid.uuid4().hex
-        (code_path / "output").mkdir(parents=True)
+    async def _run(
+        self,
+        python_code: str,
+        ctx: Context,
+        session_id: str | None = None,
+        item: int | None = None,
+        input_files: dict[str, str] | None = None,
+        profile: str = DEFAULT_PROFILE,
+    ) -> ExecutionOutcome:
+        with tracer.start_as_current_span("run_python_code") as span:
+            span.set_attribute("session", session_id is not None)
+            span.set_attribute("profile", profile)
+            # results of sessions depend on the earlier calls, so they can not be cached
+            cache_key = None
+            if self._result_cache is not None and session_id is None:
+                cache_key = self._result_cache.key(python_code, input_files=input_files, profile=profile)
+                cached = await self._result_cache.get(cache_key)
+                if cached is not None:
+                    logger.info("Returning cached result", key=cache_key)
+                    executions_counter.add(1, {"result": "cached", "profile": profile})
+                    return ExecutionOutcome.model_validate_json(cached)
 
-        # write the code to a temp file
-        code_file_path = code_path / "code.py"
-        with code_file_path.open("w") as file:
-            file.write(python_code)
+            # syntax errors & missing modules fail without starting a sandbox
+            imports: frozenset[str] = frozenset()
+            preflight = self._preflights.get(profile)
+            if preflight is not None:
+                checked = await preflight.check(python_code, check_imports=session_id is None)
+                if checked.error is not None:
+                    logger.info("Code failed the preflight check", error=checked.error)
+                    executions_counter.add(1, {"result": "failure", "profile": profile})
+                    return ExecutionOutcome(
+                        result=CodeExecutionResult(status="failure", output="", error=checked.error)
+                    )
+                imports = checked.imports
 
-        # run the code
-        logger.info("Running python code...", code=python_code, settings=self.settings.model_dump())
-        try:
-            cmd = f""""{self.settings.path_to_python_interpreter}" "{code_file_path}" """
-            p = subprocess.run(  # noqa: S603
-                ("srt", "--settings", self.settings.path_to_srt_settings, cmd),
-                cwd=code_path,
-                capture_output=True,
-                timeout=self.settings.code_timeout_seconds,
-                # limit the env vars, just need path
-                env={"PATH": os.environ.get("PATH", "")},
+            # the client already sees the output while the code is running
+            streamer = OutputStreamer(
+                ctx=ctx,
+                max_bytes={"stdout": self.settings.max_stdout_bytes, "stderr": self.settings.max_stderr_bytes},
+                item=item,
             )
-            logger.info(
-                "Command executed", cmd=cmd, stdout=p.stdout.decode(), stderr=p.stderr.decode(), returncode=p.returncode
+            # executions are shared fairly between the clients, sessions count as clients if they send no id
+            client = str(ctx.client_id or ctx.session_id)
+            try:
+                async with self._scheduler.slot(client) as deadline:
+                    outcome = await self.backend.execute(
+                        python_code,
+                        session_id=session_id,
+                        on_output=streamer.feed,
+                        input_files=input_files,
+                        timeout=deadline - time.monotonic(),
+                        imports=imports,
+                        profile=profile,
+                    )
+            except SchedulerBusyError as e:
+                executions_counter.add(1, {"result": "rejected", "profile": profile})
+                return ExecutionOutcome(result=CodeExecutionResult(status="failure", output="", error=str(e)))
+            except QueueTimeoutError as e:
+                executions_counter.add(1, {"result": "timeout", "profile": profile})
+                return ExecutionOutcome(
+                    result=CodeExecutionResult(status="failure", output="", error=str(e), limit_exceeded="timeout")
+                )
+            await streamer.flush()
+
+            if self._result_cache is not None and cache_key is not None and outcome.cacheable:
+                await self._result_cache.put(cache_key, outcome.model_dump_json().encode())
+
+            return outcome
+
+    async def execute(
+        self,
+        python_code: str,
+        session_id: str | None = None,
+        on_output: OnOutput | None = None,
+        input_files: dict[str, str] | None = None,
+        timeout: float | None = None,
+        imports: frozenset[str] = frozenset(),
+        profile: str = DEFAULT_PROFILE,
+    ) -> ExecutionOutcome:
+        """
+        Execute the code in a local sandbox, without the result cache.
+        """
+
+        if input_files and self._input_store is None:
+            return ExecutionOutcome(
+                result=CodeExecutionResult(
+                    status="failure", output="", error="Input files are not enabled on this server"
+                )
+            )
+
+        self._active_executions += 1
+        try:
+            return await self._execute_in_sandbox(
+                python_code,
+                session_id=session_id,
+                on_output=on_output,
+                input_files=input_files,
+                timeout=timeout,
+                imports=imports,
+                profile=profile,
             )
         finally:
-            responses = [
-                CodeExecutionResult(
-                    status="success" if p.returncode == 0 else "failure",
-                    output=p.stdout.decode().strip(),
-                    error=p.stderr.decode().strip() if p.stderr else None,
+            self._active_executions -= 1
+
+    @property
+    def active_executions(self) -> int:
+        # running & queued, the load reported to the dispatcher
+        return self._active_executions
+
+    async def _execute_in_sandbox(
+        self,
+        python_code: str,
+        session_id: str | None,
+        on_output: OnOutput | None,
+        input_files: dict[str, str] | None,
+        timeout: float | None,
+        imports: frozenset[str],
+        profile: str,
+    ) -> ExecutionOutcome:
+        if timeout is None:
+            timeout = self.settings.code_timeout_seconds
+
+        # only allow a limited amount of sandboxes to run at the same time, waiting counts against the timeout. Behind the
+        # scheduler (its span is `queue_wait`) this only waits on executor daemons, which have no scheduler
+        semaphore = self._get_semaphore()
+        queued_at = time.monotonic()
+        with tracer.start_as_current_span("sandbox_slot_wait"):
+            await semaphore.acquire()
+        timeout -= time.monotonic() - queued_at
+
+        try:
+            async with self._worker(session_id, imports=imports, profile=profile) as worker:
+                if input_files and self._input_store is not None:
+                    await asyncio.to_thread(self._input_store.stage, input_files, worker.workspace)
+                return await self._execute(
+                    python_code=python_code, worker=worker, on_output=on_output, timeout=timeout, profile=profile
                 )
-            ]
+        except InputStoreError as e:
+            return ExecutionOutcome(result=CodeExecutionResult(status="failure", output="", error=str(e)))
+        except SandboxWorkerError as e:
+            logger.error("Could not start a sandbox worker", error=str(e))
+            executions_counter.add(1, {"result": "error", "profile": profile})
+            trace.get_current_span().set_status(StatusCode.ERROR, str(e))
+            return ExecutionOutcome(result=CodeExecutionResult(status="failure", output="", error=str(e)))
+        finally:
+            semaphore.release()
+
+    @asynccontextmanager
+    async def _worker(
+        self, session_id: str | None, imports: frozenset[str] = frozenset(), profile: str = DEFAULT_PROFILE
+    ) -> AsyncIterator[SandboxWorker]:
+        if session_id is not None:
+            async with self._session_managers[profile].worker(session_id) as worker:
+                yield worker
+            return
+
+        worker_pool = self._worker_pools[profile]
+        with tracer.start_as_current_span("acquire_worker"):
+            worker = await worker_pool.acquire(modules=imports)
+        try:
+            yield worker
+        finally:
+            # removes all files, or recycles the worker
+            with tracer.start_as_current_span("release_worker"):
+                await worker_pool.release(worker)
+
+    async def _execute(
+        self,
+        python_code: str,
+        worker: SandboxWorker,
+        timeout: float,
+        on_output: OnOutput | None = None,
+        profile: str = DEFAULT_PROFILE,
+    ) -> ExecutionOutcome:
+        # the settings are logged on startup, the code is truncated by the logger
+        logger.info("Running python code...", code=python_code)
+
+        started_at = time.perf_counter()
+        with tracer.start_as_current_span("execute"):
+            result = await worker.run(python_code, timeout=max(timeout, 0), on_output=on_output)
+        self._record_metrics(result, duration=time.perf_counter() - started_at, profile=profile)
+
+        try:
+            with tracer.start_as_current_span("collect_output"):
+                return await self._build_outcome(result, worker)
+        finally:
+            for spill_path in (result.stdout_spill_path, result.stderr_spill_path):
+                if spill_path is not None:
+                    spill_path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _record_metrics(result: WorkerRunResult, duration: float, profile: str = DEFAULT_PROFILE):
+        if result.timed_out:
+            outcome = "timeout"
+        elif result.crashed:
+            outcome = "crash"
+        else:
+            outcome = "success" if result.returncode == 0 else "failure"
+
+        attributes = {"result": outcome, "profile": profile}
+        if result.limit_exceeded is not None:
+            attributes["limit_exceeded"] = result.limit_exceeded
+        executions_counter.add(1, attributes)
+        execution_duration_histogram.record(duration, {"result": outcome, "profile": profile})
+        output_size_histogram.record(result.stdout_bytes, {"stream": "stdout", "profile": profile})
+        output_size_histogram.record(result.stderr_bytes, {"stream": "stderr", "profile": profile})
+
+    async def _build_outcome(self, result: WorkerRunResult, worker: SandboxWorker) -> ExecutionOutcome:
+        stdout = result.stdout.decode(errors="replace").strip()
+        stderr = result.stderr.decode(errors="replace").strip()
+        limit_exceeded = result.limit_exceeded
+
+        # the limit of a single file is enforced by the sandbox, the limit of all of them here
+        output_size = await asyncio.to_thread(self._output_directory_size, worker)
+        max_output_size = self.settings.max_output_directory_bytes
+        if limit_exceeded is None and max_output_size is not None and output_size > max_output_size:
+            limit_exceeded = "output_size"
+
+        return_value, return_value_too_large = await asyncio.to_thread(self._take_return_value, worker)
+        if limit_exceeded is None and return_value_too_large:
+            limit_exceeded = "return_value_size"
+        # only the values of successful runs are returned
+        if limit_exceeded is not None or result.returncode != 0:
+            return_value = None
+
+        if limit_exceeded is not None:
+            stderr = f"{stderr}\n{self._limit_message(limit_exceeded)}".strip()
+
+        logger.info(
+            "Code executed",
+            stdout=stdout,
+            stderr=stderr,
+            returncode=result.returncode,
+            timed_out=result.timed_out,
+            crashed=result.crashed,
+            limit_exceeded=limit_exceeded,
+        )
+        outcome = ExecutionOutcome(
+            result=CodeExecutionResult(
+                status="success" if result.returncode == 0 and limit_exceeded is None else "failure",
+                output=stdout,
+                error=stderr or None,
+                limit_exceeded=limit_exceeded,
+                return_value_format=return_value.format if return_value is not None else None,
+            ),
+            return_value=return_value,
+            # timeouts, crashes & exceeded limits might not happen again, e.g. with other limits or less load
+            cacheable=not result.timed_out and not result.crashed and limit_exceeded is None,
+        )
+
+        # the complete output, if it was too long to be returned
+        for name, spill_path in (("stdout.txt", result.stdout_spill_path), ("stderr.txt", result.stderr_spill_path)):
+            if spill_path is not None:
+                outcome.files.append(await asyncio.to_thread(self._spill_file, spill_path, name=name))
+
+        # return output files
+        if limit_exceeded != "output_size":
+            outcome.files.extend(await asyncio.to_thread(self._collect_files, worker))
+
+        # stored files are removed after a while, so the result can not be reused
+        if any(file.stored_file is not None for file in outcome.files):
+            outcome.cacheable = False
 
-            # return output files
-            for file in (code_path / "output").iterdir():
-                type_guess = guess(file)
+        return outcome
 
-                # is image?
-                if type_guess in IMAGE:
-                    responses.append(Image(path=file))
+    def _limit_message(self, limit_exceeded: LimitExceeded) -> str:
+        messages: dict[LimitExceeded, str] = {
+            "timeout": f"TimeoutError: The code took longer than {self.settings.code_timeout_seconds} seconds to execute and was terminated",
+            "memory": f"MemoryError: The code exceeded the memory limit of {self.settings.max_memory_bytes} bytes",
+            "cpu_time": f"ResourceError: The code used more than {self.settings.max_cpu_seconds} seconds of cpu time and was terminated",
+            "processes": f"ResourceError: The code exceeded the limit of {self.settings.max_processes} processes",
+            "output_size": f"ResourceError: The output files exceeded the limit of {self.settings.max_output_directory_bytes} bytes and were discarded",
+            "return_value_size": f"ResourceError: The returned value exceeded the limit of {self.settings.max_return_value_bytes} bytes and was discarded",
+        }
+        return messages[limit_exceeded]
 
-                # is audio?
-                elif type_guess in AUDIO:
-                    responses.append(Audio(path=file))
+    def _take_return_value(self, worker: SandboxWorker) -> tuple[ReturnValue | None, bool]:
+        """
+        The value the code returned & whether it was too large to be returned.
+        """
 
-                # okay no idea what - normal file it its
+        return_value, too_large = None, False
+        for return_value_format in RETURN_VALUE_FORMATS:
+            path = worker.workspace / f"{RETURN_VALUE_NAME}.{return_value_format}"
+            file = _open_regular_file(path)
+            if file is not None:
+                # too large values are never read completely
+                with file:
+                    data = file.read(self.settings.max_return_value_bytes + 1)
+                if len(data) > self.settings.max_return_value_bytes:
+                    too_large = True
                 else:
-                    responses.append(File(path=file))
+                    return_value = ReturnValue(format=return_value_format, data=data)
+            # sessions keep their workspace, the value must not be returned by the next call again. symlinks & the like
+            # are removed as well
+            with contextlib.suppress(FileNotFoundError, IsADirectoryError):
+                path.unlink()
+        return return_value, too_large
 
-            # remove temp directory & all files
-            shutil.rmtree(code_path)
+    @staticmethod
+    def _output_directory_size(worker: SandboxWorker) -> int:
+        dir_fd = _open_output_directory(worker)
+        if dir_fd is None:
+            return 0
+        try:
+            size = 0
+            # symlinks are neither followed nor counted
+            for _, _, names, fd in os.fwalk(dir_fd=dir_fd):
+                for name in names:
+                    with contextlib.suppress(FileNotFoundError):
+                        file_stat = os.stat(name, dir_fd=fd, follow_symlinks=False)
+                        if stat.S_ISREG(file_stat.st_mode):
+                            size += file_stat.st_size
+            return size
+        finally:
+            os.close(dir_fd)
 
-        return responses
+    def _spill_file(self, path: Path, name: str) -> OutputFile:
+        with path.open("rb") as file:
+            return self._output_file(file, name=name, kind="file", file_format="txt", mime_type="text/plain")
+
+    def _collect_files(self, worker: SandboxWorker) -> list[OutputFile]:
+        # only needed if the code wrote files
+        from filetype import guess
+        from filetype.types import AUDIO, IMAGE
+
+        # the files are read now, because the workspace is cleaned up before the response is sent
+        files: list[OutputFile] = []
+        dir_fd = _open_output_directory(worker)
+        if dir_fd is None:
+            return files
+
+        try:
+            for name in sorted(os.listdir(dir_fd)):  # noqa: PTH208
+                file = _open_regular_file(name, dir_fd=dir_fd)
+                if file is None:
+                    continue
+
+                with file:
+                    # the type is guessed from the first bytes, large files are never read completely
+                    type_guess = guess(file.read(SNIFF_BYTES))
+                    file.seek(0)
+
+                    # is image?
+                    if type_guess in IMAGE:
+                        files.append(self._output_file(file, name=name, kind="image", mime_type=type_guess.mime))
+
+                    # is audio?
+                    elif type_guess in AUDIO:
+                        files.append(self._output_file(file, name=name, kind="audio", mime_type=type_guess.mime))
+
+                    # okay no idea what - normal file it its
+                    else:
+                        mime_type = type_guess.mime if type_guess else mimetypes.guess_type(name)[0]
+                        files.append(
+                            self._output_file(
+                                file,
+                                name=name,
+                                kind="file",
+                                file_format=Path(name).suffix.lstrip(".") or None,
+                                mime_type=mime_type or "application/octet-stream",
+                            )
+                        )
+        finally:
+            os.close(dir_fd)
+
+        return files
+
+    def _output_file(
+        self,
+        file: BinaryIO,
+        name: str,
+        kind: Literal["file", "image", "audio"],
+        mime_type: str,
+        file_format: str | None = None,
+    ) -> OutputFile:
+        if kind != "file":
+            file_format = mime_type.split("/")[1]
+
+        # large files are kept on the server, the client fetches them if needed
+        if (
+            self._file_store is not None
+            and os.fstat(file.fileno()).st_size > self.settings.inline_output_file_max_bytes
+        ):
+            stored_file = self._file_store.store(file, name=name, mime_type=mime_type)
+            return OutputFile(kind="resource", name=name, format=file_format, stored_file=stored_file)
+
+        return OutputFile(kind=kind, name=name, format=file_format, data=file.read())
@@ -1,44 +1,200 @@
+import asyncio
+import base64
+import io
 import json
 from contextlib import asynccontextmanager
-from typing import AsyncIterator
+from pathlib import PurePosixPath
+from typing import Any, AsyncIterator
+from urllib.parse import urlparse
 
 from fastmcp import Client
-from pydantic import BaseModel
+from mcp.types import (
+    AudioContent,
+    BlobResourceContents,
+    ContentBlock,
+    EmbeddedResource,
+    ImageContent,
+    ResourceLink,
+    TextContent,
+    TextResourceContents,
+)
+from pydantic import BaseModel, ConfigDict, Field
 
 from mcp_run_isolated_python.code_executor import CodeExecutionResult
+from mcp_run_isolated_python.environment_cache import EnvironmentCache
+from mcp_run_isolated_python.mcp_server import create_mcp
+from mcp_run_isolated_python.utils.settings import Settings
+
+
+class SandboxFile(BaseModel):
+    """
+    A file the code wrote to `./output`.
+    """
+
+    kind: str
+    name: str | None = None
+    mime_type: str | None = None
+    # not set for large files, which the server keeps. Read them with `CodeSandbox.read_file()`
+    data: bytes | None = None
+    uri: str | None = None
+
+
+class EvalResult(CodeExecutionResult):
+    # the serialized value the code returned with `result(...)`, in `return_value_format`
+    return_value: bytes | None = None
+    files: list[SandboxFile] = Field(default_factory=list)
+
+    def value(self) -> Any:
+        """
+        The returned value: json as python objects, `npy` as numpy array & `arrow` as pyarrow table.
+        """
+
+        if self.return_value is None:
+            return None
+        if self.return_value_format == "npy":
+            import numpy
+
+            return numpy.load(io.BytesIO(self.return_value), allow_pickle=False)
+        if self.return_value_format == "arrow":
+            import pyarrow
+
+            return pyarrow.ipc.open_stream(self.return_value).read_all()
+        return json.loads(self.return_value)
 
 
 class CodeSandbox(BaseModel):
+    """
+    Runs code on an MCP server. The connection is kept open & shared by all calls, calls can run concurrently.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     client: Client
 
     async def eval(
         self,
         python_code: str,
-    ) -> CodeExecutionResult:
+        profile: str | None = None,
+    ) -> EvalResult:
         """
-        Run code in the sandbox.
+        Run code in the sandbox, with the interpreter `profile` of the server or its default one.
         """
-        result = await self.client.call_tool("run_python_code", {"python_code": python_code})
-        content_block = result.content[0]
-        if content_block.type == "text":
-            return json.loads(content_block.text)
-        else:
-            raise ValueError(f"Unexpected content type: {content_block.type}")
+
+        result = await self.client.call_tool("run_python_code", {"python_code": python_code, "profile": profile})
+        return self._parse(result.content)[0]
+
+    async def eval_many(
+        self, python_codes: list[str], batch_size: int = 100, profile: str | None = None
+    ) -> list[EvalResult]:
+        """
+        Run independent code snippets concurrently, each in its own sandbox. The results are in input order.
+
+        The snippets are sent in batches of `batch_size`, which must not be larger than the `max_batch_size` of the
+        server.
+        """
+
+        batches = [python_codes[i : i + batch_size] for i in range(0, len(python_codes), batch_size)]
+        results = await asyncio.gather(
+            *(
+                self.client.call_tool("run_python_code_batch", {"python_codes": batch, "profile": profile})
+                for batch in batches
+            )
+        )
+        return [item for result in results for item in self._parse(result.content)]
+
+    async def read_file(self, file: SandboxFile) -> bytes:
+        """
+        The content of a file, also of large files the server only returns a link to.
+        """
+
+        if file.data is not None:
+            return file.data
+        if file.uri is None:
+            raise ValueError("The file has neither data nor an uri")
+
+        contents = await self.client.read_resource(file.uri)
+        return b"".join(self._resource_data(content) for content in contents)
+
+    @classmethod
+    def _parse(cls, content: list[ContentBlock]) -> list[EvalResult]:
+        # every result is followed by the files of its run
+        results: list[EvalResult] = []
+        for block in content:
+            if isinstance(block, TextContent):
+                # consecutive results without files are sent as one json list
+                data = json.loads(block.text)
+                results.extend(EvalResult.model_validate(item) for item in (data if isinstance(data, list) else [data]))
+            elif not results:
+                raise ValueError(f"Unexpected content before the first result: {block.type}")
+            elif (
+                results[-1].return_value_format is not None
+                and results[-1].return_value is None
+                and isinstance(block, EmbeddedResource)
+            ):
+                # the returned value comes right after its result
+                results[-1].return_value = cls._resource_data(block.resource)
+            else:
+                results[-1].files.append(cls._file(block))
+        return results
+
+    @classmethod
+    def _file(cls, block: ContentBlock) -> SandboxFile:
+        if isinstance(block, ImageContent | AudioContent):
+            kind = "image" if isinstance(block, ImageContent) else "audio"
+            return SandboxFile(kind=kind, mime_type=block.mimeType, data=base64.b64decode(block.data))
+        if isinstance(block, EmbeddedResource):
+            resource = block.resource
+            return SandboxFile(
+                kind="file",
+                name=PurePosixPath(urlparse(str(resource.uri)).path).name or None,
+                mime_type=resource.mimeType,
+                data=cls._resource_data(resource),
+            )
+        if isinstance(block, ResourceLink):
+            return SandboxFile(kind="resource", name=block.name, mime_type=block.mimeType, uri=str(block.uri))
+        raise ValueError(f"Unexpected content type: {block.type}")
+
+    @staticmethod
+    def _resource_data(resource: TextResourceContents | BlobResourceContents) -> bytes:
+        if isinstance(resource, BlobResourceContents):
+            return base64.b64decode(resource.blob)
+        return resource.text.encode()
 
 
-# todo tests
 @asynccontextmanager
 async def code_sandbox(
     *,
-    # todo copy config options over
     dependencies: list[str] | None = None,
+    python_version: str = "3.13",
+    settings: Settings | None = None,
+    url: str | None = None,
 ) -> AsyncIterator["CodeSandbox"]:
     """
     Create a secure sandbox to execute your python code in.
 
+    By default, the MCP server runs in this process & is called without http. `settings` are its options, a python
+    environment with `python_version` & `dependencies` is created (or reused) for the sandbox.
+    With `url`, an already running MCP server is used instead, e.g. `http://localhost:6400/mcp`.
+
     It is recommended to **not** use this context manager, but instead host the MCP server in a separate container to avoid potential security issues.
     Please take a look at the github repo for more information: https://github.com/Kigstn/mcp-run-isolated-python
     """
 
-    async with Client("stdio") as client:
+    if url is not None:
+        if dependencies is not None or settings is not None:
+            raise ValueError("`dependencies` & `settings` can not be used with `url`, the server has its own")
+
+        async with Client(url) as client:
+            yield CodeSandbox(client=client)
+        return
+
+    settings = (settings or Settings.using_defaults()).model_copy()
+    if dependencies is not None or not settings.path_to_python_interpreter.exists():
+        environment_cache = EnvironmentCache(directory=settings.working_directory / ".environments")
+        settings.path_to_python_interpreter = await asyncio.to_thread(
+            environment_cache.get_or_create, python_version=python_version, dependencies=dependencies or []
+        )
+        settings.installed_python_dependencies = dependencies or []
+
+    async with Client(create_mcp(settings)) as client:
         yield CodeSandbox(client=client)
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import time
+from collections.abc import Callable
+from typing import Any
+
+from pydantic import BaseModel, Field, PrivateAttr
+
+from mcp_run_isolated_python.code_executor import CodeExecutionResult, ExecutionOutcome, OnOutput
+from mcp_run_isolated_python.executor_daemon import (
+    FRAME_HEALTH,
+    FRAME_OUTCOME,
+    FRAME_RUN,
+    FRAME_STDERR,
+    FRAME_STDOUT,
+    DaemonOutcome,
+    open_connection,
+    read_frame,
+    write_frame,
+)
+from mcp_run_isolated_python.utils.logger import get_logger
+from mcp_run_isolated_python.utils.otel import tracer
+from mcp_run_isolated_python.utils.settings import DEFAULT_PROFILE, Settings
+
+logger = get_logger(__name__)
+
+HEALTH_CHECK_TIMEOUT_SECONDS = 5
+
+
+class RemoteDaemon(BaseModel):
+    address: str
+    healthy: bool = False
+    # dispatched by this server & not finished yet
+    active_executions: int = 0
+    # of all servers using the daemon, as of the last health check
+    reported_executions: int = 0
+    max_concurrent_executions: int = Field(1, ge=1)
+
+    @property
+    def load(self) -> float:
+        return max(self.active_executions, self.reported_executions) / self.max_concurrent_executions
+
+
+class Dispatcher(BaseModel):
+    """
+    Spreads the executions over the executor daemons in `settings.executor_daemons`, the least loaded one first.
+
+    The daemons are checked every `settings.executor_daemon_health_check_interval_seconds`, unhealthy daemons get no
+    executions until they pass a check again. All calls of a session go to the same daemon, which keeps the
+    interpreter of the session.
+    """
+
+    settings: Settings
+    # called after the health checks, they change `max_concurrent_executions`
+    on_capacity_changed: Callable[[], None] | None = None
+
+    _daemons: list[RemoteDaemon] = PrivateAttr(default_factory=list)
+    # session id -> daemon of the session & when it was last used
+    _sessions: dict[str, tuple[RemoteDaemon, float]] = PrivateAttr(default_factory=dict)
+    _health_check_task: asyncio.Task | None = PrivateAttr(None)
+
+    def model_post_init(self, context: Any, /):
+        self._daemons = [RemoteDaemon(address=address) for address in self.settings.executor_daemons]
+
+    @property
+    def daemons(self) -> list[RemoteDaemon]:
+        return self._daemons
+
+    @property
+    def ready(self) -> bool:
+        return any(daemon.healthy for daemon in self._daemons)
+
+    @property
+    def max_concurrent_executions(self) -> int:
+        # without healthy daemons, executions fail right away instead of waiting
+        return max(sum(daemon.max_concurrent_executions for daemon in self._daemons if daemon.healthy), 1)
+
+    async def start(self):
+        await self.check_health()
+        if not self.ready:
+            logger.warning("None of the executor daemons is healthy yet", addresses=self.settings.executor_daemons)
+
+        if self._health_check_task is None:
+            self._health_check_task = asyncio.create_task(self._check_health_periodically())
+
+    async def stop(self):
+        if self._health_check_task is not None:
+            self._health_check_task.cancel()
+            await asyncio.gather(self._health_check_task, return_exceptions=True)
+            self._health_check_task = None
+
+    async def check_health(self):
+        await asyncio.gather(*(self._check_health(daemon) for daemon in self._daemons))
+        if self.on_capacity_changed is not None:
+            self.on_capacity_changed()
+
+        # the daemons stop idle sessions on their own
+        deadline = time.monotonic() - self.settings.session_idle_timeout_seconds
+        for session_id, (_, last_used) in list(self._sessions.items()):
+            if last_used < deadline:
+                del self._sessions[session_id]
+
+    async def execute(
+        self,
+        python_code: str,
+        session_id: str | None = None,
+        on_output: OnOutput | None = None,
+        input_files: dict[str, str] | None = None,
+        timeout: float | None = None,
+        imports: frozenset[str] = frozenset(),
+        profile: str = DEFAULT_PROFILE,
+    ) -> ExecutionOutcome:
+        if input_files:
+            # the input store is on this server, the daemons can not read it
+            return self._failure("Input files are not supported with executor daemons")
+
+        unreachable: set[str] = set()
+        while True:
+            daemon = self._pick(session_id, exclude=unreachable)
+            if daemon is None:
+                return self._failure("No executor daemon is available, please try again later")
+
+            # counted right away, so concurrent calls see the load
+            daemon.active_executions += 1
+            try:
+                reader, writer = await open_connection(daemon.address)
+            except OSError as e:
+                # nothing was executed yet, so another daemon can take over
+                daemon.active_executions -= 1
+                self._mark_unhealthy(daemon, e)
+                unreachable.add(daemon.address)
+                continue
+
+            try:
+                with tracer.start_as_current_span("dispatch") as span:
+                    span.set_attribute("executor_daemon", daemon.address)
+                    return await self._execute_on(
+                        reader, writer, python_code, session_id, on_output, timeout, imports, profile
+                    )
+            except (OSError, asyncio.IncompleteReadError) as e:
+                self._mark_unhealthy(daemon, e)
+                return self._failure(f"The executor daemon failed while executing the code: {e}")
+            finally:
+                daemon.active_executions -= 1
+                writer.close()
+
+    @staticmethod
+    async def _execute_on(
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        python_code: str,
+        session_id: str | None,
+        on_output: OnOutput | None,
+        timeout: float | None,
+        imports: frozenset[str],
+        profile: str,
+    ) -> ExecutionOutcome:
+        request = {
+            "code": python_code,
+            "session_id": session_id,
+            "timeout": timeout,
+            "imports": sorted(imports),
+            "profile": profile,
+        }
+        await write_frame(writer, FRAME_RUN, json.dumps(request).encode())
+
+        while True:
+            kind, payload = await read_frame(reader)
+            if kind == FRAME_OUTCOME:
+                daemon_outcome = DaemonOutcome.model_validate_json(payload)
+                daemon_outcome.outcome.cacheable = daemon_outcome.cacheable
+                return daemon_outcome.outcome
+            if kind in (FRAME_STDOUT, FRAME_STDERR) and on_output is not None:
+                await on_output("stdout" if kind == FRAME_STDOUT else "stderr", payload)
+
+    def _pick(self, session_id: str | None, exclude: set[str]) -> RemoteDaemon | None:
+        if session_id is not None and session_id in self._sessions:
+            daemon, _ = self._sessions[session_id]
+            if daemon.healthy and daemon.address not in exclude:
+                self._sessions[session_id] = (daemon, time.monotonic())
+                return daemon
+            logger.warning(
+                "The executor daemon of the session is unhealthy, moving the session - its state is lost",
+                session_id=session_id,
+                address=daemon.address,
+            )
+
+        candidates = [daemon for daemon in self._daemons if daemon.healthy and daemon.address not in exclude]
+        if not candidates:
+            return None
+
+        daemon = min(candidates, key=lambda daemon: daemon.load)
+        if session_id is not None:
+            self._sessions[session_id] = (daemon, time.monotonic())
+        return daemon
+
+    async def _check_health(self, daemon: RemoteDaemon):
+        try:
+            health = await asyncio.wait_for(self._request_health(daemon), timeout=HEALTH_CHECK_TIMEOUT_SECONDS)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as e:
+            self._mark_unhealthy(daemon, e)
+            return
+
+        if health["ready"] and not daemon.healthy:
+            logger.info("Executor daemon is healthy", address=daemon.address)
+        daemon.healthy = health["ready"]
+        daemon.reported_executions = health["active_executions"]
+        daemon.max_concurrent_executions = health["max_concurrent_executions"]
+
+    @staticmethod
+    async def _request_health(daemon: RemoteDaemon) -> dict:
+        reader, writer = await open_connection(daemon.address)
+        try:
+            await write_frame(writer, FRAME_HEALTH)
+            kind, payload = await read_frame(reader)
+        finally:
+            writer.close()
+
+        if kind != FRAME_HEALTH:
+            raise ValueError(f"Unexpected answer to a health check: {kind!r}")
+        return json.loads(payload)
+
+    @staticmethod
+    def _mark_unhealthy(daemon: RemoteDaemon, error: BaseException):
+        if daemon.healthy:
+            logger.warning("Executor daemon is unhealthy", address=daemon.address, error=str(error) or repr(error))
+        daemon.healthy = False
+
+    @staticmethod
+    def _failure(error: str) -> ExecutionOutcome:
+        return ExecutionOutcome(result=CodeExecutionResult(status="failure", output="", error=error))
+
+    async def _check_health_periodically(self):
+        while True:
+            await asyncio.sleep(self.settings.executor_daemon_health_check_interval_seconds)
+            await self.check_health()
@@ -0,0 +1,146 @@
+import fcntl
+import hashlib
+import platform
+import shutil
+import stat
+import subprocess  # noqa: S404
+import uuid
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from mcp_run_isolated_python.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class EnvironmentCacheError(Exception):
+    pass
+
+
+class EnvironmentCache(BaseModel):
+    """
+    Virtual environments for the sandbox, keyed by the python version & the resolved (locked) dependencies.
+
+    A restart (or another server on the same host) with the same python version & dependencies reuses the existing
+    environment instead of building it again. The resolved dependencies of a requested list are remembered as well,
+    so a cache hit does not even need to reach the package index. Environments are built with `uv`, compiled to
+    bytecode & made read-only, so multiple servers can share them.
+
+    Layout of `directory`:
+    - `locks/<hash of the requested dependencies>.txt`: the resolved dependencies
+    - `<hash of the python version & resolved dependencies>/`: the virtual environment
+    """
+
+    directory: Path
+
+    def get_or_create(self, python_version: str, dependencies: list[str], lockfile: Path | None = None) -> Path:
+        """
+        Get the python interpreter of the environment, create it if needed. Blocking, this might take a while.
+
+        `lockfile`: pinned requirements to install instead of resolving `dependencies`.
+        """
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        locked = lockfile.read_text() if lockfile is not None else self._lock(python_version, dependencies)
+
+        key = self._hash(python_version, platform.machine(), locked)
+        path = self.directory / key
+        python = path / "bin" / "python"
+
+        # other servers on this host might build the same environment right now
+        with (self.directory / f"{key}.lock").open("w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if path.exists():
+                logger.info("Reusing cached python environment", path=str(path))
+                return python
+
+            logger.info("Creating python environment", path=str(path), python_version=python_version)
+            self._build(path, python_version=python_version, locked=locked)
+
+        return python
+
+    def _lock(self, python_version: str, dependencies: list[str]) -> str:
+        requested = "\n".join(sorted(dependencies))
+        path = self.directory / "locks" / f"{self._hash(python_version, requested)}.txt"
+        if path.exists():
+            return path.read_text()
+
+        locked = ""
+        if dependencies:
+            logger.info("Resolving python dependencies", dependencies=dependencies)
+            locked = self._run(
+                ["uv", "pip", "compile", "-", "--python-version", python_version, "--no-header", "--quiet"],
+                stdin=requested,
+            )
+
+        path.parent.mkdir(exist_ok=True)
+        self._write_atomically(path, locked)
+        return locked
+
+    def _build(self, path: Path, python_version: str, locked: str):
+        # built next to the final path & moved once done, so nobody ever uses a half built environment
+        tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            self._run(["uv", "venv", "--quiet", "--relocatable", "--python", python_version, str(tmp_path)])
+            (tmp_path / "requirements.lock").write_text(locked)
+            if locked:
+                self._run(
+                    [
+                        "uv",
+                        "pip",
+                        "sync",
+                        "--quiet",
+                        "--compile-bytecode",
+                        "--python",
+                        str(tmp_path / "bin" / "python"),
+                        str(tmp_path / "requirements.lock"),
+                    ]
+                )
+
+            self._make_read_only(tmp_path)
+            tmp_path.rename(path)
+        except BaseException:
+            self._make_writable(tmp_path)
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    @staticmethod
+    def _run(cmd: list[str], stdin: str | None = None) -> str:
+        try:
+            p = subprocess.run(cmd, input=stdin, capture_output=True, text=True)  # noqa: S603
+        except FileNotFoundError as e:
+            raise EnvironmentCacheError(f"`{cmd[0]}` is not installed") from e
+        if p.returncode != 0:
+            raise EnvironmentCacheError(f"`{' '.join(cmd[:3])}` failed: {p.stderr.strip()}")
+        return p.stdout
+
+    @staticmethod
+    def _hash(*parts: str) -> str:
+        digest = hashlib.sha256()
+        for part in parts:
+            encoded = part.encode()
+            # prefix with the length, so the boundaries between the parts are unambiguous
+            digest.update(len(encoded).to_bytes(8, "big") + encoded)
+        return digest.hexdigest()[:32]
+
+    @staticmethod
+    def _write_atomically(path: Path, content: str):
+        tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_text(content)
+        tmp_path.replace(path)
+
+    @staticmethod
+    def _make_read_only(path: Path):
+        write = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+        for file in [path, *path.rglob("*")]:
+            if not file.is_symlink():
+                file.chmod(file.stat().st_mode & ~write)
+
+    @staticmethod
+    def _make_writable(path: Path):
+        if not path.exists():
+            return
+        for file in [path, *path.rglob("*")]:
+            if not file.is_symlink():
+                file.chmod(file.stat().st_mode | stat.S_IWUSR)
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import struct
+from pathlib import Path
+from typing import Any
+
+from pydantic import BaseModel, PrivateAttr
+
+from mcp_run_isolated_python.code_executor import CodeExecutionResult, CodeExecutor, ExecutionOutcome
+from mcp_run_isolated_python.output_capture import Stream
+from mcp_run_isolated_python.utils.logger import get_logger
+from mcp_run_isolated_python.utils.processes import process_reaper
+from mcp_run_isolated_python.utils.settings import DEFAULT_PROFILE, Settings
+
+logger = get_logger(__name__)
+
+# the protocol between dispatcher & daemon: frames of <kind: 1 byte><length: 4 bytes, big endian><payload>
+# dispatcher -> daemon
+FRAME_HEALTH = b"H"  # empty, answered with a health frame: json of the load
+# json: {"code": ..., "session_id": ..., "timeout": ..., "imports": [...], "profile": ...}, answered with output frames & an outcome frame
+FRAME_RUN = b"R"
+# daemon -> dispatcher
+FRAME_STDOUT = b"O"
+FRAME_STDERR = b"E"
+FRAME_OUTCOME = b"X"  # json of `DaemonOutcome`
+
+HEADER = struct.Struct(">cI")
+
+Address = Path | tuple[str, int]
+
+
+class DaemonOutcome(BaseModel):
+    outcome: ExecutionOutcome
+    # not part of the json of the outcome itself
+    cacheable: bool
+
+
+def parse_address(address: str) -> Address:
+    """
+    `unix:/path/to/socket` or `host:port`.
+    """
+
+    if address.startswith("unix:"):
+        return Path(address.removeprefix("unix:"))
+
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Invalid executor daemon address `{address}`, expected `unix:/path/to/socket` or `host:port`")
+    return host, int(port)
+
+
+async def open_connection(address: str) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    parsed = parse_address(address)
+    if isinstance(parsed, Path):
+        return await asyncio.open_unix_connection(parsed)
+    return await asyncio.open_connection(*parsed)
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[bytes, bytes]:
+    kind, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return kind, await reader.readexactly(length)
+
+
+async def write_frame(writer: asyncio.StreamWriter, kind: bytes, payload: bytes = b""):
+    writer.write(HEADER.pack(kind, len(payload)) + payload)
+    await writer.drain()
+
+
+class ExecutorDaemon(BaseModel):
+    """
+    Executes code in local sandboxes for the `Dispatcher` of one or more MCP servers, over a unix or tcp socket.
+
+    Output files are always returned inline, the MCP server can not read a file store of the daemon. Results are
+    cached by the MCP server, not by the daemon.
+    """
+
+    settings: Settings
+    address: str
+
+    _code_executor: CodeExecutor = PrivateAttr()
+    _server: asyncio.Server | None = PrivateAttr(None)
+    _connections: set[asyncio.Task] = PrivateAttr(default_factory=set)
+
+    def model_post_init(self, context: Any, /):
+        settings = self.settings.model_copy(
+            update={"output_file_store_directory": None, "result_cache": False, "executor_daemons": []}
+        )
+        self._code_executor = CodeExecutor(settings=settings)
+
+    async def start(self):
+        await self._code_executor.start()
+
+        parsed = parse_address(self.address)
+        if isinstance(parsed, Path):
+            # left behind by a daemon which did not stop cleanly
+            parsed.unlink(missing_ok=True)
+            self._server = await asyncio.start_unix_server(self._handle, parsed)
+        else:
+            self._server = await asyncio.start_server(self._handle, *parsed)
+        logger.info("Executor daemon is listening", address=self.address)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # the server only finishes closing once all connections are closed
+            connections = list(self._connections)
+            for task in connections:
+                task.cancel()
+            await asyncio.gather(*connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+            parsed = parse_address(self.address)
+            if isinstance(parsed, Path):
+                parsed.unlink(missing_ok=True)
+
+        await self._code_executor.stop()
+
+    async def serve(self):
+        await self.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop()
+
+    def health(self) -> dict:
+        return {
+            "ready": self._code_executor.ready,
+            "active_executions": self._code_executor.active_executions,
+            "max_concurrent_executions": self._code_executor.settings.max_concurrent_executions,
+        }
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        if task is not None:
+            self._connections.add(task)
+        try:
+            # a connection can be reused for many requests
+            while True:
+                try:
+                    kind, payload = await read_frame(reader)
+                except asyncio.IncompleteReadError:
+                    return
+
+                if kind == FRAME_HEALTH:
+                    await write_frame(writer, FRAME_HEALTH, json.dumps(self.health()).encode())
+                elif kind == FRAME_RUN:
+                    await self._run(json.loads(payload), writer)
+                else:
+                    logger.warning("Unknown frame, closing the connection", kind=kind)
+                    return
+        except ConnectionError:
+            # the dispatcher is gone
+            pass
+        finally:
+            if task is not None:
+                self._connections.discard(task)
+            writer.close()
+
+    async def _run(self, request: dict, writer: asyncio.StreamWriter):
+        failed = False
+
+        async def on_output(stream: Stream, chunk: bytes):
+            nonlocal failed
+            # the code still runs to the end, even if the dispatcher is gone
+            if failed:
+                return
+            try:
+                await write_frame(writer, FRAME_STDOUT if stream == "stdout" else FRAME_STDERR, chunk)
+            except ConnectionError:
+                failed = True
+
+        profile = request.get("profile") or DEFAULT_PROFILE
+        if profile in self.settings.profile_names:
+            outcome = await self._code_executor.execute(
+                request["code"],
+                session_id=request.get("session_id"),
+                on_output=on_output,
+                timeout=request.get("timeout"),
+                imports=frozenset(request.get("imports", [])),
+                profile=profile,
+            )
+        else:
+            # the daemons might be configured with other profiles than the server
+            error = f"Unknown profile `{profile}` on the executor daemon, available: {', '.join(self.settings.profile_names)}"
+            logger.warning("Unknown profile", profile=profile)
+            outcome = ExecutionOutcome(result=CodeExecutionResult(status="failure", output="", error=error))
+        payload = DaemonOutcome(outcome=outcome, cacheable=outcome.cacheable).model_dump_json()
+        await write_frame(writer, FRAME_OUTCOME, payload.encode())
+
+
+def run_executor_daemon(settings: Settings, address: str):
+    process_reaper.enable()
+    daemon = ExecutorDaemon(settings=settings, address=address)
+    try:
+        asyncio.run(daemon.serve())
+    except KeyboardInterrupt:
+        logger.info("Executor daemon stopped")
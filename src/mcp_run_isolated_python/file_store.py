@@ -0,0 +1,109 @@
+import asyncio
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import BinaryIO
+
+from pydantic import BaseModel, PrivateAttr
+
+from mcp_run_isolated_python.utils.logger import get_logger
+from mcp_run_isolated_python.utils.settings import Settings
+
+logger = get_logger(__name__)
+
+URI_PREFIX = "output-files://"
+
+# inside of `settings.output_file_store_directory`, only this one is managed by the store
+STORE_DIRECTORY_NAME = "mcp-run-isolated-python-output-files"
+
+
+class StoredFile(BaseModel):
+    file_id: str
+    name: str
+    mime_type: str
+    size: int
+    created_at: float
+
+    @property
+    def uri(self) -> str:
+        return f"{URI_PREFIX}{self.file_id}"
+
+
+class FileStore(BaseModel):
+    """
+        Keeps large output files on the server, instead of sending them inline. Clients fetch them on demand as MCP resources.
+
+        Files are removed after `settings.output_file_store_ttl_seconds`, or earlier (oldest first) if the store grows larger
+        than `settings.output_file_store_max_bytes`. The files are kept in a subdirectory of
+    `settings.output_file_store_directory`, which is emptied on startup. Nothing else in there is touched. Ids are random &
+    not guessable.
+    """
+
+    settings: Settings
+
+    _files: OrderedDict[str, StoredFile] = PrivateAttr(default_factory=OrderedDict)
+    _size: int = PrivateAttr(0)
+    # files are stored from worker threads, while being read from the event loop
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def directory(self) -> Path:
+        assert self.settings.output_file_store_directory is not None  # noqa: S101
+        return self.settings.output_file_store_directory / STORE_DIRECTORY_NAME
+
+    async def start(self):
+        await asyncio.to_thread(shutil.rmtree, self.directory, ignore_errors=True)
+        await asyncio.to_thread(self.directory.mkdir, parents=True, exist_ok=True)
+
+    def store(self, source: BinaryIO, name: str, mime_type: str) -> StoredFile:
+        """
+        Copy the opened file into the store. Blocking, call it from a thread.
+        """
+
+        file_id = uuid.uuid4().hex
+        with (self.directory / file_id).open("xb") as target:
+            shutil.copyfileobj(source, target)
+            size = target.tell()
+        file = StoredFile(file_id=file_id, name=name, mime_type=mime_type, size=size, created_at=time.time())
+
+        with self._lock:
+            self._files[file.file_id] = file
+            self._size += file.size
+            expired = self._pop_expired()
+
+        self._unlink(expired)
+        return file
+
+    async def read(self, file_id: str) -> tuple[StoredFile, bytes] | None:
+        with self._lock:
+            expired = self._pop_expired()
+            file = self._files.get(file_id)
+        await asyncio.to_thread(self._unlink, expired)
+
+        if file is None:
+            return None
+        try:
+            return file, await asyncio.to_thread((self.directory / file.file_id).read_bytes)
+        except FileNotFoundError:
+            return None
+
+    def _pop_expired(self) -> list[StoredFile]:
+        # the oldest files are first
+        expired = []
+        deadline = time.time() - self.settings.output_file_store_ttl_seconds
+        while self._files:
+            oldest = next(iter(self._files.values()))
+            if oldest.created_at >= deadline and self._size <= self.settings.output_file_store_max_bytes:
+                break
+            del self._files[oldest.file_id]
+            self._size -= oldest.size
+            expired.append(oldest)
+        return expired
+
+    def _unlink(self, files: list[StoredFile]):
+        for file in files:
+            logger.debug("Removing stored output file", file_id=file.file_id, name=file.name)
+            (self.directory / file.file_id).unlink(missing_ok=True)
@@ -0,0 +1,226 @@
+import asyncio
+import errno
+import fcntl
+import hashlib
+import os
+import stat
+import threading
+import uuid
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+from pydantic import BaseModel, PrivateAttr
+
+from mcp_run_isolated_python.utils.logger import get_logger
+from mcp_run_isolated_python.utils.settings import Settings
+
+logger = get_logger(__name__)
+
+# where the input files are staged, relative to the workspace of a run
+INPUT_DIRECTORY = "input"
+
+READ_ONLY = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+
+# `ioctl` to share the blocks of a file with another one, copy-on-write (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+class InputStoreError(Exception):
+    pass
+
+
+class StoredInput(BaseModel):
+    # the sha256 of the content
+    input_id: str
+    size: int
+
+
+class InputStore(BaseModel):
+    """
+    Input files for the runs, uploaded once & addressed by the sha256 of their content.
+
+    Files are staged read-only into the `input` directory of a run's workspace as copies. The sandbox runs as the same
+    user as the server, so it could make a file writable again - a hardlink would let it change the file in the store.
+    On filesystems which support it (btrfs, xfs, ...), the copies are reflinks, which cost nothing, no matter the size.
+    The least recently used files are removed if the store grows larger than `settings.input_store_max_bytes`.
+
+    Sessions keep their workspace, so the code of an earlier call might have replaced `input` or a file in it with a
+    symlink. Staging never follows symlinks, a replaced directory is created again.
+    """
+
+    settings: Settings
+
+    # input id -> size, the least recently used first
+    _files: OrderedDict[str, int] = PrivateAttr(default_factory=OrderedDict)
+    _size: int = PrivateAttr(0)
+    # files are staged from worker threads, while being uploaded from the event loop
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def directory(self) -> Path:
+        assert self.settings.input_store_directory is not None  # noqa: S101
+        return self.settings.input_store_directory
+
+    async def start(self):
+        await asyncio.to_thread(self._load)
+
+    async def put(self, data: bytes) -> StoredInput:
+        async def chunks() -> AsyncIterator[bytes]:
+            yield data
+
+        return await self.put_stream(chunks())
+
+    async def put_stream(self, chunks: AsyncIterator[bytes]) -> StoredInput:
+        """
+        Store the file, hashing it while it is written. Uploading the same content again is a no-op.
+        """
+
+        digest = hashlib.sha256()
+        size = 0
+        tmp_path = self.directory / f"{uuid.uuid4().hex}.tmp"
+        try:
+            with tmp_path.open("wb") as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.settings.max_input_file_bytes:
+                        raise InputStoreError(
+                            f"The input file is too large (max: {self.settings.max_input_file_bytes} bytes)"
+                        )
+                    digest.update(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+
+            stored = StoredInput(input_id=digest.hexdigest(), size=size)
+            await asyncio.to_thread(self._add, tmp_path, stored)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+        logger.info("Stored input file", input_id=stored.input_id, size=size)
+        return stored
+
+    def stage(self, input_files: dict[str, str], workspace: Path):
+        """
+        Make the input files (name -> input id) available read-only in `workspace/input`. Blocking, call it from a thread.
+        """
+
+        for name in input_files:
+            if not name or name in (".", "..") or "/" in name or "\\" in name:
+                raise InputStoreError(f"Invalid input file name `{name}`")
+
+        directory_fd = self._open_input_directory(workspace)
+        try:
+            for name, input_id in input_files.items():
+                with self._lock:
+                    if input_id not in self._files:
+                        raise InputStoreError(
+                            f"The input file `{input_id}` does not exist (anymore), please upload it again"
+                        )
+                    self._files.move_to_end(input_id)
+                self._stage_file(input_id, name, directory_fd)
+        finally:
+            os.close(directory_fd)
+
+    @staticmethod
+    def _open_input_directory(workspace: Path) -> int:
+        flags = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW
+        workspace_fd = os.open(workspace, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            try:
+                return os.open(INPUT_DIRECTORY, flags, dir_fd=workspace_fd)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # a symlink or a file, left by an earlier call of a session
+                if e.errno not in (errno.ELOOP, errno.ENOTDIR):
+                    raise
+                os.unlink(INPUT_DIRECTORY, dir_fd=workspace_fd)
+
+            os.mkdir(INPUT_DIRECTORY, dir_fd=workspace_fd)
+            return os.open(INPUT_DIRECTORY, flags, dir_fd=workspace_fd)
+        finally:
+            os.close(workspace_fd)
+
+    def _stage_file(self, input_id: str, name: str, directory_fd: int):
+        # sessions keep their workspace, the name might be taken by an earlier call. Symlinks are removed, not followed
+        try:
+            os.unlink(name, dir_fd=directory_fd)
+        except FileNotFoundError:
+            pass
+        except IsADirectoryError:
+            raise InputStoreError(f"The input file name `{name}` is taken by a directory")
+
+        source_fd = os.open(self.directory / input_id, os.O_RDONLY)
+        try:
+            # fails instead of following a symlink, which might have been created in between
+            target_fd = os.open(
+                name, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, READ_ONLY, dir_fd=directory_fd
+            )
+            try:
+                self._copy(source_fd, target_fd)
+            finally:
+                os.close(target_fd)
+        except FileExistsError:
+            raise InputStoreError(f"The input file name `{name}` is taken")
+        finally:
+            os.close(source_fd)
+
+    @staticmethod
+    def _copy(source_fd: int, target_fd: int):
+        try:
+            fcntl.ioctl(target_fd, FICLONE, source_fd)
+            return
+        except OSError:
+            # not supported by the filesystem, or across filesystems
+            pass
+
+        size = os.fstat(source_fd).st_size
+        offset = 0
+        while offset < size:
+            sent = os.sendfile(target_fd, source_fd, offset, size - offset)
+            if not sent:
+                return
+            offset += sent
+
+    def _add(self, tmp_path: Path, stored: StoredInput):
+        path = self.directory / stored.input_id
+        with self._lock:
+            if stored.input_id in self._files:
+                self._files.move_to_end(stored.input_id)
+                return
+
+        tmp_path.chmod(READ_ONLY)
+        tmp_path.replace(path)
+        with self._lock:
+            self._files[stored.input_id] = stored.size
+            self._size += stored.size
+        self._evict()
+
+    def _evict(self):
+        evicted = []
+        with self._lock:
+            # the newest file is kept, even if it is larger than the store
+            while self._size > self.settings.input_store_max_bytes and len(self._files) > 1:
+                input_id, size = self._files.popitem(last=False)
+                self._size -= size
+                evicted.append(input_id)
+
+        for input_id in evicted:
+            logger.debug("Removing least recently used input file", input_id=input_id)
+            (self.directory / input_id).unlink(missing_ok=True)
+
+    def _load(self):
+        # unlike output files, inputs survive restarts - they are addressed by their content
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = []
+        for path in self.directory.iterdir():
+            if path.suffix == ".tmp":
+                path.unlink(missing_ok=True)
+                continue
+            path_stat = path.stat()
+            files.append((path_stat.st_atime, path_stat.st_size, path))
+
+        with self._lock:
+            for _, size, path in sorted(files):
+                self._files[path.name] = size
+                self._size += size
+        self._evict()
@@ -1,11 +1,26 @@
+import asyncio
+import base64
+import binascii
+import contextlib
 import textwrap
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Annotated
 
 from fastmcp import FastMCP
+from fastmcp.exceptions import ResourceError, ToolError
+from fastmcp.resources import ResourceContent, ResourceResult
 from fastmcp.tools import Tool
+from starlette.requests import Request
+from starlette.responses import JSONResponse
 
 from mcp_run_isolated_python.code_executor import CodeExecutor
+from mcp_run_isolated_python.file_store import URI_PREFIX
+from mcp_run_isolated_python.input_store import InputStoreError, StoredInput
 from mcp_run_isolated_python.utils.logger import get_logger
+from mcp_run_isolated_python.utils.processes import process_reaper
 from mcp_run_isolated_python.utils.settings import Settings
+from mcp_run_isolated_python.utils.startup import startup_profile
 
 logger = get_logger(__name__)
 
@@ -14,31 +29,136 @@ name = "mcp_run_isolated_python"
 # todo tests
 
 
-def run_mcp(settings: Settings):
-    mcp = FastMCP(name=name)
+def create_mcp(settings: Settings) -> FastMCP:
+    """
+    The MCP server, without running it. The sandbox is started by the lifespan of the server.
+    """
+
     code_executor = CodeExecutor(settings=settings)
 
+    @asynccontextmanager
+    async def lifespan(_: FastMCP) -> AsyncIterator[None]:
+        # accept connections right away, executions wait until the sandbox is ready
+        start_task = code_executor.start_in_background()
+        if settings.profile_startup:
+            start_task.add_done_callback(lambda task: task.cancelled() or task.exception() or startup_profile.print())
+        try:
+            yield
+        finally:
+            start_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await start_task
+            await code_executor.stop()
+
+    mcp = FastMCP(name=name, lifespan=lifespan)
+
+    @mcp.custom_route("/health", methods=["GET"])
+    async def health(_: Request) -> JSONResponse:
+        # for readiness probes: 503 until the sandbox pre-check & the warm-up are done
+        if code_executor.ready:
+            return JSONResponse({"status": "ready"})
+        return JSONResponse({"status": "starting"}, status_code=503)
+
+    guidelines = textwrap.dedent(f"""
+    ### Guidelines
+    - The code may be async
+    - To output values, you have to use the print statement.
+    - You do **not** have any access to the internet
+    - The code will be executed with Python 3.13
+    - You code must be executed within a timeout. You have {settings.code_timeout_seconds} seconds before the run is canceled.
+    - You have these additional python packages installed: `${settings.installed_python_dependencies}\
+    - To output files or images, save them in the "./output" folder
+    - To return data (e.g. numpy arrays or dataframes), call `result(value)` instead of printing it. It is returned as json, `.npy` or Arrow IPC
+    """)
+    if settings.return_last_expression:
+        guidelines += "- The value of the last expression of the code is returned, like with `result(...)`\n"
+    if settings.input_store_directory is not None:
+        guidelines += "- To work on data, upload it with `upload_input_file` & pass it in `input_files`, instead of putting it into the code\n"
+    if settings.profiles:
+        profiles = ", ".join(
+            f"`{name}` (packages: `{profile.installed_python_dependencies}`)"
+            for name, profile in settings.profiles.items()
+        )
+        guidelines += f"- Other python environments can be selected with `profile`: {profiles}\n"
+
     mcp.add_tool(
         Tool.from_function(
             code_executor.run_python_code,
+            description="Tool to execute Python code and return stdout, stderr, and return value.\n" + guidelines,
+        )
+    )
+    mcp.add_tool(
+        Tool.from_function(
+            code_executor.run_python_code_batch,
             description=textwrap.dedent(f"""
-            Tool to execute Python code and return stdout, stderr, and return value.
-    
-            ### Guidelines
-            - The code may be async
-            - To output values, you have to use the print statement.
-            - You do **not** have any access to the internet
-            - The code will be executed with Python 3.13
-            - You code must be executed within a timeout. You have {settings.code_timeout_seconds} seconds before the run is canceled.
-            - You have these additional python packages installed: `${settings.installed_python_dependencies}\
-            - To output files or images, save them in the "./output" folder
-            """),
+            Tool to execute many independent Python code snippets in parallel, at most {settings.max_batch_size} per call.
+            Returns one result per snippet in input order, each with the `index` of its snippet. Output files follow the result of their snippet.
+            Every snippet runs in its own fresh sandbox and has its own timeout.
+            """)
+            + guidelines,
         )
     )
 
+    # data for the runs, uploaded once instead of being inlined into the code of every call
+    input_store = code_executor.input_store
+    if input_store is not None:
+
+        @mcp.tool(
+            description=textwrap.dedent(f"""
+            Upload an input file, to use it in many runs without sending it again: pass the returned `input_id` in `input_files` of `run_python_code`.
+            The file is available read-only as `./input/<name>`, large files can be memory mapped. At most {settings.max_input_file_bytes} bytes.
+            Input files are removed after a while, if they are not used.
+            """)
+        )
+        async def upload_input_file(
+            content_base64: Annotated[str, "The content of the file, base64 encoded"],
+        ) -> StoredInput:
+            await code_executor.wait_until_started()
+            try:
+                data = base64.b64decode(content_base64, validate=True)
+                return await input_store.put(data)
+            except (binascii.Error, InputStoreError) as e:
+                raise ToolError(str(e)) from e
+
+        # for large files: the raw body, instead of base64 in json
+        @mcp.custom_route("/inputs", methods=["POST"])
+        async def upload_input_file_over_http(request: Request) -> JSONResponse:
+            await code_executor.wait_until_started()
+            try:
+                stored = await input_store.put_stream(request.stream())
+            except InputStoreError as e:
+                return JSONResponse({"error": str(e)}, status_code=413)
+            return JSONResponse(stored.model_dump())
+
+    # large output files, which are not returned inline
+    file_store = code_executor.file_store
+    if file_store is not None:
+
+        @mcp.resource(
+            f"{URI_PREFIX}{{file_id}}",
+            name="output_file",
+            description="A large output file of a code execution. Output files are removed after a while.",
+        )
+        async def read_output_file(file_id: str) -> ResourceResult:
+            stored = await file_store.read(file_id)
+            if stored is None:
+                raise ResourceError(f"The output file `{file_id}` does not exist (anymore)")
+            file, data = stored
+            return ResourceResult([ResourceContent(data, mime_type=file.mime_type)])
+
+    return mcp
+
+
+def run_mcp(settings: Settings):
+    # the server owns this process, so it may reap everything the sandboxes left behind
+    process_reaper.enable()
+    mcp = create_mcp(settings)
+
     logger.info(
         f"Starting MCP server `{name}` with transport {settings.transport!r} (Stateless: {settings.stateless}) on http://{settings.host}:{settings.port}{settings.path}"
     )
+    # once, instead of with every execution
+    logger.info("Using settings", settings=settings.model_dump(mode="json"))
     logger.info("Streaming logs from the MCP server:")
 
     mcp.run(
@@ -0,0 +1,62 @@
+from pathlib import Path
+from typing import BinaryIO, Literal
+
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr
+
+Stream = Literal["stdout", "stderr"]
+
+
+class OutputCapture(BaseModel):
+    """
+    Collects the output of a stream, but keeps at most `max_bytes` of it in memory: the beginning & the end.
+
+    If `spill_path` is set, the complete output is additionally written to that file.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    max_bytes: int = Field(ge=2)
+    spill_path: Path | None = None
+    total_bytes: int = 0
+
+    _head: bytearray = PrivateAttr(default_factory=bytearray)
+    _tail: bytearray = PrivateAttr(default_factory=bytearray)
+    _spill_file: BinaryIO | None = PrivateAttr(None)
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_bytes > self.max_bytes
+
+    @property
+    def truncated_bytes(self) -> int:
+        return max(self.total_bytes - self.max_bytes, 0)
+
+    def write(self, chunk: bytes):
+        self.total_bytes += len(chunk)
+
+        if self.spill_path is not None:
+            if self._spill_file is None:
+                self._spill_file = self.spill_path.open("wb")
+            self._spill_file.write(chunk)
+
+        # fill the head first, everything after that is rotated through the tail
+        head_size = self.max_bytes // 2
+        missing = head_size - len(self._head)
+        if missing > 0:
+            self._head.extend(chunk[:missing])
+            chunk = chunk[missing:]
+
+        tail_size = self.max_bytes - head_size
+        self._tail.extend(chunk[-tail_size:])
+        del self._tail[:-tail_size]
+
+    def close(self):
+        if self._spill_file is not None:
+            self._spill_file.close()
+
+    def getvalue(self) -> bytes:
+        if not self.truncated:
+            return bytes(self._head + self._tail)
+        return (
+            bytes(self._head) + f"\n\n[... {self.truncated_bytes} bytes truncated ...]\n\n".encode() + bytes(self._tail)
+        )
@@ -0,0 +1,87 @@
+from fastmcp import Context
+from pydantic import BaseModel, ConfigDict, PrivateAttr
+
+from mcp_run_isolated_python.output_capture import Stream
+from mcp_run_isolated_python.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# lines without a line break (progress bars, binary data, ...) are sent once they get this long
+MAX_LINE_BYTES = 8 * 1024
+
+
+class OutputStreamer(BaseModel):
+    """
+    Forwards the output of a run line by line to the MCP client as log notifications, while the code is still running.
+
+    stdout is sent with level `info`, stderr with level `warning`. The logger name is the name of the stream.
+    Streaming of a stream stops after `max_bytes` of it, the same limit the returned output is truncated to.
+    For batches, the index of the code snippet is added to the logger name: `stdout[3]`.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    ctx: Context
+    max_bytes: dict[Stream, int] | None = None
+    item: int | None = None
+
+    _partial: dict[Stream, bytearray] = PrivateAttr(
+        default_factory=lambda: {"stdout": bytearray(), "stderr": bytearray()}
+    )
+    _streamed_bytes: dict[Stream, int] = PrivateAttr(default_factory=lambda: {"stdout": 0, "stderr": 0})
+    _failed: bool = PrivateAttr(False)
+
+    async def feed(self, stream: Stream, chunk: bytes):
+        limit_reached = False
+        if self.max_bytes is not None:
+            remaining = self.max_bytes[stream] - self._streamed_bytes[stream]
+            self._streamed_bytes[stream] += len(chunk)
+            if remaining <= 0:
+                return
+            limit_reached = len(chunk) > remaining
+            chunk = chunk[:remaining]
+
+        partial = self._partial[stream]
+        partial.extend(chunk)
+
+        *lines, rest = partial.split(b"\n")
+        for line in lines:
+            await self._send(stream, line)
+        while len(rest) >= MAX_LINE_BYTES:
+            await self._send(stream, rest[:MAX_LINE_BYTES])
+            rest = rest[MAX_LINE_BYTES:]
+
+        self._partial[stream] = bytearray(rest)
+
+        if limit_reached:
+            await self._flush(stream)
+            await self._send(stream, b"[... output truncated, streaming stopped ...]")
+
+    async def flush(self):
+        """
+        Send the last lines, which did not end with a line break.
+        """
+
+        for stream in self._partial:
+            await self._flush(stream)
+
+    async def _flush(self, stream: Stream):
+        partial = self._partial[stream]
+        if partial:
+            await self._send(stream, bytes(partial))
+        partial.clear()
+
+    async def _send(self, stream: Stream, line: bytes):
+        # the client might be gone already - the code still runs to the end & the result is returned as usual
+        if self._failed:
+            return
+
+        try:
+            await self.ctx.log(
+                line.decode(errors="replace").rstrip("\r"),
+                level="info" if stream == "stdout" else "warning",
+                logger_name=stream if self.item is None else f"{stream}[{self.item}]",
+            )
+        except Exception:
+            logger.warning("Could not stream the output to the client, stopping to stream", exc_info=True)
+            self._failed = True
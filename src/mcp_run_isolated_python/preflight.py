@@ -0,0 +1,187 @@
+import ast
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import traceback
+from collections import OrderedDict
+
+from pydantic import BaseModel, PrivateAttr
+
+from mcp_run_isolated_python.utils.logger import get_logger
+from mcp_run_isolated_python.utils.settings import Settings
+
+logger = get_logger(__name__)
+
+# lists what the sandbox interpreter can import. Without the working directory (`sys.path[0]`), the code runs in a
+# fresh workspace
+INVENTORY_SCRIPT = """
+import json, pkgutil, sys
+modules = {module.name for module in pkgutil.iter_modules(sys.path[1:])} | set(sys.builtin_module_names)
+print(json.dumps({"version": list(sys.version_info[:2]), "modules": sorted(modules)}))
+"""
+
+# which of the top-level modules passed as arguments the sandbox interpreter can import. Finds the ones the inventory
+# can not list, e.g. namespace packages (directories without `__init__.py`) or modules of import hooks
+FIND_SPEC_SCRIPT = """
+import importlib.util, json, sys
+del sys.path[0]
+found = []
+for name in sys.argv[1:]:
+    try:
+        if importlib.util.find_spec(name) is not None:
+            found.append(name)
+    except (ImportError, ValueError):
+        pass
+print(json.dumps(found))
+"""
+
+# the name of the code in the tracebacks of the sandbox
+CODE_FILENAME = "code.py"
+
+
+class PreflightResult(BaseModel):
+    # formatted like the interpreter would, e.g. `SyntaxError: ...`
+    error: str | None = None
+    # the top-level modules imported at module level, e.g. `numpy` for `import numpy.linalg`
+    imports: frozenset[str] = frozenset()
+
+
+class Preflight(BaseModel):
+    """
+    Checks the code before a sandbox is used for it: syntax errors & imports of modules which are not installed in the
+    environment of the sandbox fail right away.
+
+    The syntax is only checked if the server runs the same or a newer python version than the sandbox, an older one
+    might not know all of its syntax. Only the imports at the start of the code are checked, later ones might be
+    guarded by a `try` or import a module the code wrote itself. Modules which are not in the inventory of the
+    interpreter are looked up with `importlib.util.find_spec` in it before the code is rejected.
+    The results are cached by the hash of the code, up to `settings.preflight_cache_max_entries`.
+    """
+
+    settings: Settings
+
+    # of the sandbox interpreter, unknown until started
+    _version: tuple[int, int] | None = PrivateAttr(None)
+    _modules: frozenset[str] = PrivateAttr(frozenset())
+    # looked up, but not found
+    _not_found: frozenset[str] = PrivateAttr(frozenset())
+    _started: bool = PrivateAttr(False)
+    _start_lock: asyncio.Lock = PrivateAttr(default_factory=asyncio.Lock)
+    _cache: OrderedDict[str, PreflightResult] = PrivateAttr(default_factory=OrderedDict)
+
+    async def start(self):
+        async with self._start_lock:
+            if self._started:
+                return
+            # only tried once, without the inventory the code is just not checked
+            self._started = True
+
+            stdout = await self._run_interpreter(INVENTORY_SCRIPT)
+            if stdout is None:
+                logger.warning("Could not list the modules of the sandbox interpreter, not checking code")
+                return
+
+            inventory = json.loads(stdout)
+            self._version = tuple(inventory["version"])
+            self._modules = frozenset(inventory["modules"])
+            logger.debug("Listed the modules of the sandbox interpreter", modules=len(self._modules))
+
+    async def check(self, python_code: str, check_imports: bool = True) -> PreflightResult:
+        """
+        `check_imports`: disable for sessions, earlier calls might have written modules into the workspace.
+        """
+
+        await self.start()
+
+        key = f"{hashlib.sha256(python_code.encode()).hexdigest()}:{check_imports}"
+        result = self._cache.get(key)
+        if result is not None:
+            self._cache.move_to_end(key)
+            return result
+
+        result, leading_imports = self._check(python_code)
+        if check_imports and result.error is None:
+            missing = await self._missing(leading_imports)
+            if missing:
+                result = PreflightResult(
+                    error=f"ModuleNotFoundError: No module named '{missing[0]}'", imports=result.imports
+                )
+
+        self._cache[key] = result
+        while len(self._cache) > self.settings.preflight_cache_max_entries:
+            self._cache.popitem(last=False)
+        return result
+
+    async def _missing(self, names: list[str]) -> list[str]:
+        unknown = {name for name in names if name not in self._modules and name not in self._not_found}
+        if unknown:
+            stdout = await self._run_interpreter(FIND_SPEC_SCRIPT, *sorted(unknown))
+            # code which might run is never rejected
+            if stdout is None:
+                return []
+            found = frozenset(json.loads(stdout))
+            self._modules |= found
+            self._not_found |= unknown - found
+        return [name for name in names if name not in self._modules]
+
+    async def _run_interpreter(self, script: str, *args: str) -> bytes | None:
+        try:
+            p = await asyncio.create_subprocess_exec(
+                self.settings.path_to_python_interpreter,
+                "-c",
+                script,
+                *args,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                # the same env vars as the sandbox
+                env={"PATH": os.environ.get("PATH", "")},
+            )
+            stdout, stderr = await asyncio.wait_for(p.communicate(), timeout=self.settings.code_timeout_seconds)
+        except (OSError, asyncio.TimeoutError) as e:
+            logger.warning("Could not run the sandbox interpreter", error=repr(e))
+            return None
+
+        if p.returncode != 0:
+            logger.warning("Could not run the sandbox interpreter", stderr=stderr.decode())
+            return None
+        return stdout
+
+    def _check(self, python_code: str) -> tuple[PreflightResult, list[str]]:
+        """
+        The result without the check of the imports & the top-level modules imported at the start of the code.
+        """
+
+        if self._version is None:
+            return PreflightResult(), []
+
+        try:
+            tree = ast.parse(python_code, CODE_FILENAME)
+            # finds some errors the parser does not, e.g. `return` outside of a function
+            compile(tree, CODE_FILENAME, "exec", dont_inherit=True)
+        except (SyntaxError, ValueError) as e:
+            if sys.version_info[:2] < self._version:
+                return PreflightResult(), []
+            return PreflightResult(error="".join(traceback.format_exception_only(type(e), e)).strip()), []
+
+        imports: set[str] = set()
+        leading_imports: list[str] = []
+        leading = True
+        for index, node in enumerate(tree.body):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module is not None:
+                names = [node.module]
+            else:
+                is_docstring = index == 0 and isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant)
+                leading = leading and is_docstring
+                continue
+
+            for name in names:
+                top_level = name.partition(".")[0]
+                imports.add(top_level)
+                if leading:
+                    leading_imports.append(top_level)
+
+        return PreflightResult(imports=imports), leading_imports
@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+from pydantic import BaseModel, PrivateAttr
+
+from mcp_run_isolated_python.utils.logger import get_logger
+from mcp_run_isolated_python.utils.settings import DEFAULT_PROFILE, Settings
+
+logger = get_logger(__name__)
+
+
+class ResultCache(BaseModel):
+    """
+    LRU cache for serialized execution results, keyed by a hash of the code & everything else that influences its result.
+
+    Entries are kept in memory and, if `settings.result_cache_directory` is set, on disk as well, so they survive
+    restarts. Both are limited to `settings.result_cache_max_entries` entries & `settings.result_cache_max_bytes`,
+    the least recently used entries are evicted first. Entries expire after `settings.result_cache_ttl_seconds`.
+    """
+
+    settings: Settings
+
+    # key -> (created at, value)
+    _entries: OrderedDict[str, tuple[float, bytes]] = PrivateAttr(default_factory=OrderedDict)
+    _size: int = PrivateAttr(0)
+    # key -> size, for the entries on disk
+    _disk_entries: OrderedDict[str, int] = PrivateAttr(default_factory=OrderedDict)
+    _disk_size: int = PrivateAttr(0)
+    # profile -> hash
+    _environment_hashes: dict[str, str] = PrivateAttr(default_factory=dict)
+
+    async def start(self):
+        if self.settings.result_cache_directory is not None:
+            await asyncio.to_thread(self._load_disk_entries)
+
+    def key(self, python_code: str, input_files: dict[str, str] | None = None, profile: str = DEFAULT_PROFILE) -> str:
+        digest = hashlib.sha256()
+        parts = [self._get_environment_hash(profile), python_code]
+        if input_files:
+            # input ids are hashes of the content, so the same inputs give the same key
+            parts.append(json.dumps(input_files, sort_keys=True))
+        for part in parts:
+            encoded = part.encode()
+            # prefix with the length, so the boundaries between the parts are unambiguous
+            digest.update(len(encoded).to_bytes(8, "big") + encoded)
+        return digest.hexdigest()
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            created_at, value = entry
+            if not self._expired(created_at):
+                self._entries.move_to_end(key)
+                return value
+            self._remove(key)
+
+        if key in self._disk_entries:
+            entry = await asyncio.to_thread(self._read_from_disk, key)
+            if entry is None or self._expired(entry[0]):
+                await self._remove_from_disk([key])
+                return None
+
+            created_at, value = entry
+            self._disk_entries.move_to_end(key)
+            self._add(key, value, created_at=created_at)
+            return value
+
+        return None
+
+    async def put(self, key: str, value: bytes):
+        if len(value) > self.settings.result_cache_max_bytes:
+            logger.debug("Result is too large to be cached", key=key, size=len(value))
+            return
+
+        self._add(key, value, created_at=time.time())
+
+        if self.settings.result_cache_directory is not None:
+            await asyncio.to_thread(self._write_to_disk, key, value)
+            self._disk_size -= self._disk_entries.pop(key, 0)
+            self._disk_entries[key] = len(value)
+            self._disk_size += len(value)
+            await self._remove_from_disk(self._disk_entries_to_evict())
+
+    def _get_environment_hash(self, profile: str) -> str:
+        # everything besides the code, which changes the result of an execution
+        if profile not in self._environment_hashes:
+            settings = self.settings.for_profile(profile)
+            environment = {
+                "python_interpreter": str(settings.path_to_python_interpreter),
+                "python_dependencies": sorted(settings.installed_python_dependencies),
+                "srt_settings": settings.path_to_srt_settings.read_text(),
+                "sandbox_backend": settings.sandbox_backend,
+                "code_timeout_seconds": settings.code_timeout_seconds,
+                "max_stdout_bytes": settings.max_stdout_bytes,
+                "max_stderr_bytes": settings.max_stderr_bytes,
+                "attach_truncated_output": settings.attach_truncated_output,
+                "max_return_value_bytes": settings.max_return_value_bytes,
+                "return_last_expression": settings.return_last_expression,
+                "max_memory_bytes": settings.max_memory_bytes,
+                "max_cpu_seconds": settings.max_cpu_seconds,
+                "max_processes": settings.max_processes,
+                "max_output_directory_bytes": settings.max_output_directory_bytes,
+            }
+            self._environment_hashes[profile] = hashlib.sha256(
+                json.dumps(environment, sort_keys=True).encode()
+            ).hexdigest()
+        return self._environment_hashes[profile]
+
+    def _expired(self, created_at: float) -> bool:
+        return time.time() - created_at > self.settings.result_cache_ttl_seconds
+
+    def _add(self, key: str, value: bytes, created_at: float):
+        self._remove(key)
+        self._entries[key] = (created_at, value)
+        self._size += len(value)
+
+        while (
+            len(self._entries) > self.settings.result_cache_max_entries
+            or self._size > self.settings.result_cache_max_bytes
+        ):
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+    def _disk_path(self, key: str) -> Path:
+        assert self.settings.result_cache_directory is not None  # noqa: S101
+        return self.settings.result_cache_directory / key
+
+    def _load_disk_entries(self):
+        assert self.settings.result_cache_directory is not None  # noqa: S101
+        self.settings.result_cache_directory.mkdir(parents=True, exist_ok=True)
+
+        files = []
+        for path in self.settings.result_cache_directory.iterdir():
+            # leftovers of interrupted writes
+            if path.name.endswith(".tmp"):
+                path.unlink(missing_ok=True)
+                continue
+            stat = path.stat()
+            files.append((stat.st_mtime, path.name, stat.st_size))
+
+        # oldest first, the same order the least recently used entries are evicted in
+        for _, key, size in sorted(files):
+            self._disk_entries[key] = size
+            self._disk_size += size
+        for key in self._disk_entries_to_evict():
+            self._disk_size -= self._disk_entries.pop(key)
+            self._disk_path(key).unlink(missing_ok=True)
+
+        logger.info("Loaded result cache from disk", entries=len(self._disk_entries), size=self._disk_size)
+
+    def _read_from_disk(self, key: str) -> tuple[float, bytes] | None:
+        path = self._disk_path(key)
+        try:
+            # the modification time is the time the entry was created
+            return path.stat().st_mtime, path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def _write_to_disk(self, key: str, value: bytes):
+        # write to a temporary file first, so other processes never read half written entries
+        path = self._disk_path(key)
+        tmp_path = path.with_name(f"{key}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(value)
+        tmp_path.replace(path)
+
+    def _disk_entries_to_evict(self) -> list[str]:
+        keys = []
+        entries, size = len(self._disk_entries), self._disk_size
+        for key, entry_size in self._disk_entries.items():
+            if entries <= self.settings.result_cache_max_entries and size <= self.settings.result_cache_max_bytes:
+                break
+            keys.append(key)
+            entries, size = entries - 1, size - entry_size
+        return keys
+
+    async def _remove_from_disk(self, keys: list[str]):
+        if not keys:
+            return
+
+        for key in keys:
+            self._disk_size -= self._disk_entries.pop(key, 0)
+        await asyncio.to_thread(self._unlink, [self._disk_path(key) for key in keys])
+
+    @staticmethod
+    def _unlink(paths: list[Path]):
+        for path in paths:
+            path.unlink(missing_ok=True)
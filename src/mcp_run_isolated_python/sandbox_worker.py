@@ -0,0 +1,664 @@
+"""
+Long-lived worker that is started *inside* the sandbox & executes python code on request.
+
+This file is executed by the sandboxed python interpreter, which does not have this package (or any of its
+dependencies) installed, and which might be an older python version than the server uses.
+So only ever use the standard library here & keep it compatible with python 3.8+!
+
+By default, every run is executed in a child process forked from this worker. So changes made by the executed code (to builtins,
+modules, threads, ...) die together with the child and the next run starts from the same clean interpreter.
+Dependencies passed via `--preload` are imported once before forking, so every run starts with them already loaded
+(and shares their memory with the worker, copy-on-write).
+Processes the code left behind are adopted by the worker (on linux) & killed after the run, or together with the worker.
+With `--persistent`, the code is executed in the worker itself instead, so the globals persist between runs.
+
+The code returns structured values with the `result(...)` builtin (or, with `--return-last-expression`, as the value of
+its last expression). They are written to a file in the workspace, which the server picks up after the run.
+
+Resource limits (`--max-memory-bytes`, ...) are applied with rlimits to the executed code only, the limit which stopped
+the code is reported back to the server.
+
+Communication with the server happens over stdin / stdout using small frames:
+`<kind: 1 byte><payload length: 4 bytes, big endian><payload>`
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+import builtins
+import contextlib
+import errno
+import gc
+import importlib
+import importlib.metadata
+import json
+import linecache
+import math
+import os
+import re
+import resource
+import signal
+import struct
+import sys
+import threading
+import traceback
+import types
+from pathlib import Path
+
+# frames sent by the server
+FRAME_RUN = b"R"
+
+# frames sent by the worker
+FRAME_READY = b"H"
+FRAME_STDOUT = b"O"
+FRAME_STDERR = b"E"
+FRAME_EXIT = b"X"
+
+HEADER = struct.Struct(">cI")
+CHUNK_SIZE = 64 * 1024
+
+# how long to wait for the output pipes to be closed after the executed code finished
+PIPE_CLOSE_TIMEOUT_SECONDS = 1
+
+# see `man prctl`
+PR_SET_CHILD_SUBREAPER = 36
+
+# the returned value is written to `<workspace>/<RETURN_VALUE_NAME>.<format>`
+RETURN_VALUE_NAME = ".return_value"
+RETURN_VALUE_FORMATS = ("json", "npy", "arrow")
+# the worker is started in the workspace, the executed code might change the working directory later
+WORKSPACE = Path.cwd()
+
+
+class Channel:
+    def __init__(self, reader: int, writer: int):
+        self.reader_fd, self.writer_fd = reader, writer
+        self._reader = os.fdopen(reader, "rb", buffering=0)
+        self._writer = os.fdopen(writer, "wb", buffering=0)
+        self._lock = threading.Lock()
+
+    def send(self, kind: bytes, payload: bytes = b""):
+        with self._lock:
+            self._writer.write(HEADER.pack(kind, len(payload)) + payload)
+
+    def receive(self) -> tuple[bytes, bytes] | None:
+        header = self._read_exactly(HEADER.size)
+        if header is None:
+            return None
+        kind, length = HEADER.unpack(header)
+        payload = self._read_exactly(length)
+        if payload is None:
+            return None
+        return kind, payload
+
+    def _read_exactly(self, size: int) -> bytes | None:
+        data = b""
+        while len(data) < size:
+            chunk = self._reader.read(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+
+def _pump(fd: int, kind: bytes, channel: Channel):
+    # forward everything written to the pipe to the server until all writers are closed
+    with os.fdopen(fd, "rb", buffering=0) as pipe:
+        while True:
+            chunk = pipe.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            channel.send(kind, chunk)
+
+
+def _module_names(requirement: str) -> list[str]:
+    """
+    Find the importable modules of a requirement like `scikit-learn>=1.5` -> `sklearn`.
+    """
+
+    match = re.match(r"[A-Za-z0-9._-]+", requirement.strip())
+    if match is None:
+        return []
+    name = match.group(0)
+
+    try:
+        distribution = importlib.metadata.distribution(name)
+    except importlib.metadata.PackageNotFoundError:
+        return [name.replace("-", "_").lower()]
+
+    top_level = distribution.read_text("top_level.txt")
+    if top_level:
+        modules = {line.strip() for line in top_level.splitlines()}
+    else:
+        modules = set()
+        for file in distribution.files or []:
+            if len(file.parts) == 2 and file.parts[1] == "__init__.py":
+                modules.add(file.parts[0])
+            elif len(file.parts) == 1 and file.suffix == ".py":
+                modules.add(file.stem)
+
+    # private modules are implementation details, they are imported by the public ones anyway
+    return sorted(module for module in modules if module and not module.startswith("_"))
+
+
+def preload(requirements: list[str]):
+    for requirement in requirements:
+        for module in _module_names(requirement):
+            try:
+                importlib.import_module(module)
+            except Exception as e:
+                sys.stderr.write(f"Could not preload `{module}` of `{requirement}`: {e!r}\n")
+
+    # move everything loaded so far out of the garbage collector's reach, so the forked children
+    # do not copy the memory pages just by running the garbage collector
+    gc.collect()
+    if hasattr(gc, "freeze"):
+        gc.freeze()
+
+
+class CpuTimeExceeded(BaseException):
+    pass
+
+
+class Limits:
+    """
+    Per run resource limits, `None` means unlimited.
+
+    `processes` limits the processes of the user, not just the ones started by the code. `file_bytes` limits the size
+    of every single file the code writes.
+    """
+
+    def __init__(
+        self,
+        memory_bytes: int | None = None,
+        cpu_seconds: int | None = None,
+        processes: int | None = None,
+        file_bytes: int | None = None,
+    ):
+        self.memory_bytes = memory_bytes
+        self.cpu_seconds = cpu_seconds
+        self.processes = processes
+        self.file_bytes = file_bytes
+
+    def apply(self, kill_after_cpu_limit: bool = True):
+        for limit, value in (
+            (resource.RLIMIT_AS, self.memory_bytes),
+            (resource.RLIMIT_NPROC, self.processes),
+            (resource.RLIMIT_FSIZE, self.file_bytes),
+        ):
+            if value is not None:
+                # the limit can only be lowered, never raised
+                _, hard = resource.getrlimit(limit)
+                value = value if hard == resource.RLIM_INFINITY else min(value, hard)
+                resource.setrlimit(limit, (value, value))
+
+        if kill_after_cpu_limit and self.cpu_seconds is not None:
+            # SIGXCPU is sent at the soft limit, SIGKILL at the hard limit - in case SIGXCPU is ignored
+            resource.setrlimit(resource.RLIMIT_CPU, (self.cpu_seconds, self.cpu_seconds + 1))
+
+    def start_cpu_limit(self):
+        """
+        For a long living process: allow `cpu_seconds` on top of the cpu time used so far, until `stop_cpu_limit()`.
+        """
+
+        if self.cpu_seconds is not None:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            used = math.ceil(usage.ru_utime + usage.ru_stime)
+            _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            resource.setrlimit(resource.RLIMIT_CPU, (used + self.cpu_seconds, hard))
+
+    def stop_cpu_limit(self):
+        if self.cpu_seconds is not None:
+            _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+    def exceeded_by(self, exc: BaseException) -> str | None:
+        """
+        Which limit made the code fail with this exception.
+        """
+
+        if isinstance(exc, CpuTimeExceeded):
+            return "cpu_time"
+        if self.memory_bytes is not None and isinstance(exc, MemoryError):
+            return "memory"
+        # raised by `fork()` once the process limit is reached
+        if self.processes is not None and isinstance(exc, BlockingIOError):
+            return "processes"
+        if self.file_bytes is not None and isinstance(exc, OSError) and exc.errno == errno.EFBIG:
+            return "output_size"
+        return None
+
+    def exceeded_by_child(self, status: int, rusage: resource.struct_rusage) -> str | None:
+        """
+        Which limit killed the forked child.
+        """
+
+        if self.cpu_seconds is None or not os.WIFSIGNALED(status):
+            return None
+
+        # SIGKILL at the hard limit, if SIGXCPU was ignored
+        sig = os.WTERMSIG(status)
+        if sig == signal.SIGXCPU or (sig == signal.SIGKILL and rusage.ru_utime + rusage.ru_stime >= self.cpu_seconds):
+            return "cpu_time"
+        return None
+
+
+def _return_value_format(value: object) -> str:
+    # by type name, the libraries are only imported once a value of theirs is returned
+    library = type(value).__module__.partition(".")[0]
+    name = type(value).__name__
+    if library == "numpy" and name == "ndarray":
+        return "npy"
+    if (library, name) in (
+        ("pandas", "DataFrame"),
+        ("polars", "DataFrame"),
+        ("pyarrow", "Table"),
+        ("pyarrow", "RecordBatch"),
+    ):
+        return "arrow"
+    return "json"
+
+
+def _json_default(value: object) -> object:
+    # numpy arrays & scalars
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(
+        f"Object of type {type(value).__name__} is not JSON serializable, return it with another `format` or convert it"
+    )
+
+
+def _write_arrow(value: object, f: object):
+    import pyarrow
+
+    library = type(value).__module__.partition(".")[0]
+    if isinstance(value, pyarrow.RecordBatch):
+        value = pyarrow.Table.from_batches([value])
+    elif library == "pandas":
+        value = pyarrow.Table.from_pandas(value)
+    elif library == "polars":
+        value = value.to_arrow()
+    elif not isinstance(value, pyarrow.Table):
+        # e.g. a dict of columns
+        value = pyarrow.table(value)
+
+    with pyarrow.ipc.new_stream(f, value.schema) as writer:
+        writer.write_table(value)
+
+
+def result(value: object, format: str | None = None):  # noqa: A002
+    """
+    Return `value` from the run, without printing & parsing it: as `json`, `npy` (numpy arrays) or `arrow` (Arrow IPC
+    stream of dataframes & tables). By default, the format is picked by the type of the value. Only the value of the
+    last call is returned.
+    """
+
+    format = format or _return_value_format(value)  # noqa: A001
+    if format not in RETURN_VALUE_FORMATS:
+        raise ValueError(f"Unknown format `{format}`, use one of: {', '.join(RETURN_VALUE_FORMATS)}")
+
+    for other in RETURN_VALUE_FORMATS:
+        (WORKSPACE / f"{RETURN_VALUE_NAME}.{other}").unlink(missing_ok=True)
+
+    # written completely or not at all
+    tmp_path = WORKSPACE / f"{RETURN_VALUE_NAME}.tmp"
+    with tmp_path.open("wb") as f:
+        if format == "npy":
+            import numpy
+
+            numpy.save(f, numpy.asarray(value), allow_pickle=False)
+        elif format == "arrow":
+            _write_arrow(value, f)
+        else:
+            f.write(json.dumps(value, separators=(",", ":"), default=_json_default).encode())
+    tmp_path.replace(WORKSPACE / f"{RETURN_VALUE_NAME}.{format}")
+
+
+def _exit_code(exc: SystemExit) -> int:
+    # mimic what the interpreter does with `sys.exit(...)`
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code
+    sys.stderr.write(f"{exc.code}\n")
+    return 1
+
+
+def _run_code(
+    code: str, module: types.ModuleType, filename: str, limits: Limits, return_last_expression: bool = False
+) -> tuple[int, str | None]:
+    """
+    Execute the code in the given `__main__` module, like the interpreter would execute a script.
+
+    Returns the exit code & the limit the code exceeded, if any.
+    """
+
+    linecache.cache[filename] = (len(code), None, code.splitlines(keepends=True), filename)
+    sys.argv = [filename]
+    sys.modules["__main__"] = module
+
+    limit = None
+    try:
+        if return_last_expression:
+            _exec_returning_last_expression(code, module, filename)
+        else:
+            exec(compile(code, filename, "exec"), module.__dict__)  # noqa: S102
+        returncode = 0
+    except SystemExit as e:
+        returncode = _exit_code(e)
+    except BaseException as e:
+        limit = limits.exceeded_by(e)
+        # hide the frames of this worker from the traceback
+        tb = e.__traceback__
+        while tb is not None and tb.tb_frame.f_code.co_filename == __file__:
+            tb = tb.tb_next
+        traceback.print_exception(type(e), e, tb)
+        returncode = 1
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return returncode, limit
+
+
+def _exec_returning_last_expression(code: str, module: types.ModuleType, filename: str):
+    # like a notebook cell: the value of a trailing expression is returned
+    tree = ast.parse(code, filename)
+    last = tree.body.pop() if tree.body and isinstance(tree.body[-1], ast.Expr) else None
+    exec(compile(tree, filename, "exec"), module.__dict__)  # noqa: S102
+    if last is None:
+        return
+
+    value = eval(compile(ast.Expression(last.value), filename, "eval"), module.__dict__)  # noqa: S307
+    if value is None:
+        return
+    try:
+        result(value)
+    except Exception as e:
+        # e.g. a plot, the code did not ask for the value explicitly
+        sys.stderr.write(f"Could not return the value of the last expression: {e!r}\n")
+
+
+def _new_main_module() -> types.ModuleType:
+    module = types.ModuleType("__main__")
+    module.__builtins__ = builtins
+    return module
+
+
+def _start_pumps(channel: Channel) -> tuple[dict[bytes, tuple[int, int]], list[threading.Thread]]:
+    pipes = {FRAME_STDOUT: os.pipe(), FRAME_STDERR: os.pipe()}
+    pumps = [
+        threading.Thread(target=_pump, args=(reader, kind, channel), daemon=True) for kind, (reader, _) in pipes.items()
+    ]
+    return pipes, pumps
+
+
+def _join_pumps(pumps: list[threading.Thread]) -> bool:
+    # processes started by the code (and not stopped by it) still have the output pipes open
+    for pump in pumps:
+        pump.join(timeout=PIPE_CLOSE_TIMEOUT_SECONDS)
+    return any(pump.is_alive() for pump in pumps)
+
+
+def _become_subreaper():
+    # processes left behind by the code (e.g. daemons which called `setsid()`) become children of this worker once their
+    # parent exited, instead of leaving the process tree of the sandbox. linux only
+    if sys.platform != "linux":
+        return
+    try:
+        import ctypes
+
+        ctypes.CDLL(None).prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0)
+    except (ImportError, OSError, AttributeError):
+        pass
+
+
+def _children() -> list[int]:
+    own_pid = os.getpid()
+    children = []
+    proc = Path("/proc")
+    if not proc.is_dir():
+        return children
+
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_bytes()
+        except OSError:
+            # exited in the meantime
+            continue
+        # the name of the command is in parentheses & might contain spaces
+        if int(stat[stat.rfind(b")") + 2 :].split()[1]) == own_pid:
+            children.append(int(entry.name))
+    return children
+
+
+def _kill_leftovers():
+    """
+    Once the forked child exited, every child of this worker is a process the run left behind. Killing them makes their
+    own children orphans, which are adopted next - so repeat until none are left.
+    """
+
+    while True:
+        children = _children()
+        if not children:
+            return
+        for pid in children:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGKILL)
+        for pid in children:
+            with contextlib.suppress(ChildProcessError):
+                os.waitpid(pid, 0)
+
+
+def _run_child(
+    code: str,
+    channel: Channel,
+    stdout_fd: int,
+    stderr_fd: int,
+    limit_fd: int,
+    limits: Limits,
+    return_last_expression: bool,
+):
+    """
+    Runs in the forked child: execute the code & exit.
+    """
+
+    # the executed code must never be able to talk to the server directly
+    os.close(channel.reader_fd)
+    os.close(channel.writer_fd)
+    os.dup2(stdout_fd, 1)
+    os.dup2(stderr_fd, 2)
+    os.close(stdout_fd)
+    os.close(stderr_fd)
+
+    returncode = 1
+    try:
+        limits.apply()
+        returncode, limit = _run_code(
+            code,
+            module=_new_main_module(),
+            filename=str(Path.cwd() / "code.py"),
+            limits=limits,
+            return_last_expression=return_last_expression,
+        )
+        if limit is not None:
+            os.write(limit_fd, limit.encode())
+    finally:
+        # skip any cleanup of the interpreter, the parent takes care of everything
+        os._exit(returncode)
+
+
+def execute(code: str, channel: Channel, limits: Limits, return_last_expression: bool = False) -> dict:
+    """
+    Execute the code in a forked child, with stdout / stderr streamed to the server.
+    """
+
+    pipes, pumps = _start_pumps(channel)
+    # the child reports the limit it exceeded through this pipe
+    limit_reader, limit_writer = os.pipe()
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        os.close(limit_reader)
+        for reader, _ in pipes.values():
+            os.close(reader)
+        _run_child(
+            code,
+            channel=channel,
+            stdout_fd=pipes[FRAME_STDOUT][1],
+            stderr_fd=pipes[FRAME_STDERR][1],
+            limit_fd=limit_writer,
+            limits=limits,
+            return_last_expression=return_last_expression,
+        )
+
+    os.close(limit_writer)
+    for _, writer in pipes.values():
+        os.close(writer)
+    for pump in pumps:
+        pump.start()
+
+    _, status, rusage = os.wait4(pid, 0)
+    returncode = os.waitstatus_to_exitcode(status) if hasattr(os, "waitstatus_to_exitcode") else status >> 8
+
+    # processes started by the code might still hold the write end open, so never wait for more
+    os.set_blocking(limit_reader, False)
+    with os.fdopen(limit_reader, "rb") as pipe:
+        limit = (pipe.read() or b"").decode() or limits.exceeded_by_child(status, rusage)
+
+    leftovers = _join_pumps(pumps)
+    _kill_leftovers()
+    return {"returncode": returncode, "leftovers": leftovers, "limit": limit}
+
+
+class Session:
+    """
+    Executes the code directly in this process, so the globals (and everything else) persist between runs.
+
+    Used for persistent sessions: there is no isolation between the runs, they all belong to the same client.
+    """
+
+    def __init__(self, devnull: int, stderr_fd: int, limits: Limits, return_last_expression: bool = False):
+        self.module = _new_main_module()
+        self.runs = 0
+        self._devnull = devnull
+        self._stderr_fd = stderr_fd
+        self._limits = limits
+        self._return_last_expression = return_last_expression
+
+        # the limits apply to the whole worker here, the cpu time only counts while the code runs
+        limits.apply(kill_after_cpu_limit=False)
+        signal.signal(signal.SIGXCPU, self._cpu_time_exceeded)
+
+    @staticmethod
+    def _cpu_time_exceeded(signum: int, frame: types.FrameType | None):
+        raise CpuTimeExceeded(f"The code used more than the allowed cpu time (signal {signum})")
+
+    def execute(self, code: str, channel: Channel) -> dict:
+        self.runs += 1
+        cwd = Path.cwd()
+        pipes, pumps = _start_pumps(channel)
+        for pump in pumps:
+            pump.start()
+
+        for fd, kind in ((1, FRAME_STDOUT), (2, FRAME_STDERR)):
+            os.dup2(pipes[kind][1], fd)
+            os.close(pipes[kind][1])
+
+        try:
+            self._limits.start_cpu_limit()
+            # every run gets its own file name, so tracebacks of functions defined in earlier runs stay correct
+            returncode, limit = _run_code(
+                code,
+                module=self.module,
+                filename=str(cwd / f"code_{self.runs}.py"),
+                limits=self._limits,
+                return_last_expression=self._return_last_expression,
+            )
+        finally:
+            self._limits.stop_cpu_limit()
+            # closes the write ends of the pipes, so the pumps finish
+            os.dup2(self._devnull, 1)
+            os.dup2(self._stderr_fd, 2)
+            os.chdir(cwd)
+
+        # output of processes still running in the background is streamed into the next runs, that is fine here
+        _join_pumps(pumps)
+        return {"returncode": returncode, "leftovers": False, "limit": limit}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--preload", nargs="*", default=[], help="Dependencies to import before forking")
+    parser.add_argument("--persistent", action="store_true", help="Keep the globals between runs")
+    parser.add_argument("--max-memory-bytes", type=int, help="Address space limit of the executed code")
+    parser.add_argument("--max-cpu-seconds", type=int, help="Cpu time limit of a run")
+    parser.add_argument("--max-processes", type=int, help="Process limit of the user")
+    parser.add_argument("--max-file-bytes", type=int, help="Size limit of every file the code writes")
+    parser.add_argument("--return-last-expression", action="store_true", help="Return the value of the last expression")
+    args = parser.parse_args()
+    limits = Limits(
+        memory_bytes=args.max_memory_bytes,
+        cpu_seconds=args.max_cpu_seconds,
+        processes=args.max_processes,
+        file_bytes=args.max_file_bytes,
+    )
+
+    # move the communication channel away from stdin / stdout, so the executed code cannot write into it
+    channel = Channel(reader=os.dup(0), writer=os.dup(1))
+    devnull = os.open(os.devnull, os.O_RDWR)
+    stderr_fd = os.dup(2)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+
+    # stream output line by line
+    sys.stdout.reconfigure(line_buffering=True)
+
+    # imports should resolve relative to the working directory, not this file
+    sys.path[0] = str(Path.cwd())
+
+    # available to the executed code without an import, like `print`
+    builtins.result = result
+
+    _become_subreaper()
+
+    preload(args.preload)
+    session = (
+        Session(devnull=devnull, stderr_fd=stderr_fd, limits=limits, return_last_expression=args.return_last_expression)
+        if args.persistent
+        else None
+    )
+
+    # the server prefers workers which have the modules of the code loaded already
+    channel.send(FRAME_READY, json.dumps(sorted({name.partition(".")[0] for name in sys.modules})).encode())
+    while True:
+        frame = channel.receive()
+        if frame is None:
+            return
+
+        kind, payload = frame
+        if kind != FRAME_RUN:
+            raise ValueError(f"Unknown frame: {kind!r}")
+
+        request = json.loads(payload)
+        if session is not None:
+            outcome = session.execute(request["code"], channel=channel)
+        else:
+            outcome = execute(
+                request["code"], channel=channel, limits=limits, return_last_expression=args.return_last_expression
+            )
+        channel.send(FRAME_EXIT, json.dumps(outcome).encode())
+
+        # leftover processes could write into the output of the next run - let the server replace this worker
+        if outcome["leftovers"]:
+            return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import asyncio
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+
+from pydantic import BaseModel, ConfigDict, PrivateAttr
+
+from mcp_run_isolated_python.utils.logger import get_logger
+from mcp_run_isolated_python.utils.otel import queue_duration_histogram, tracer
+from mcp_run_isolated_python.utils.settings import Settings
+
+logger = get_logger(__name__)
+
+# executions with less time left than this are not started anymore
+MIN_RUN_SECONDS = 1.0
+
+
+class SchedulerBusyError(Exception):
+    pass
+
+
+class QueueTimeoutError(Exception):
+    pass
+
+
+class _Waiter(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    client: str
+    deadline: float
+    future: asyncio.Future
+
+
+class Scheduler(BaseModel):
+    """
+    Admission control in front of the sandboxes: at most `capacity()` executions run at the same time, at most
+    `settings.max_queued_executions` wait. If the queue is full, executions are rejected right away.
+
+    The time spent waiting counts against `settings.code_timeout_seconds`: every execution gets a deadline when it
+    arrives, and executions which could not run for at least `MIN_RUN_SECONDS` before it are rejected instead of
+    being started.
+
+    When a slot frees up, the client with the fewest running executions goes next, then the client which got the
+    fewest slots since it started sending executions, so one client can not take all the capacity. Between clients
+    with the same numbers, the earliest deadline goes first.
+    Call `capacity_changed()` when the capacity might have grown, so waiting executions start right away.
+    """
+
+    settings: Settings
+    # how many executions can run at the same time, it changes with the healthy executor daemons
+    capacity: Callable[[], int]
+
+    _active: int = PrivateAttr(0)
+    # client -> running executions
+    _running: dict[str, int] = PrivateAttr(default_factory=dict)
+    # client -> slots it got, as long as it has running or waiting executions
+    _served: dict[str, int] = PrivateAttr(default_factory=dict)
+    # client -> waiting executions, oldest first
+    _queues: dict[str, deque[_Waiter]] = PrivateAttr(default_factory=dict)
+    _queued: int = PrivateAttr(0)
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @asynccontextmanager
+    async def slot(self, client: str) -> AsyncIterator[float]:
+        """
+        Wait for a free slot. Yields the deadline (`time.monotonic()`) of the execution.
+        """
+
+        deadline = time.monotonic() + self.settings.code_timeout_seconds
+        queued_at = time.perf_counter()
+        with tracer.start_as_current_span("queue_wait"):
+            await self._acquire(client, deadline)
+        queue_duration_histogram.record(time.perf_counter() - queued_at)
+
+        try:
+            yield deadline
+        finally:
+            self._release(client)
+
+    def capacity_changed(self):
+        self._dispatch()
+
+    async def _acquire(self, client: str, deadline: float):
+        # the capacity might have grown since the last execution
+        self._dispatch()
+        if self._has_free_slot() and not self._queued:
+            self._take(client)
+            return
+
+        if self._queued >= self.settings.max_queued_executions:
+            raise SchedulerBusyError("The server is busy, too many executions are waiting. Please try again later")
+
+        waiter = _Waiter(client=client, deadline=deadline, future=asyncio.get_running_loop().create_future())
+        self._queues.setdefault(client, deque()).append(waiter)
+        self._queued += 1
+
+        try:
+            # not `wait_for`, it would cancel the future even if the slot was just granted
+            await asyncio.wait([waiter.future], timeout=max(deadline - MIN_RUN_SECONDS - time.monotonic(), 0))
+        except asyncio.CancelledError:
+            if waiter.future.done():
+                self._release(client)
+            else:
+                self._remove(waiter)
+            raise
+
+        if not waiter.future.done():
+            self._remove(waiter)
+            raise QueueTimeoutError(
+                f"TimeoutError: The code waited too long for a free sandbox and could not finish within {self.settings.code_timeout_seconds} seconds anymore"
+            )
+
+    def _has_free_slot(self) -> bool:
+        return self._active < self.capacity()
+
+    def _take(self, client: str):
+        self._active += 1
+        self._running[client] = self._running.get(client, 0) + 1
+        self._served[client] = self._served.get(client, 0) + 1
+
+    def _release(self, client: str):
+        self._active -= 1
+        self._running[client] -= 1
+        if not self._running[client]:
+            del self._running[client]
+        self._forget(client)
+        self._dispatch()
+
+    def _remove(self, waiter: _Waiter):
+        queue = self._queues[waiter.client]
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[waiter.client]
+        self._queued -= 1
+        waiter.future.cancel()
+        self._forget(waiter.client)
+
+    def _forget(self, client: str):
+        # a client which comes back later starts over
+        if client not in self._running and client not in self._queues:
+            self._served.pop(client, None)
+
+    def _dispatch(self):
+        while self._has_free_slot() and self._queues:
+            client = min(
+                self._queues,
+                key=lambda client: (
+                    self._running.get(client, 0),
+                    self._served.get(client, 0),
+                    self._queues[client][0].deadline,
+                ),
+            )
+            queue = self._queues[client]
+            waiter = queue.popleft()
+            if not queue:
+                del self._queues[client]
+            self._queued -= 1
+
+            self._take(client)
+            waiter.future.set_result(None)
@@ -0,0 +1,154 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from pydantic import BaseModel, ConfigDict, PrivateAttr
+
+from mcp_run_isolated_python.utils.logger import get_logger
+from mcp_run_isolated_python.utils.settings import Settings
+from mcp_run_isolated_python.worker_pool import SandboxWorker, SandboxWorkerError
+from mcp_run_isolated_python.workspaces import WorkspaceManager
+
+logger = get_logger(__name__)
+
+
+class Session(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    session_id: str
+    worker: SandboxWorker
+    last_used: float
+    lock: asyncio.Lock
+    # done once the worker is running, calls of the session wait for it
+    started: asyncio.Future
+
+    @property
+    def starting(self) -> bool:
+        return not self.started.done()
+
+
+class SessionManager(BaseModel):
+    """
+    Gives every MCP session its own long-lived sandbox worker & workspace, so globals and files persist between calls.
+
+    Sessions are stopped after `settings.session_idle_timeout_seconds` without a call.
+    At most `settings.max_sessions` sessions are kept, the least recently used idle session is stopped to make room.
+    Workers are started & stopped outside of the bookkeeping, so a slow start only delays the calls of its own session.
+    """
+
+    settings: Settings
+    workspaces: WorkspaceManager
+
+    _sessions: dict[str, Session] = PrivateAttr(default_factory=dict)
+    _eviction_task: asyncio.Task | None = PrivateAttr(None)
+
+    async def start(self):
+        if self._eviction_task is None:
+            self._eviction_task = asyncio.create_task(self._evict_idle_sessions_periodically())
+
+    async def stop(self):
+        if self._eviction_task is not None:
+            self._eviction_task.cancel()
+            await asyncio.gather(self._eviction_task, return_exceptions=True)
+            self._eviction_task = None
+
+        sessions, self._sessions = list(self._sessions.values()), {}
+        await asyncio.gather(*(session.worker.stop() for session in sessions))
+
+    @asynccontextmanager
+    async def worker(self, session_id: str) -> AsyncIterator[SandboxWorker]:
+        """
+        Get the worker of the session. Calls of the same session are executed one after another.
+        """
+
+        session = await self._get_or_create(session_id)
+        async with session.lock:
+            try:
+                yield session.worker
+            finally:
+                session.last_used = time.monotonic()
+                if session.worker.alive:
+                    await asyncio.to_thread(session.worker.clear_output)
+                else:
+                    # crashed or timed out - the state is gone, the next call starts a new session
+                    await self._remove(session)
+
+    async def evict_idle_sessions(self):
+        deadline = time.monotonic() - self.settings.session_idle_timeout_seconds
+        for session in list(self._sessions.values()):
+            if session.last_used < deadline and not session.lock.locked() and not session.starting:
+                logger.info("Stopping idle session", session_id=session.session_id)
+                await self._remove(session)
+
+    async def _get_or_create(self, session_id: str) -> Session:
+        # the bookkeeping never awaits, so concurrent calls can not interleave with it
+        stopped: list[Session] = []
+        session = self._sessions.get(session_id)
+        if session is not None and not (session.worker.alive or session.lock.locked() or session.starting):
+            stopped.append(self._pop(session))
+            session = None
+
+        created = session is None
+        if session is None:
+            if len(self._sessions) >= self.settings.max_sessions:
+                idle_sessions = [
+                    session for session in self._sessions.values() if not session.lock.locked() and not session.starting
+                ]
+                if not idle_sessions:
+                    await self._stop(stopped)
+                    raise SandboxWorkerError(
+                        f"Too many active sessions (max: {self.settings.max_sessions}), please try again later"
+                    )
+                oldest = min(idle_sessions, key=lambda session: session.last_used)
+                logger.info("Stopping least recently used session to make room", session_id=oldest.session_id)
+                stopped.append(self._pop(oldest))
+
+            session = Session(
+                session_id=session_id,
+                worker=SandboxWorker(settings=self.settings, workspaces=self.workspaces, persistent=True),
+                last_used=time.monotonic(),
+                lock=asyncio.Lock(),
+                started=asyncio.get_running_loop().create_future(),
+            )
+            self._sessions[session_id] = session
+
+        await self._stop(stopped)
+        if not created:
+            # a cancelled call must not cancel the start for the others
+            await asyncio.shield(session.started)
+            return session
+
+        try:
+            await session.worker.start()
+        except BaseException as e:
+            self._pop(session)
+            # the calls waiting for the session fail as well
+            session.started.set_exception(
+                e if isinstance(e, Exception) else SandboxWorkerError("The session could not be started")
+            )
+            # nobody else might be waiting, it is raised here already
+            session.started.exception()
+            raise
+
+        logger.info("Started new session", session_id=session_id)
+        session.started.set_result(None)
+        return session
+
+    def _pop(self, session: Session) -> Session:
+        if self._sessions.get(session.session_id) is session:
+            del self._sessions[session.session_id]
+        return session
+
+    @staticmethod
+    async def _stop(sessions: list[Session]):
+        await asyncio.gather(*(session.worker.stop() for session in sessions))
+
+    async def _remove(self, session: Session):
+        await self._stop([self._pop(session)])
+
+    async def _evict_idle_sessions_periodically(self):
+        interval = max(min(self.settings.session_idle_timeout_seconds / 2, 60), 1)
+        while True:
+            await asyncio.sleep(interval)
+            await self.evict_idle_sessions()
@@ -1,22 +1,70 @@
+import atexit
+import hashlib
+import importlib.util
 import logging
+import queue
+import sys
+import threading
+from collections import Counter
+from typing import Any, Literal, TextIO
 
-import fastmcp
-import pydantic
 import structlog
-from structlog.typing import FilteringBoundLogger
+from structlog.typing import EventDict, FilteringBoundLogger, Processor, WrappedLogger
 
 from mcp_run_isolated_python.utils.otel import add_open_telemetry_spans
 
+LogFormat = Literal["console", "json"]
+
+# fields which can be as large as the code & its output
+LARGE_FIELDS = ("code", "stdout", "stderr")
+
+
+def configure_logging(
+    log_level: int = logging.INFO,
+    log_format: LogFormat = "console",
+    max_field_length: int = 1000,
+    sample_every: int = 1,
+):
+    """
+    `console`: human readable, for development.
+    `json`: for production - one json object per line, written by a background thread, so logging never blocks a
+    request.
+
+    `max_field_length`: longer code & output fields are truncated, and a hash of the full value is logged.
+    `sample_every`: only every n-th info & debug event of the same kind is logged. Warnings & errors always are.
+    """
+
+    processors: list[Processor] = [
+        structlog.contextvars.merge_contextvars,
+        structlog.processors.add_log_level,
+        SampleEvents(every=sample_every),
+        TruncateFields(max_length=max_field_length),
+    ]
+
+    if log_format == "json":
+        structlog.configure(
+            processors=[
+                *processors,
+                structlog.processors.TimeStamper(fmt="iso", utc=True),
+                add_open_telemetry_spans,
+                structlog.processors.dict_tracebacks,
+                structlog.processors.JSONRenderer(),
+            ],
+            wrapper_class=structlog.make_filtering_bound_logger(log_level),
+            context_class=dict,
+            logger_factory=QueueLoggerFactory(),
+            cache_logger_on_first_use=True,
+        )
+        return
 
-def configure_logging(log_level: int = logging.INFO):
     exception_formatter = structlog.dev.RichTracebackFormatter()
     exception_formatter.width = 180
-    exception_formatter.suppress = [pydantic, fastmcp]
+    # found without importing them, importing fastmcp takes a while
+    exception_formatter.suppress = _package_paths("pydantic", "fastmcp")
 
     structlog.configure(
         processors=[
-            structlog.contextvars.merge_contextvars,
-            structlog.processors.add_log_level,
+            *processors,
             structlog.processors.StackInfoRenderer(),
             structlog.dev.set_exc_info,
             structlog.processors.MaybeTimeStamper(fmt="iso"),
@@ -30,6 +78,133 @@ def configure_logging(log_level: int = logging.INFO):
     )
 
 
+class SampleEvents:
+    """
+    Drop all but every n-th info & debug event with the same message. The first one is always logged.
+    """
+
+    def __init__(self, every: int):
+        self.every = every
+        self._seen: Counter[str] = Counter()
+
+    def __call__(self, _: WrappedLogger, method_name: str, event_dict: EventDict) -> EventDict:
+        if self.every <= 1 or method_name not in ("debug", "info"):
+            return event_dict
+
+        event = str(event_dict.get("event"))
+        # not locked, a miscounted event every now and then does not matter
+        seen = self._seen[event]
+        self._seen[event] = seen + 1
+        if seen % self.every != 0:
+            raise structlog.DropEvent
+        return event_dict
+
+
+class TruncateFields:
+    """
+    Truncate the code & output fields, adding the length & a hash of the full value.
+    """
+
+    def __init__(self, max_length: int, fields: tuple[str, ...] = LARGE_FIELDS):
+        self.max_length = max_length
+        self.fields = fields
+
+    def __call__(self, _: WrappedLogger, __: str, event_dict: EventDict) -> EventDict:
+        for field in self.fields:
+            value = event_dict.get(field)
+            if not isinstance(value, str) or len(value) <= self.max_length:
+                continue
+
+            event_dict[field] = f"{value[: self.max_length]}..."
+            event_dict[f"{field}_length"] = len(value)
+            event_dict[f"{field}_sha256"] = hashlib.sha256(value.encode(errors="replace")).hexdigest()[:16]
+        return event_dict
+
+
+class QueueLogger:
+    """
+    Hands the rendered lines to a background thread, which writes them.
+
+    The queue is bounded - if the writer can not keep up, lines are dropped instead of blocking the caller.
+    """
+
+    def __init__(self, file: TextIO | None = None, max_queued_lines: int = 10_000):
+        self._file = file or sys.stdout
+        self._queue: queue.Queue[str | None] = queue.Queue(maxsize=max_queued_lines)
+        self._dropped = 0
+        self._thread = threading.Thread(target=self._write, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def msg(self, message: str):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self._dropped += 1
+
+    log = debug = info = warn = warning = err = error = critical = exception = fatal = failure = msg
+
+    def close(self):
+        # blocks, the remaining lines are written before the process exits
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+    def _write(self):
+        while True:
+            message = self._queue.get()
+            if message is None:
+                return
+
+            lines = [message]
+            # write everything queued so far at once
+            while len(lines) < 1000:
+                try:
+                    message = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if message is None:
+                    self._flush(lines)
+                    return
+                lines.append(message)
+            self._flush(lines)
+
+    def _flush(self, lines: list[str]):
+        if self._dropped:
+            dropped, self._dropped = self._dropped, 0
+            lines.append(f'{{"event": "Dropped log lines, the writer could not keep up", "count": {dropped}}}')
+        try:
+            self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+        except (OSError, ValueError):
+            # closed stdout, nothing to log to anymore
+            pass
+
+
+class QueueLoggerFactory:
+    """
+    All loggers share one writer thread.
+    """
+
+    def __init__(self, file: TextIO | None = None):
+        self._file = file
+        self._logger: QueueLogger | None = None
+
+    def __call__(self, *_: Any) -> QueueLogger:
+        if self._logger is None:
+            self._logger = QueueLogger(file=self._file)
+        return self._logger
+
+
+def _package_paths(*packages: str) -> list[str]:
+    paths = []
+    for package in packages:
+        spec = importlib.util.find_spec(package)
+        if spec is not None and spec.submodule_search_locations:
+            paths.extend(spec.submodule_search_locations)
+    return paths
+
+
 configure_logging()
 
 
@@ -1,6 +1,38 @@
-from opentelemetry import trace
+from pathlib import Path
+
+from opentelemetry import metrics, trace
 from structlog.typing import EventDict, ProcessorReturnValue, WrappedLogger
 
+# no-ops, until `configure_telemetry()` sets up the sdk
+tracer = trace.get_tracer("mcp_run_isolated_python")
+meter = metrics.get_meter("mcp_run_isolated_python")
+
+executions_counter = meter.create_counter(
+    "mcp_run_isolated_python.executions",
+    unit="{execution}",
+    description="Executed code snippets, by result: success, failure, timeout, crash, error (no sandbox), rejected (busy) or cached",
+)
+queue_duration_histogram = meter.create_histogram(
+    "mcp_run_isolated_python.queue.duration",
+    unit="s",
+    description="Time spent waiting for a free execution slot",
+)
+execution_duration_histogram = meter.create_histogram(
+    "mcp_run_isolated_python.execution.duration",
+    unit="s",
+    description="Time spent executing the code in the sandbox",
+)
+leaked_processes_counter = meter.create_counter(
+    "mcp_run_isolated_python.processes.leaked",
+    unit="{process}",
+    description="Processes the sandboxes left behind, killed by the reaper",
+)
+output_size_histogram = meter.create_histogram(
+    "mcp_run_isolated_python.output.size",
+    unit="By",
+    description="Size of the output the code wrote, by stream, before it was truncated",
+)
+
 
 def add_open_telemetry_spans(_: WrappedLogger, __: str, event_dict: EventDict) -> ProcessorReturnValue:
     span = trace.get_current_span()
@@ -18,3 +50,67 @@ def add_open_telemetry_spans(_: WrappedLogger, __: str, event_dict: EventDict) -
     }
 
     return event_dict
+
+
+def configure_telemetry(
+    telemetry_file: Path | None = None,
+    prometheus_host: str = "localhost",
+    prometheus_port: int | None = None,
+    export_interval_seconds: int = 60,
+):
+    """
+    Export the spans & metrics of the server.
+
+    `telemetry_file`: spans & metrics are appended to this file as json lines.
+    `prometheus_port`: metrics are served for prometheus on `http://<prometheus_host>:<prometheus_port>/metrics`.
+
+    Needs the optional `telemetry` dependencies.
+    """
+
+    if telemetry_file is None and prometheus_port is None:
+        return
+
+    try:
+        from opentelemetry.sdk.metrics import MeterProvider
+        from opentelemetry.sdk.metrics.export import ConsoleMetricExporter, MetricReader, PeriodicExportingMetricReader
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    except ImportError as e:
+        raise RuntimeError(
+            "Exporting telemetry needs the optional `telemetry` dependencies: `pip install mcp_run_isolated_python[telemetry]`"
+        ) from e
+
+    resource = Resource.create({"service.name": "mcp_run_isolated_python"})
+    tracer_provider = TracerProvider(resource=resource)
+    readers: list[MetricReader] = []
+
+    if telemetry_file is not None:
+        telemetry_file.parent.mkdir(parents=True, exist_ok=True)
+        # kept open until the process exits, the providers flush on exit
+        out = telemetry_file.open("a", buffering=1)
+
+        tracer_provider.add_span_processor(
+            BatchSpanProcessor(ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n"))
+        )
+        readers.append(
+            PeriodicExportingMetricReader(
+                ConsoleMetricExporter(out=out, formatter=lambda data: data.to_json(indent=None) + "\n"),
+                export_interval_millis=export_interval_seconds * 1000,
+            )
+        )
+
+    if prometheus_port is not None:
+        try:
+            from opentelemetry.exporter.prometheus import PrometheusMetricReader
+            from prometheus_client import start_http_server
+        except ImportError as e:
+            raise RuntimeError(
+                "Serving prometheus metrics needs the optional `telemetry` dependencies: `pip install mcp_run_isolated_python[telemetry]`"
+            ) from e
+
+        start_http_server(port=prometheus_port, addr=prometheus_host)
+        readers.append(PrometheusMetricReader())
+
+    trace.set_tracer_provider(tracer_provider)
+    metrics.set_meter_provider(MeterProvider(resource=resource, metric_readers=readers))
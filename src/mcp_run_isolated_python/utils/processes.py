@@ -0,0 +1,207 @@
+import asyncio
+import contextlib
+import ctypes
+import os
+import signal
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+from pydantic import BaseModel, PrivateAttr
+
+from mcp_run_isolated_python.utils.logger import get_logger
+from mcp_run_isolated_python.utils.otel import leaked_processes_counter
+
+logger = get_logger(__name__)
+
+# how long processes get to shut down after SIGTERM, before they are killed
+TERMINATE_GRACE_SECONDS = 1
+
+# see `man prctl`
+PR_SET_CHILD_SUBREAPER = 36
+
+
+def _signal_group(process: asyncio.subprocess.Process, sig: signal.Signals):
+    # the process was started with `start_new_session=True`, so its pid is also the id of its process group
+    with contextlib.suppress(ProcessLookupError, PermissionError):
+        os.killpg(process.pid, sig)
+
+
+def _signal_all(pids: list[int], sig: signal.Signals):
+    for pid in pids:
+        with contextlib.suppress(ProcessLookupError, PermissionError):
+            os.kill(pid, sig)
+
+
+def list_processes() -> dict[int, tuple[int, int, str]]:
+    """
+    pid -> parent pid, session id & state of all processes. Empty without `/proc`, e.g. on macOS.
+    """
+
+    processes = {}
+    proc = Path("/proc")
+    if not proc.is_dir():
+        return processes
+
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_bytes()
+        except OSError:
+            # exited in the meantime
+            continue
+        # the name of the command is in parentheses & might contain spaces
+        fields = stat[stat.rfind(b")") + 2 :].split()
+        processes[int(entry.name)] = (int(fields[1]), int(fields[3]), fields[0].decode())
+    return processes
+
+
+def descendants(pid: int, processes: dict[int, tuple[int, int, str]] | None = None) -> list[int]:
+    if processes is None:
+        processes = list_processes()
+
+    children = defaultdict(list)
+    for child, (parent, _, _) in processes.items():
+        children[parent].append(child)
+
+    result = []
+    stack = [pid]
+    while stack:
+        for child in children[stack.pop()]:
+            result.append(child)
+            stack.append(child)
+    return result
+
+
+async def terminate_process_tree(process: asyncio.subprocess.Process, grace_seconds: float = TERMINATE_GRACE_SECONDS):
+    """
+    Stop a process started with `start_new_session=True` and everything it started.
+
+    Sends SIGTERM to the whole process group first and escalates to SIGKILL if it does not exit in time.
+    Killing only the process itself is not enough: `srt` starts the sandboxed interpreter as a child, which would
+    keep running (and keep the pipes open) otherwise.
+    Descendants which left the process group with `setsid()` are signalled as well. Processes which are not
+    descendants anymore, because their parent exited, are left to the `ProcessReaper`.
+    """
+
+    tree = await asyncio.to_thread(descendants, process.pid)
+
+    _signal_group(process, signal.SIGTERM)
+    _signal_all(tree, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), timeout=grace_seconds)
+    except asyncio.TimeoutError:
+        _signal_group(process, signal.SIGKILL)
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(process.wait(), timeout=grace_seconds)
+
+    # children might have ignored SIGTERM while the parent exited
+    _signal_group(process, signal.SIGKILL)
+    _signal_all(tree, signal.SIGKILL)
+
+
+def _become_subreaper() -> bool:
+    if sys.platform != "linux":
+        return False
+    libc = ctypes.CDLL(None, use_errno=True)
+    return libc.prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0) == 0
+
+
+class ProcessReaper(BaseModel):
+    """
+    Kills & reaps the processes the sandboxes left behind, so they do not take away cpu & memory over the uptime.
+
+    Only used by processes which own the server (see `enable`): they become a child subreaper (linux only), so processes
+    whose parent exited, e.g. daemons started by the executed code, become children of the server instead of init.
+    Every sandbox runs in its own session. Those sessions are recorded, together with the ones of everything the running
+    sandboxes started. Children of the server in a recorded session can only be leftovers, they are killed regularly.
+    Other children, e.g. of an application embedding the server, are never touched.
+    """
+
+    # pids of the running sandbox workers
+    _sandboxes: set[int] = PrivateAttr(default_factory=set)
+    # session ids of the sandboxes & their descendants, as long as a process is left in them
+    _sessions: set[int] = PrivateAttr(default_factory=set)
+    _enabled: bool = PrivateAttr(False)
+    _task: asyncio.Task | None = PrivateAttr(None)
+    # executors using the reaper, there might be more than one in a process
+    _users: int = PrivateAttr(0)
+    _leaked: int = PrivateAttr(0)
+
+    @property
+    def leaked(self) -> int:
+        # killed since the start of the process
+        return self._leaked
+
+    def add(self, pid: int):
+        # started with `start_new_session=True`, so its pid is also the id of its session
+        self._sandboxes.add(pid)
+        self._sessions.add(pid)
+
+    def discard(self, pid: int):
+        self._sandboxes.discard(pid)
+
+    def enable(self):
+        """
+        Reap the leftovers of all executors started afterwards. Only for processes which own the server (the cli), not
+        when it is embedded into another application.
+        """
+
+        self._enabled = True
+        if not _become_subreaper():
+            logger.warning("Could not become a child subreaper, orphaned sandbox processes can not be reaped")
+
+    async def start(self, interval_seconds: float):
+        self._users += 1
+        if not self._enabled or self._task is not None:
+            return
+
+        self._task = asyncio.create_task(self._reap_periodically(interval_seconds))
+
+    async def stop(self):
+        self._users -= 1
+        if self._users > 0 or self._task is None:
+            return
+
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def reap(self):
+        processes = await asyncio.to_thread(list_processes)
+        own_pid = os.getpid()
+
+        # e.g. daemons which left the session of their sandbox, they are known once their sandbox is gone
+        for sandbox in list(self._sandboxes):
+            self._sessions.update(processes[pid][1] for pid in descendants(sandbox, processes))
+
+        for pid, (parent, session, state) in processes.items():
+            if parent != own_pid or session not in self._sessions or pid in self._sandboxes:
+                continue
+
+            if state != "Z":
+                tree = descendants(pid, processes)
+                logger.warning("Killing processes left behind by a sandbox", pid=pid, descendants=len(tree))
+                _signal_all([pid, *tree], signal.SIGKILL)
+                self._leaked += 1 + len(tree)
+                leaked_processes_counter.add(1 + len(tree))
+
+            # zombies are reaped right away, killed processes once they exited
+            with contextlib.suppress(ChildProcessError):
+                os.waitpid(pid, os.WNOHANG)  # noqa: ASYNC222 - does not block
+
+        # a session id is the pid of its leader, which might be reused once the session is empty
+        self._sessions &= {session for _, session, _ in processes.values()} | self._sandboxes
+
+    async def _reap_periodically(self, interval_seconds: float):
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.reap()
+            except OSError:
+                logger.warning("Could not reap leftover processes", exc_info=True)
+
+
+# shared by all executors of the process, a process has only one set of children
+process_reaper = ProcessReaper()
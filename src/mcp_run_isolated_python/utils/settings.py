@@ -1,8 +1,30 @@
 import logging
+import os
 from pathlib import Path
+from typing import Literal
 
 from pydantic import BaseModel, Field, ValidationError, field_validator
 
+from mcp_run_isolated_python.utils.logger import LogFormat
+
+# the profile of the top-level interpreter settings
+DEFAULT_PROFILE = "default"
+
+# `srt`: the sandbox-runtime cli, `bwrap`: bubblewrap directly, with the srt settings translated
+SandboxBackend = Literal["srt", "bwrap"]
+
+
+class InterpreterProfile(BaseModel):
+    """
+    Another python environment for the sandboxes, selected per call. Unset fields are taken from the server's settings.
+    """
+
+    path_to_python_interpreter: Path
+    installed_python_dependencies: list[str] = Field(default_factory=list)
+    path_to_srt_settings: Path | None = None
+    worker_pool_size: int | None = Field(None, ge=0)
+    preload_python_dependencies: bool | None = None
+
 
 class Settings(BaseModel):
     transport: str
@@ -13,11 +35,58 @@ class Settings(BaseModel):
     code_timeout_seconds: int
 
     log_level: int
+    log_format: LogFormat = "console"
+    log_max_field_length: int = Field(1000, ge=1)
+    log_sample_every: int = Field(1, ge=1)
     path_to_python_interpreter: Path
     path_to_srt_settings: Path
+    sandbox_backend: SandboxBackend = "srt"
     working_directory: Path
 
     installed_python_dependencies: list[str] = Field(default_factory=list)
+    profiles: dict[str, InterpreterProfile] = Field(default_factory=dict)
+    max_concurrent_executions: int = Field(None, ge=1, validate_default=True)  # ty:ignore[invalid-assignment]
+    max_queued_executions: int = Field(100, ge=0)
+    process_reaper_interval_seconds: int = Field(10, ge=1)
+    workspace_directory: Path | None = None
+    workspace_pool_size: int = Field(2, ge=0)
+    worker_pool_size: int = Field(0, ge=0)
+    worker_max_runs: int = Field(1, ge=1)
+    preload_python_dependencies: bool = False
+    session_mode: bool = False
+    session_idle_timeout_seconds: int = Field(600, ge=1)
+    max_sessions: int = Field(16, ge=1)
+    max_stdout_bytes: int = Field(1024 * 1024, ge=2)
+    max_stderr_bytes: int = Field(1024 * 1024, ge=2)
+    attach_truncated_output: bool = False
+    max_return_value_bytes: int = Field(16 * 1024 * 1024, ge=1)
+    return_last_expression: bool = False
+    output_file_store_directory: Path | None = None
+    inline_output_file_max_bytes: int = Field(1024 * 1024, ge=0)
+    output_file_store_max_bytes: int = Field(1024 * 1024 * 1024, ge=1)
+    output_file_store_ttl_seconds: int = Field(60 * 60, ge=1)
+    input_store_directory: Path | None = None
+    input_store_max_bytes: int = Field(10 * 1024 * 1024 * 1024, ge=1)
+    max_input_file_bytes: int = Field(1024 * 1024 * 1024, ge=1)
+    max_batch_size: int = Field(100, ge=1)
+    batch_max_concurrency: int = Field(None, ge=1, validate_default=True)  # ty:ignore[invalid-assignment]
+    preflight: bool = True
+    preflight_cache_max_entries: int = Field(1000, ge=1)
+    result_cache: bool = False
+    result_cache_directory: Path | None = None
+    result_cache_max_entries: int = Field(1000, ge=1)
+    result_cache_max_bytes: int = Field(256 * 1024 * 1024, ge=1)
+    result_cache_ttl_seconds: int = Field(24 * 60 * 60, ge=1)
+    max_memory_bytes: int | None = Field(None, ge=1)
+    max_cpu_seconds: int | None = Field(None, ge=1)
+    max_processes: int | None = Field(None, ge=1)
+    max_output_directory_bytes: int | None = Field(None, ge=1)
+    executor_daemons: list[str] = Field(default_factory=list)
+    executor_daemon_health_check_interval_seconds: int = Field(5, ge=1)
+    profile_startup: bool = False
+    telemetry_file: Path | None = None
+    prometheus_port: int | None = None
+    telemetry_export_interval_seconds: int = Field(60, ge=1)
 
     @classmethod
     def using_defaults(cls) -> "Settings":
@@ -34,6 +103,38 @@ class Settings(BaseModel):
             path_to_srt_settings=Path.cwd() / "default_srt_settings.json",
         )
 
+    @property
+    def profile_names(self) -> list[str]:
+        return [DEFAULT_PROFILE, *self.profiles]
+
+    def for_profile(self, profile: str | None) -> "Settings":
+        """
+        The settings of a sandbox of the profile: the server's, with the interpreter settings of the profile.
+        """
+
+        if profile is None or profile == DEFAULT_PROFILE:
+            return self
+        if profile not in self.profiles:
+            raise ValueError(f"Unknown profile `{profile}`, available: {', '.join(self.profile_names)}")
+
+        update = self.profiles[profile].model_dump(exclude_none=True)
+        update["profiles"] = {}
+        return self.model_copy(update=update)
+
+    @field_validator("profiles", mode="after")
+    @classmethod
+    def _check_profile_names(cls, profiles: dict[str, InterpreterProfile]) -> dict[str, InterpreterProfile]:
+        if DEFAULT_PROFILE in profiles:
+            raise ValueError(f"`{DEFAULT_PROFILE}` is the profile of the top-level settings, use another name")
+        return profiles
+
+    @field_validator("max_concurrent_executions", "batch_max_concurrency", mode="before")
+    @classmethod
+    def _default_to_cpu_count(cls, value: int | None) -> int:
+        if value is None:
+            return os.cpu_count() or 1
+        return value
+
     @field_validator("path_to_srt_settings", mode="after")
     @classmethod
     def _check_exists(cls, path: Path) -> Path:
@@ -0,0 +1,51 @@
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from pydantic import BaseModel, Field, PrivateAttr
+
+
+class StartupProfile(BaseModel):
+    """
+    How long the phases of the startup took, printed with `--profile-startup`.
+    """
+
+    # phase -> seconds, in the order the phases finished
+    phases: dict[str, float] = Field(default_factory=dict)
+
+    _started_at: float = PrivateAttr(default_factory=time.perf_counter)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started_at
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = seconds
+
+    @property
+    def total_seconds(self) -> float:
+        return time.perf_counter() - self._started_at
+
+    def print(self):
+        # rich is only needed here
+        from rich.console import Console
+        from rich.table import Table
+
+        table = Table(title="Startup profile")
+        table.add_column("Phase")
+        table.add_column("Duration", justify="right")
+        for name, seconds in self.phases.items():
+            table.add_row(name, f"{seconds * 1000:.1f} ms")
+        table.add_row("[bold]total until ready[/bold]", f"[bold]{self.total_seconds * 1000:.1f} ms[/bold]")
+
+        console = Console()
+        console.print(table)
+        console.print("For an import time breakdown per module, start the server with `PYTHONPROFILEIMPORTTIME=1`.")
+
+
+# shared by the cli & the server, which add their phases
+startup_profile = StartupProfile()
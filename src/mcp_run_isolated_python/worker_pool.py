@@ -0,0 +1,414 @@
+import asyncio
+import json
+import os
+import shlex
+import shutil
+from collections import deque
+from collections.abc import Awaitable, Callable, Coroutine
+from pathlib import Path
+from typing import Any, Literal
+
+from pydantic import BaseModel, PrivateAttr
+
+from mcp_run_isolated_python import sandbox_worker
+from mcp_run_isolated_python.bwrap import bwrap_command
+from mcp_run_isolated_python.output_capture import OutputCapture, Stream
+from mcp_run_isolated_python.utils.logger import get_logger
+from mcp_run_isolated_python.utils.otel import tracer
+from mcp_run_isolated_python.utils.processes import TERMINATE_GRACE_SECONDS, process_reaper, terminate_process_tree
+from mcp_run_isolated_python.utils.settings import Settings
+from mcp_run_isolated_python.workspaces import WorkspaceManager
+
+logger = get_logger(__name__)
+
+LimitExceeded = Literal["timeout", "memory", "cpu_time", "processes", "output_size", "return_value_size"]
+
+# only keep the end of the worker's own stderr, it is just used for debugging crashes
+MAX_WORKER_STDERR_BYTES = 64 * 1024
+
+
+def sandbox_command(settings: Settings, command: str, workspace: Path | None = None) -> list[str]:
+    """
+    The arguments to run the shell `command` in a sandbox of `settings.sandbox_backend`.
+    """
+
+    if settings.sandbox_backend == "bwrap":
+        return bwrap_command(settings.path_to_srt_settings, command, workspace=workspace)
+    return ["srt", "--settings", str(settings.path_to_srt_settings), command]
+
+
+class SandboxWorkerError(Exception):
+    pass
+
+
+class WorkerRunResult(BaseModel):
+    returncode: int | None
+    stdout: bytes
+    stderr: bytes
+    timed_out: bool = False
+    crashed: bool = False
+    # the resource limit which stopped the code
+    limit_exceeded: LimitExceeded | None = None
+    # the size of the output before it was truncated
+    stdout_bytes: int = 0
+    stderr_bytes: int = 0
+    # the complete output, if it was truncated & `settings.attach_truncated_output` is enabled
+    stdout_spill_path: Path | None = None
+    stderr_spill_path: Path | None = None
+
+
+class SandboxWorker(BaseModel):
+    """
+    A sandboxed python interpreter, which is started ahead of time & waits for code to execute.
+    """
+
+    settings: Settings
+    workspaces: WorkspaceManager
+    # keep the globals between runs, instead of forking a fresh process for every run
+    persistent: bool = False
+    runs: int = 0
+    # top-level modules loaded before the first run, e.g. the preloaded dependencies
+    modules: frozenset[str] = frozenset()
+
+    _process: asyncio.subprocess.Process | None = PrivateAttr(None)
+    _stderr: bytearray = PrivateAttr(default_factory=bytearray)
+    _stderr_task: asyncio.Task | None = PrivateAttr(None)
+    _broken: bool = PrivateAttr(False)
+    _workspace: Path | None = PrivateAttr(None)
+    _workspace_released: bool = PrivateAttr(False)
+
+    @property
+    def workspace(self) -> Path:
+        assert self._workspace is not None, "The worker has not been started yet"  # noqa: S101
+        return self._workspace
+
+    @property
+    def output_path(self) -> Path:
+        return self.workspace / "output"
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.returncode is None and not self._broken
+
+    async def start(self):
+        with tracer.start_as_current_span("workspace_setup"):
+            self._workspace = await self.workspaces.acquire()
+
+        with tracer.start_as_current_span("sandbox_spawn"):
+            await self._spawn()
+
+    async def _spawn(self):
+        cmd = f""""{self.settings.path_to_python_interpreter}" "{sandbox_worker.__file__}" """
+        if self.settings.preload_python_dependencies and self.settings.installed_python_dependencies:
+            cmd += " ".join(["--preload", *(shlex.quote(dep) for dep in self.settings.installed_python_dependencies)])
+        if self.persistent:
+            cmd += " --persistent"
+        if self.settings.return_last_expression:
+            cmd += " --return-last-expression"
+        for option, value in (
+            ("--max-memory-bytes", self.settings.max_memory_bytes),
+            ("--max-cpu-seconds", self.settings.max_cpu_seconds),
+            ("--max-processes", self.settings.max_processes),
+            ("--max-file-bytes", self.settings.max_output_directory_bytes),
+        ):
+            if value is not None:
+                cmd += f" {option} {value}"
+        self._process = await asyncio.create_subprocess_exec(
+            *sandbox_command(self.settings, cmd, workspace=self.workspace),
+            cwd=self.workspace,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            # limit the env vars, just need path
+            env={"PATH": os.environ.get("PATH", "")},
+            # own process group, so the sandboxed interpreter can be killed together with the sandbox
+            start_new_session=True,
+        )
+        process_reaper.add(self._process.pid)
+        self._stderr_task = asyncio.create_task(self._drain_stderr())
+
+        try:
+            kind, payload = await asyncio.wait_for(self._receive(), timeout=self.settings.code_timeout_seconds)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            await self.stop()
+            raise SandboxWorkerError(f"Sandbox worker failed to start: {self._stderr.decode().strip()}") from e
+
+        if kind != sandbox_worker.FRAME_READY:
+            await self.stop()
+            raise SandboxWorkerError(f"Sandbox worker sent an unexpected frame on startup: {kind!r}")
+        self.modules = frozenset(json.loads(payload))
+
+    async def run(
+        self,
+        python_code: str,
+        timeout: float,
+        on_output: Callable[[Stream, bytes], Awaitable[None]] | None = None,
+    ) -> WorkerRunResult:
+        """
+        Execute the code. `on_output` is called with every chunk of output, while the code is still running.
+
+        Only the beginning & the end of the output is kept, if it is longer than `settings.max_stdout_bytes` /
+        `settings.max_stderr_bytes`. With `settings.attach_truncated_output`, the complete output is written to
+        `stdout_spill_path` / `stderr_spill_path` of the result, the caller has to remove these files.
+        """
+
+        if not self.alive:
+            raise SandboxWorkerError("Sandbox worker is not running")
+
+        self.runs += 1
+        captures: dict[Stream, OutputCapture] = {
+            stream: OutputCapture(
+                max_bytes=max_bytes,
+                spill_path=WorkspaceManager.spill_path(self.workspace, stream)
+                if self.settings.attach_truncated_output
+                else None,
+            )
+            for stream, max_bytes in (
+                ("stdout", self.settings.max_stdout_bytes),
+                ("stderr", self.settings.max_stderr_bytes),
+            )
+        }
+        streams: dict[bytes, Stream] = {sandbox_worker.FRAME_STDOUT: "stdout", sandbox_worker.FRAME_STDERR: "stderr"}
+
+        async def collect() -> tuple[int, LimitExceeded | None]:
+            while True:
+                kind, payload = await self._receive()
+                if kind in streams:
+                    captures[streams[kind]].write(payload)
+                    if on_output is not None:
+                        await on_output(streams[kind], payload)
+                elif kind == sandbox_worker.FRAME_EXIT:
+                    exit_info = json.loads(payload)
+                    if exit_info["leftovers"]:
+                        # the executed code left processes behind, the worker shuts itself down
+                        self._broken = True
+                    return exit_info["returncode"], exit_info.get("limit")
+                else:
+                    raise SandboxWorkerError(f"Sandbox worker sent an unexpected frame: {kind!r}")
+
+        try:
+            await self._send(sandbox_worker.FRAME_RUN, json.dumps({"code": python_code}).encode())
+            returncode, limit_exceeded = await asyncio.wait_for(collect(), timeout=timeout)
+
+        except asyncio.TimeoutError:
+            await self._terminate()
+            return self._result(captures, returncode=None, timed_out=True, limit_exceeded="timeout")
+
+        except (asyncio.IncompleteReadError, ConnectionError, SandboxWorkerError):
+            await self._terminate()
+            captures["stderr"].write(bytes(self._stderr))
+            return self._result(captures, returncode=self._process.returncode if self._process else None, crashed=True)
+
+        return self._result(captures, returncode=returncode, limit_exceeded=limit_exceeded)
+
+    @staticmethod
+    def _result(captures: dict[Stream, OutputCapture], **kwargs: Any) -> WorkerRunResult:
+        spill_paths: dict[Stream, Path | None] = {}
+        for stream, capture in captures.items():
+            capture.close()
+            spill_paths[stream] = None
+            if capture.spill_path is not None and capture.truncated:
+                spill_paths[stream] = capture.spill_path
+            elif capture.spill_path is not None:
+                # the complete output is returned anyway
+                capture.spill_path.unlink(missing_ok=True)
+
+        return WorkerRunResult(
+            stdout=captures["stdout"].getvalue(),
+            stderr=captures["stderr"].getvalue(),
+            stdout_spill_path=spill_paths["stdout"],
+            stderr_spill_path=spill_paths["stderr"],
+            stdout_bytes=captures["stdout"].total_bytes,
+            stderr_bytes=captures["stderr"].total_bytes,
+            **kwargs,
+        )
+
+    def reset(self):
+        """
+        Remove all files created by the last run, so the next run starts with a clean workspace.
+        """
+
+        for path in self.workspace.iterdir():
+            if path.is_dir() and not path.is_symlink():
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+        self.output_path.mkdir()
+
+    def clear_output(self):
+        """
+        Remove only the returned output files, everything else in the workspace is kept.
+        """
+
+        shutil.rmtree(self.output_path, ignore_errors=True)
+        self.output_path.mkdir()
+
+    async def stop(self):
+        await self._terminate()
+
+        # the workspace is removed in the background
+        if self._workspace is not None and not self._workspace_released:
+            self._workspace_released = True
+            self.workspaces.release(self._workspace)
+
+    async def _terminate(self):
+        # the workspace is kept, the output files of the run are still collected afterwards
+        self._broken = True
+        if self._process is not None:
+            # an idle worker exits on its own once stdin is closed
+            if self._process.stdin is not None and not self._process.stdin.is_closing():
+                self._process.stdin.close()
+            await terminate_process_tree(self._process)
+            process_reaper.discard(self._process.pid)
+
+        if self._stderr_task is not None:
+            # processes which escaped the process group might still hold the pipe open, so do not wait forever
+            _, pending = await asyncio.wait([self._stderr_task], timeout=TERMINATE_GRACE_SECONDS)
+            for task in pending:
+                task.cancel()
+
+    async def _send(self, kind: bytes, payload: bytes):
+        assert self._process is not None and self._process.stdin is not None  # noqa: S101
+        self._process.stdin.write(sandbox_worker.HEADER.pack(kind, len(payload)) + payload)
+        await self._process.stdin.drain()
+
+    async def _receive(self) -> tuple[bytes, bytes]:
+        assert self._process is not None and self._process.stdout is not None  # noqa: S101
+        try:
+            header = await self._process.stdout.readexactly(sandbox_worker.HEADER.size)
+            kind, length = sandbox_worker.HEADER.unpack(header)
+            return kind, await self._process.stdout.readexactly(length)
+        except BaseException:
+            # the stream is in an unknown state now, this worker can not be used anymore
+            self._broken = True
+            raise
+
+    async def _drain_stderr(self):
+        assert self._process is not None and self._process.stderr is not None  # noqa: S101
+        while chunk := await self._process.stderr.read(MAX_WORKER_STDERR_BYTES):
+            self._stderr.extend(chunk)
+            del self._stderr[:-MAX_WORKER_STDERR_BYTES]
+
+
+class WorkerPool(BaseModel):
+    """
+    Keeps `settings.worker_pool_size` sandbox workers started, so executions do not have to wait for the sandbox to start.
+
+    Every run is executed in a fresh process forked from the worker, so runs can not influence each other.
+    Workers are still recycled after `settings.worker_max_runs` runs, after they crashed / timed out or if the executed
+    code left processes behind. If no worker is available, a new one is started on demand.
+    """
+
+    settings: Settings
+    workspaces: WorkspaceManager
+
+    _idle: deque[SandboxWorker] = PrivateAttr(default_factory=deque)
+    _starting: int = PrivateAttr(0)
+    _resets: set[asyncio.Task] = PrivateAttr(default_factory=set)
+    _tasks: set[asyncio.Task] = PrivateAttr(default_factory=set)
+    _closed: bool = PrivateAttr(False)
+
+    async def start(self):
+        self._closed = False
+        self._refill()
+
+    async def stop(self):
+        self._closed = True
+        await asyncio.gather(*self._resets, *self._tasks, return_exceptions=True)
+
+        while self._idle:
+            await self._idle.popleft().stop()
+
+    async def acquire(self, modules: frozenset[str] = frozenset()) -> SandboxWorker:
+        """
+        Prefers the idle worker which has the most of `modules` loaded already, the longest idle one otherwise.
+        """
+
+        worker = None
+        while worker is None:
+            for candidate in self._idle:
+                if not candidate.alive:
+                    self._background(candidate.stop())
+            self._idle = deque(candidate for candidate in self._idle if candidate.alive)
+
+            if self._idle:
+                # `max()` keeps the first of equally good workers
+                worker = max(self._idle, key=lambda candidate: len(modules & candidate.modules))
+                self._idle = deque(candidate for candidate in self._idle if candidate is not worker)
+
+            # resetting a workspace is a lot faster than starting a new worker
+            if worker is None and self._resets:
+                await asyncio.wait(self._resets, return_when=asyncio.FIRST_COMPLETED)
+            elif worker is None:
+                worker = await self._start_worker()
+
+        self._refill()
+        return worker
+
+    async def release(self, worker: SandboxWorker):
+        """
+        Give the worker back. Its workspace is reset in the background, so the caller does not have to wait for it.
+        """
+
+        reusable = (
+            worker.alive
+            and worker.runs < self.settings.worker_max_runs
+            and len(self._idle) + len(self._resets) < self.settings.worker_pool_size
+            and not self._closed
+        )
+
+        if reusable:
+            task = asyncio.create_task(self._reset(worker))
+            self._resets.add(task)
+            task.add_done_callback(self._resets.discard)
+        else:
+            self._background(worker.stop())
+            self._refill()
+
+    async def _reset(self, worker: SandboxWorker):
+        try:
+            with tracer.start_as_current_span("workspace_reset"):
+                await asyncio.to_thread(worker.reset)
+        except OSError:
+            logger.warning("Could not reset the workspace of a sandbox worker, recycling it", exc_info=True)
+            await worker.stop()
+            self._refill()
+            return
+
+        if self._closed:
+            await worker.stop()
+        else:
+            self._idle.append(worker)
+
+    async def _start_worker(self) -> SandboxWorker:
+        worker = SandboxWorker(settings=self.settings, workspaces=self.workspaces)
+        await worker.start()
+        return worker
+
+    def _refill(self):
+        missing = self.settings.worker_pool_size - len(self._idle) - len(self._resets) - self._starting
+        for _ in range(max(missing, 0)):
+            if self._closed:
+                return
+            self._starting += 1
+            self._background(self._add_idle_worker())
+
+    async def _add_idle_worker(self):
+        try:
+            worker = await self._start_worker()
+        except SandboxWorkerError:
+            logger.error("Could not start a sandbox worker for the pool", exc_info=True)
+            return
+        finally:
+            self._starting -= 1
+
+        if self._closed:
+            await worker.stop()
+        else:
+            self._idle.append(worker)
+
+    def _background(self, coroutine: Coroutine):
+        # keep a reference, so the task is not garbage collected while running
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
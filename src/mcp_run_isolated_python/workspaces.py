@@ -0,0 +1,123 @@
+import asyncio
+import shutil
+import uuid
+from collections import deque
+from collections.abc import Coroutine
+from pathlib import Path
+
+from pydantic import BaseModel, PrivateAttr
+
+from mcp_run_isolated_python.utils.logger import get_logger
+from mcp_run_isolated_python.utils.settings import Settings
+
+logger = get_logger(__name__)
+
+
+class WorkspaceManager(BaseModel):
+    """
+    Hands out the scratch directories the sandbox workers run in, so creating & removing them is off the critical path.
+
+    `settings.workspace_pool_size` empty workspaces are created ahead of time. Used workspaces are removed in the
+    background. Everything in the workspace directory is removed on startup - leftovers of crashed servers.
+    """
+
+    settings: Settings
+
+    _idle: deque[Path] = PrivateAttr(default_factory=deque)
+    _creating: int = PrivateAttr(0)
+    _tasks: set[asyncio.Task] = PrivateAttr(default_factory=set)
+    _closed: bool = PrivateAttr(False)
+
+    @property
+    def directory(self) -> Path:
+        # workspaces live in a dedicated directory, so the startup sweep never touches anything else
+        return self.settings.workspace_directory or self.settings.working_directory / "workspaces"
+
+    async def start(self):
+        self._closed = False
+        await asyncio.to_thread(self._sweep)
+        self._refill()
+
+    async def stop(self):
+        self._closed = True
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        paths, self._idle = list(self._idle), deque()
+        await asyncio.to_thread(self._remove, paths)
+
+    async def acquire(self) -> Path:
+        """
+        Get an empty workspace, which contains only an empty `output` directory.
+        """
+
+        if self._idle:
+            path = self._idle.popleft()
+        else:
+            path = await asyncio.to_thread(self._create)
+
+        self._refill()
+        return path
+
+    def release(self, path: Path):
+        """
+        Remove the workspace in the background.
+        """
+
+        spill_paths = [self.spill_path(path, stream) for stream in ("stdout", "stderr")]
+        self._background(asyncio.to_thread(self._remove, [path, *spill_paths]))
+
+    @staticmethod
+    def spill_path(path: Path, stream: str) -> Path:
+        # the complete output of a run, stored next to the workspace, so the executed code can not touch it
+        return path.with_name(f"{path.name}.{stream}.txt")
+
+    def _create(self) -> Path:
+        path = self.directory / uuid.uuid4().hex
+        (path / "output").mkdir(parents=True)
+        return path
+
+    def _sweep(self):
+        if not self.directory.exists():
+            return
+
+        orphans = list(self.directory.iterdir())
+        if orphans:
+            logger.info("Removing workspaces left behind by an earlier run", count=len(orphans))
+        self._remove(orphans)
+
+    @staticmethod
+    def _remove(paths: list[Path]):
+        for path in paths:
+            if path.is_dir() and not path.is_symlink():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+
+    def _refill(self):
+        missing = self.settings.workspace_pool_size - len(self._idle) - self._creating
+        for _ in range(max(missing, 0)):
+            if self._closed:
+                return
+            self._creating += 1
+            self._background(self._add_idle_workspace())
+
+    async def _add_idle_workspace(self):
+        try:
+            path = await asyncio.to_thread(self._create)
+        except OSError:
+            logger.error("Could not create a workspace", exc_info=True)
+            return
+        finally:
+            self._creating -= 1
+
+        if self._closed:
+            await asyncio.to_thread(self._remove, [path])
+        else:
+            self._idle.append(path)
+
+    def _background(self, coroutine: Coroutine):
+        # keep a reference, so the task is not garbage collected while running
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
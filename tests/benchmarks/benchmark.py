@@ -0,0 +1,356 @@
+"""
+Latency & throughput benchmark of code executions, either through the `CodeExecutor` directly or through the MCP server.
+
+Examples:
+    `python tests/benchmarks/benchmark.py --fake-srt --concurrency 1 --concurrency 8 --output results.json`
+    `python tests/benchmarks/benchmark.py --target http --requests 200 --worker-pool-size 8`
+
+With `--fake-srt`, `srt` is replaced by a local stand-in which runs the code without any sandbox, so only the overhead
+of the server itself is measured. This works on machines without the sandbox as well.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import resource
+import socket
+import subprocess  # noqa: S404
+import sys
+import tempfile
+import time
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from typing import Annotated, Literal
+from unittest.mock import MagicMock
+
+import typer
+from fastmcp import Client, Context
+from pydantic import BaseModel
+from rich.console import Console
+from rich.table import Table
+
+from mcp_run_isolated_python.code_executor import CodeExecutor
+from mcp_run_isolated_python.utils.logger import configure_logging
+from mcp_run_isolated_python.utils.settings import SandboxBackend, Settings
+
+Target = Literal["executor", "http"]
+
+FAKE_SRT_DIRECTORY = Path(__file__).parent / "fake_srt"
+
+# started in its own process, so its memory can be measured separately
+SERVER_SCRIPT = """
+import sys
+from mcp_run_isolated_python.mcp_server import run_mcp
+from mcp_run_isolated_python.utils.logger import configure_logging
+from mcp_run_isolated_python.utils.settings import Settings
+
+settings = Settings.model_validate_json(sys.argv[1])
+configure_logging(settings.log_level, settings.log_format, settings.log_max_field_length, settings.log_sample_every)
+run_mcp(settings=settings)
+"""
+
+
+class BenchmarkResult(BaseModel):
+    target: Target
+    concurrency: int
+    requests: int
+    errors: int
+    duration_seconds: float
+    throughput_per_second: float
+    latency_p50_seconds: float
+    latency_p95_seconds: float
+    latency_p99_seconds: float
+    latency_mean_seconds: float
+    latency_max_seconds: float
+    # peak since the start of the benchmark, not of this concurrency level
+    peak_rss_bytes: int | None
+    peak_sandbox_rss_bytes: int | None
+
+
+class BenchmarkReport(BaseModel):
+    commit: str | None
+    python_version: str
+    platform: str
+    cpu_count: int | None
+    fake_srt: bool
+    python_code: str
+    settings: dict
+    results: list[BenchmarkResult]
+
+
+def percentile(values: list[float], percent: float) -> float:
+    # nearest rank, so the value was actually measured
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+async def measure(
+    call: Callable[[], Awaitable[bool]], target: Target, concurrency: int, requests: int
+) -> BenchmarkResult:
+    """
+    Run `call` `requests` times, with `concurrency` calls at a time. `call` returns whether it succeeded.
+    """
+
+    latencies: list[float] = []
+    errors = 0
+    remaining = requests
+
+    async def client():
+        nonlocal errors, remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                succeeded = await call()
+            except Exception:
+                succeeded = False
+            latencies.append(time.perf_counter() - started)
+            errors += not succeeded
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+
+    return BenchmarkResult(
+        target=target,
+        concurrency=concurrency,
+        requests=requests,
+        errors=errors,
+        duration_seconds=duration,
+        throughput_per_second=requests / duration,
+        latency_p50_seconds=percentile(latencies, 50),
+        latency_p95_seconds=percentile(latencies, 95),
+        latency_p99_seconds=percentile(latencies, 99),
+        latency_mean_seconds=sum(latencies) / len(latencies),
+        latency_max_seconds=max(latencies),
+        peak_rss_bytes=None,
+        peak_sandbox_rss_bytes=None,
+    )
+
+
+async def benchmark_executor(
+    settings: Settings, python_code: str, concurrency_levels: list[int], requests: int, warmup: int
+) -> list[BenchmarkResult]:
+    code_executor = CodeExecutor(settings=settings)
+    await code_executor.start()
+    # logs are streamed to the client, there is none here
+    ctx = MagicMock(spec=Context)
+
+    async def call() -> bool:
+        responses = await code_executor.run_python_code(python_code, ctx=ctx)
+        return responses[0].status == "success"
+
+    results = []
+    try:
+        if warmup:
+            await measure(call, "executor", concurrency=1, requests=warmup)
+        for concurrency in concurrency_levels:
+            result = await measure(call, "executor", concurrency=concurrency, requests=requests)
+            # ru_maxrss is in KiB on linux; the sandboxed processes are children of this process
+            result.peak_rss_bytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            result.peak_sandbox_rss_bytes = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+            results.append(result)
+    finally:
+        await code_executor.stop()
+    return results
+
+
+async def benchmark_http(
+    settings: Settings, python_code: str, concurrency_levels: list[int], requests: int, warmup: int
+) -> list[BenchmarkResult]:
+    server = subprocess.Popen([sys.executable, "-c", SERVER_SCRIPT, settings.model_dump_json()])  # noqa: S603, ASYNC220
+
+    results = []
+    try:
+        client = Client(
+            f"http://{settings.host}:{settings.port}{settings.path}", timeout=settings.code_timeout_seconds * 2
+        )
+        await _wait_until_ready(server, client)
+
+        async def call() -> bool:
+            result = await client.call_tool("run_python_code", {"python_code": python_code}, raise_on_error=False)
+            return not result.is_error and '"status":"success"' in result.content[0].text
+
+        async with client:
+            if warmup:
+                await measure(call, "http", concurrency=1, requests=warmup)
+            for concurrency in concurrency_levels:
+                result = await measure(call, "http", concurrency=concurrency, requests=requests)
+                result.peak_rss_bytes = _peak_rss_of(server.pid)
+                results.append(result)
+    finally:
+        server.terminate()
+        await asyncio.to_thread(server.wait)
+    return results
+
+
+async def _wait_until_ready(server: subprocess.Popen, client: Client, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while True:
+        if server.poll() is not None:
+            raise RuntimeError(f"The MCP server exited with code {server.returncode}")
+        try:
+            async with client:
+                await client.list_tools()
+            return
+        except Exception:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+def _peak_rss_of(pid: int) -> int | None:
+    # linux only
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+    except OSError:
+        return None
+    for line in status.splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1]) * 1024
+    return None
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def _current_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],  # noqa: S607
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def use_fake_srt():
+    """
+    Put the stand-in for `srt` first on the PATH. The sandbox workers only inherit PATH.
+    """
+
+    os.environ["PATH"] = f"{FAKE_SRT_DIRECTORY}{os.pathsep}{os.environ.get('PATH', '')}"
+
+
+def print_results(results: list[BenchmarkResult]):
+    table = Table(title="Benchmark results")
+    for column in ("Target", "Concurrency", "Requests", "Errors", "Throughput/s", "p50", "p95", "p99", "Peak RSS"):
+        table.add_column(column, justify="right")
+    for result in results:
+        table.add_row(
+            result.target,
+            str(result.concurrency),
+            str(result.requests),
+            str(result.errors),
+            f"{result.throughput_per_second:.1f}",
+            f"{result.latency_p50_seconds * 1000:.1f} ms",
+            f"{result.latency_p95_seconds * 1000:.1f} ms",
+            f"{result.latency_p99_seconds * 1000:.1f} ms",
+            f"{result.peak_rss_bytes / 1024 / 1024:.1f} MiB" if result.peak_rss_bytes is not None else "-",
+        )
+    Console().print(table)
+
+
+def run(
+    target: Annotated[
+        Target,
+        "What to benchmark: the `CodeExecutor` directly, or the whole MCP server over http.",
+    ] = "executor",
+    concurrency: Annotated[
+        list[int] | None,
+        "The number of concurrent requests. Can be given multiple times, each level is measured separately. Default: `1, 4, 16`",
+    ] = None,
+    requests: Annotated[
+        int,
+        "How many requests to send per concurrency level.",
+    ] = 50,
+    warmup: Annotated[
+        int,
+        "How many requests to send before measuring.",
+    ] = 5,
+    python_code: Annotated[
+        str,
+        "The code to execute.",
+    ] = 'print("hello world")',
+    fake_srt: Annotated[
+        bool,
+        "Replace `srt` with a local stand-in, which runs the code without any sandbox. Measures only the overhead of the server.",
+    ] = False,
+    sandbox_backend: Annotated[
+        SandboxBackend,
+        "Take a look at `--sandbox-backend` of the server, e.g. to compare the spawn latency of both. Not with `--fake-srt`.",
+    ] = "srt",
+    path_to_python: Annotated[
+        Path | None,
+        "The python executable to run the code with. Default: the one running the benchmark.",
+    ] = None,
+    worker_pool_size: Annotated[
+        int,
+        "Take a look at `--mcp-worker-pool-size` of the server.",
+    ] = 0,
+    workspace_directory: Annotated[
+        Path | None,
+        "Take a look at `--mcp-workspace-directory` of the server.",
+    ] = None,
+    output: Annotated[
+        Path | None,
+        "Save the results as json to this file, to compare them between commits.",
+    ] = None,
+):
+    concurrency_levels = concurrency or [1, 4, 16]
+    if fake_srt:
+        use_fake_srt()
+
+    with tempfile.TemporaryDirectory(prefix="mcp-run-isolated-python-benchmark-") as working_directory:
+        settings = Settings.using_defaults().model_copy(
+            update={
+                "port": _free_port(),
+                "log_level": logging.WARNING,
+                "path_to_python_interpreter": path_to_python or Path(sys.executable),
+                "sandbox_backend": sandbox_backend,
+                "working_directory": Path(working_directory),
+                "max_concurrent_executions": max(concurrency_levels),
+                "worker_pool_size": worker_pool_size,
+                "workspace_directory": workspace_directory,
+            }
+        )
+        configure_logging(settings.log_level)
+
+        benchmark = benchmark_executor if target == "executor" else benchmark_http
+        results = asyncio.run(
+            benchmark(
+                settings,
+                python_code=python_code,
+                concurrency_levels=concurrency_levels,
+                requests=requests,
+                warmup=warmup,
+            )
+        )
+
+    print_results(results)
+    if output is not None:
+        report = BenchmarkReport(
+            commit=_current_commit(),
+            python_version=platform.python_version(),
+            platform=platform.platform(),
+            cpu_count=os.cpu_count(),
+            fake_srt=fake_srt,
+            python_code=python_code,
+            settings=settings.model_dump(mode="json"),
+            results=results,
+        )
+        output.write_text(json.dumps(report.model_dump(mode="json"), indent=2))
+
+
+if __name__ == "__main__":
+    typer.run(run)
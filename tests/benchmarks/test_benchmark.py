@@ -0,0 +1,31 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from mcp_run_isolated_python.utils.settings import Settings
+from tests.benchmarks.benchmark import FAKE_SRT_DIRECTORY, benchmark_executor, percentile
+
+
+def test_percentile() -> None:
+    values = [float(value) for value in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 95) == 3
+
+
+async def test_benchmark_executor(settings: Settings, monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.setenv("PATH", f"{FAKE_SRT_DIRECTORY}{os.pathsep}{os.environ.get('PATH', '')}")
+    settings.working_directory = tmp_path
+    settings.max_concurrent_executions = 2
+
+    results = await benchmark_executor(
+        settings, python_code='print("hi")', concurrency_levels=[1, 2], requests=4, warmup=1
+    )
+
+    assert [result.concurrency for result in results] == [1, 2]
+    for result in results:
+        assert result.requests == 4
+        assert result.errors == 0
+        assert 0 < result.latency_p50_seconds <= result.latency_p95_seconds <= result.latency_p99_seconds
+        assert result.peak_rss_bytes
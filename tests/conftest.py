@@ -1,7 +1,12 @@
+from collections.abc import AsyncIterator
+
 import pytest
 
 from mcp_run_isolated_python.code_executor import CodeExecutor
+from mcp_run_isolated_python.sessions import SessionManager
 from mcp_run_isolated_python.utils.settings import Settings
+from mcp_run_isolated_python.worker_pool import WorkerPool
+from mcp_run_isolated_python.workspaces import WorkspaceManager
 
 
 @pytest.fixture
@@ -10,6 +15,38 @@ def settings() -> Settings:
 
 
 @pytest.fixture
-def code_executor(settings: Settings) -> CodeExecutor:
+async def code_executor(settings: Settings) -> AsyncIterator[CodeExecutor]:
     code_executor = CodeExecutor(settings=settings)
-    return code_executor
+    yield code_executor
+
+    # stop all sandbox workers which are still running or being recycled in the background
+    await code_executor.stop()
+
+
+@pytest.fixture
+async def workspaces(settings: Settings) -> AsyncIterator[WorkspaceManager]:
+    workspaces = WorkspaceManager(settings=settings)
+    await workspaces.start()
+    yield workspaces
+
+    await workspaces.stop()
+
+
+@pytest.fixture
+async def worker_pool(settings: Settings, workspaces: WorkspaceManager) -> AsyncIterator[WorkerPool]:
+    settings.worker_pool_size = 1
+    settings.worker_max_runs = 2
+    worker_pool = WorkerPool(settings=settings, workspaces=workspaces)
+    yield worker_pool
+
+    await worker_pool.stop()
+
+
+@pytest.fixture
+async def session_manager(settings: Settings, workspaces: WorkspaceManager) -> AsyncIterator[SessionManager]:
+    settings.session_mode = True
+    settings.max_sessions = 2
+    session_manager = SessionManager(settings=settings, workspaces=workspaces)
+    yield session_manager
+
+    await session_manager.stop()
@@ -0,0 +1,127 @@
+import json
+import shutil
+import textwrap
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from fastmcp import Context
+
+from mcp_run_isolated_python.bwrap import BwrapError, bwrap_command
+from mcp_run_isolated_python.code_executor import CodeExecutionResult, CodeExecutor
+from mcp_run_isolated_python.utils.settings import Settings
+
+
+def write_srt_settings(path: Path, network: dict | None = None, filesystem: dict | None = None) -> Path:
+    path.write_text(json.dumps({"network": network or {}, "filesystem": filesystem or {}}))
+    return path
+
+
+def mounts(cmd: list[str], option: str) -> list[str]:
+    return [cmd[index + 2] for index, arg in enumerate(cmd) if arg == option]
+
+
+def test_command(tmp_path: Path) -> None:
+    workspace = tmp_path / "workspace"
+    (workspace / "readonly").mkdir(parents=True)
+    (tmp_path / "secrets").mkdir()
+    (tmp_path / "secret.txt").write_text("secret")
+    srt_settings = write_srt_settings(
+        tmp_path / "srt.json",
+        filesystem={
+            "denyRead": [str(tmp_path / "secrets"), str(tmp_path / "secret.txt"), str(tmp_path / "missing")],
+            "allowWrite": ["."],
+            "denyWrite": ["./readonly"],
+        },
+    )
+
+    cmd = bwrap_command(srt_settings, "python -c 'print(1)'", workspace=workspace)
+
+    assert cmd[0] == "bwrap"
+    assert "--unshare-net" in cmd
+    assert cmd[-3:] == ["/bin/sh", "-c", "python -c 'print(1)'"]
+    assert cmd[cmd.index("--chdir") + 1] == str(workspace)
+    assert mounts(cmd, "--bind") == [str(workspace.resolve())]
+    assert str((workspace / "readonly").resolve()) in mounts(cmd, "--ro-bind")
+    # directories are hidden by an empty one, files by `/dev/null`
+    assert str((tmp_path / "secrets").resolve()) in [
+        cmd[index + 1] for index, arg in enumerate(cmd) if arg == "--tmpfs"
+    ]
+    assert str((tmp_path / "secret.txt").resolve()) in mounts(cmd, "--ro-bind")
+    assert str(tmp_path / "missing") not in cmd
+
+
+def test_without_workspace(tmp_path: Path) -> None:
+    srt_settings = write_srt_settings(tmp_path / "srt.json", filesystem={"allowWrite": ["."]})
+
+    # e.g. for the pre-check, nothing is writable
+    cmd = bwrap_command(srt_settings, "true")
+    assert mounts(cmd, "--bind") == []
+    assert "--chdir" not in cmd
+
+
+def test_allowed_domains_are_not_supported(tmp_path: Path) -> None:
+    srt_settings = write_srt_settings(tmp_path / "srt.json", network={"allowedDomains": ["pypi.org"]})
+
+    with pytest.raises(BwrapError, match="allowedDomains"):
+        bwrap_command(srt_settings, "true")
+
+
+@pytest.mark.skipif(shutil.which("bwrap") is None, reason="needs bubblewrap")
+@pytest.mark.parametrize(
+    "code,expected_partial_error",
+    [
+        pytest.param(
+            """
+            with open("/tmp/file.txt", "w") as f:
+                f.write("hi")
+            """,
+            "OSError: [Errno 30] Read-only file system",
+            id="file write",
+        ),
+        pytest.param(
+            """
+            import socket
+            socket.create_connection(("1.1.1.1", 80), timeout=5)
+            """,
+            "OSError: [Errno 101] Network is unreachable",
+            id="network request",
+        ),
+    ],
+)
+async def test_isolation(code: str, expected_partial_error: str, settings: Settings) -> None:
+    settings.sandbox_backend = "bwrap"
+    code_executor = CodeExecutor(settings=settings)
+
+    responses = await code_executor.run_python_code(
+        python_code=textwrap.dedent(code).strip(), ctx=MagicMock(spec=Context)
+    )
+    await code_executor.stop()
+
+    assert len(responses) == 1
+    assert isinstance(responses[0], CodeExecutionResult)
+    assert responses[0].status == "failure"
+    assert expected_partial_error in (responses[0].error or "")
+
+
+@pytest.mark.skipif(shutil.which("bwrap") is None, reason="needs bubblewrap")
+async def test_workspace_is_writable(settings: Settings, tmp_path: Path) -> None:
+    (tmp_path / "secrets").mkdir()
+    (tmp_path / "secrets" / "key").write_text("secret")
+    settings.path_to_srt_settings = write_srt_settings(
+        tmp_path / "srt.json", filesystem={"denyRead": [str(tmp_path / "secrets")], "allowWrite": ["."]}
+    )
+    settings.sandbox_backend = "bwrap"
+    code_executor = CodeExecutor(settings=settings)
+
+    code = textwrap.dedent(f"""
+    import os
+    with open("output/data.txt", "w") as f:
+        f.write("hi")
+    print(os.listdir({str(tmp_path / "secrets")!r}))
+    """)
+    responses = await code_executor.run_python_code(python_code=code, ctx=MagicMock(spec=Context))
+    await code_executor.stop()
+
+    assert responses[0] == CodeExecutionResult(status="success", output="[]")
+    assert len(responses) == 2
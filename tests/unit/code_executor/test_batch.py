@@ -0,0 +1,82 @@
+import textwrap
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from fastmcp import Context
+from fastmcp.utilities.types import File
+
+from mcp_run_isolated_python.code_executor import BatchItemResult, CodeExecutor
+from mcp_run_isolated_python.utils.settings import Settings
+
+
+async def test_batch(settings: Settings) -> None:
+    settings.code_timeout_seconds = 1
+    settings.max_concurrent_executions = 4
+    code_executor = CodeExecutor(settings=settings)
+    context_mock = MagicMock(spec=Context)
+
+    codes = [
+        # slow items do not hold up the others
+        "import time; time.sleep(5)",
+        'print("hi")',
+        "raise ValueError('oops')",
+        textwrap.dedent("""
+        with open("./output/file.txt", "w") as f:
+            f.write("hi")
+        print("file")
+        """).strip(),
+    ]
+    start = time.monotonic()
+    responses = await code_executor.run_python_code_batch(python_codes=codes, ctx=context_mock)
+    duration = time.monotonic() - start
+    await code_executor.stop()
+
+    assert duration < 5
+    assert len(responses) == 5
+    timed_out, success, failure, with_file, file = responses
+    assert isinstance(timed_out, BatchItemResult)
+    assert timed_out.index == 0
+    assert timed_out.status == "failure"
+    assert "TimeoutError" in (timed_out.error or "")
+    assert success == BatchItemResult(index=1, status="success", output="hi", error=None)
+    assert isinstance(failure, BatchItemResult)
+    assert failure.index == 2
+    assert "ValueError: oops" in (failure.error or "")
+    assert with_file == BatchItemResult(index=3, status="success", output="file", error=None)
+    assert isinstance(file, File)
+    assert file.data == b"hi"
+
+
+@pytest.mark.parametrize(
+    "batch_max_concurrency,min_duration,max_duration",
+    [
+        pytest.param(3, 1, 2.5, id="runs in parallel"),
+        pytest.param(1, 3, 10, id="respects the concurrency limit"),
+    ],
+)
+async def test_batch_concurrency(
+    batch_max_concurrency: int, min_duration: float, max_duration: float, settings: Settings
+) -> None:
+    settings.batch_max_concurrency = batch_max_concurrency
+    settings.max_concurrent_executions = 3
+    code_executor = CodeExecutor(settings=settings)
+    context_mock = MagicMock(spec=Context)
+
+    start = time.monotonic()
+    responses = await code_executor.run_python_code_batch(
+        python_codes=["import time; time.sleep(1)"] * 3, ctx=context_mock
+    )
+    duration = time.monotonic() - start
+    await code_executor.stop()
+
+    assert [response.status for response in responses if isinstance(response, BatchItemResult)] == ["success"] * 3
+    assert min_duration <= duration <= max_duration
+
+
+async def test_batch_size_limit(code_executor: CodeExecutor, settings: Settings) -> None:
+    settings.max_batch_size = 2
+    context_mock = MagicMock(spec=Context)
+
+    with pytest.raises(ValueError, match="Too many code snippets"):
+        await code_executor.run_python_code_batch(python_codes=["print(1)"] * 3, ctx=context_mock)
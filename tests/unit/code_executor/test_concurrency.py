@@ -0,0 +1,45 @@
+import asyncio
+import textwrap
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from fastmcp import Context
+
+from mcp_run_isolated_python.code_executor import CodeExecutionResult, CodeExecutor
+from mcp_run_isolated_python.utils.settings import Settings
+
+
+@pytest.mark.parametrize(
+    "max_concurrent_executions,min_duration,max_duration",
+    [
+        pytest.param(3, 1, 2.5, id="runs in parallel"),
+        pytest.param(1, 3, 10, id="respects the concurrency limit"),
+    ],
+)
+async def test_concurrency(
+    max_concurrent_executions: int, min_duration: float, max_duration: float, settings: Settings
+) -> None:
+    context_mock = MagicMock(spec=Context)
+    settings.max_concurrent_executions = max_concurrent_executions
+    code_executor = CodeExecutor(settings=settings)
+
+    code = textwrap.dedent("""
+    import time
+    time.sleep(1)
+    print("done")
+    """).strip()
+
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *[code_executor.run_python_code(python_code=code, ctx=context_mock) for _ in range(3)]
+    )
+    duration = time.perf_counter() - start
+    await code_executor.stop()
+
+    assert min_duration <= duration <= max_duration
+    for responses in results:
+        response = responses[0]
+        assert isinstance(response, CodeExecutionResult)
+        assert response.status == "success"
+        assert response.output == "done"
@@ -1,11 +1,14 @@
 import os
 import textwrap
+import time
 from unittest import mock
 from unittest.mock import MagicMock
 
 import pytest
+from fastmcp import Context
 
 from mcp_run_isolated_python.code_executor import CodeExecutionResult, CodeExecutor
+from mcp_run_isolated_python.utils.settings import Settings
 
 
 @pytest.mark.parametrize(
@@ -67,11 +70,13 @@ from mcp_run_isolated_python.code_executor import CodeExecutionResult, CodeExecu
         ),
     ],
 )
-def test_failure(code: str, expected_output: str, expected_partial_error: str, code_executor: CodeExecutor) -> None:
-    context_mock = MagicMock()
+async def test_failure(
+    code: str, expected_output: str, expected_partial_error: str, code_executor: CodeExecutor
+) -> None:
+    context_mock = MagicMock(spec=Context)
 
     code = textwrap.dedent(code).strip()
-    responses = code_executor.run_python_code(python_code=code, ctx=context_mock)
+    responses = await code_executor.run_python_code(python_code=code, ctx=context_mock)
 
     # first item is the code execution result, the rest are files
     response = responses.pop(0)
@@ -91,8 +96,8 @@ def test_failure(code: str, expected_output: str, expected_partial_error: str, c
     assert len(responses) == 0
 
 
-def test_env_vars_failure(code_executor: CodeExecutor, monkeypatch: pytest.MonkeyPatch) -> None:
-    context_mock = MagicMock()
+async def test_env_vars_failure(code_executor: CodeExecutor, monkeypatch: pytest.MonkeyPatch) -> None:
+    context_mock = MagicMock(spec=Context)
 
     with mock.patch.dict(os.environ):
         monkeypatch.setenv("TEST_ENV", "hi")
@@ -101,10 +106,50 @@ def test_env_vars_failure(code_executor: CodeExecutor, monkeypatch: pytest.Monke
         import os
         print(os.environ["TEST_ENV"])
         """).strip()
-        responses = code_executor.run_python_code(python_code=code, ctx=context_mock)
+        responses = await code_executor.run_python_code(python_code=code, ctx=context_mock)
 
         assert len(responses) == 1
         assert isinstance(responses[0], CodeExecutionResult)
         assert responses[0].status == "failure"
         assert isinstance(responses[0].error, str)
         assert "KeyError: 'TEST_ENV'" in responses[0].error
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        pytest.param(
+            """
+            import time
+            print("started", flush=True)
+            time.sleep(10)
+            """,
+            id="sleeping",
+        ),
+        pytest.param(
+            """
+            print("started", flush=True)
+            while True:
+                pass
+            """,
+            id="busy loop",
+        ),
+    ],
+)
+async def test_timeout(code: str, settings: Settings, code_executor: CodeExecutor) -> None:
+    context_mock = MagicMock(spec=Context)
+    settings.code_timeout_seconds = 1
+
+    start = time.perf_counter()
+    responses = await code_executor.run_python_code(python_code=textwrap.dedent(code).strip(), ctx=context_mock)
+
+    # the sandbox is actually killed, not waited for
+    assert time.perf_counter() - start < 5
+
+    assert len(responses) == 1
+    assert isinstance(responses[0], CodeExecutionResult)
+    assert responses[0].status == "failure"
+    # output until the timeout is kept
+    assert responses[0].output == "started"
+    assert isinstance(responses[0].error, str)
+    assert "TimeoutError" in responses[0].error
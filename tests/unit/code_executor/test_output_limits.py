@@ -0,0 +1,66 @@
+import textwrap
+from unittest.mock import MagicMock
+
+from fastmcp import Context
+from fastmcp.utilities.types import File
+
+from mcp_run_isolated_python.code_executor import CodeExecutionResult, CodeExecutor
+from mcp_run_isolated_python.output_capture import OutputCapture
+from mcp_run_isolated_python.utils.settings import Settings
+
+
+def test_output_capture_keeps_head_and_tail() -> None:
+    capture = OutputCapture(max_bytes=10)
+    for chunk in (b"0123", b"4567", b"89abcdef"):
+        capture.write(chunk)
+
+    assert capture.total_bytes == 16
+    assert capture.truncated_bytes == 6
+    assert capture.getvalue() == b"01234\n\n[... 6 bytes truncated ...]\n\nbcdef"
+
+
+def test_output_capture_short_output() -> None:
+    capture = OutputCapture(max_bytes=10)
+    capture.write(b"0123")
+    capture.write(b"456")
+
+    assert not capture.truncated
+    assert capture.getvalue() == b"0123456"
+
+
+async def test_output_is_truncated(settings: Settings) -> None:
+    settings.max_stdout_bytes = 100
+    settings.attach_truncated_output = True
+    code_executor = CodeExecutor(settings=settings)
+    context_mock = MagicMock(spec=Context)
+
+    code = textwrap.dedent("""
+    import sys
+    for i in range(10_000):
+        print(f"line {i}")
+    print("short", file=sys.stderr)
+    """).strip()
+    responses = await code_executor.run_python_code(python_code=code, ctx=context_mock)
+    await code_executor.stop()
+
+    result = responses.pop(0)
+    assert isinstance(result, CodeExecutionResult)
+    assert result.status == "success"
+    assert result.output.startswith("line 0\nline 1\n")
+    assert "bytes truncated ..." in result.output
+    assert result.output.endswith("line 9998\nline 9999")
+    assert result.error == "short"
+
+    # only the truncated stream is attached, complete
+    assert len(responses) == 1
+    assert isinstance(responses[0], File)
+    assert responses[0]._name == "stdout.txt"
+    assert responses[0].data == "".join(f"line {i}\n" for i in range(10_000)).encode()
+
+    # the spill files are removed again
+    assert not list(settings.working_directory.glob("*.txt"))
+
+    # streaming stops at the limit as well
+    streamed = [log_call.args[0] for log_call in context_mock.log.await_args_list]
+    assert streamed[-2:] == ["[... output truncated, streaming stopped ...]", "short"]
+    assert len("\n".join(line for line in streamed if line.startswith("line"))) <= 100
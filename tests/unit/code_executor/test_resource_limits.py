@@ -0,0 +1,92 @@
+import os
+import textwrap
+from unittest.mock import MagicMock
+
+import pytest
+from fastmcp import Context
+
+from mcp_run_isolated_python.code_executor import CodeExecutionResult, CodeExecutor
+from mcp_run_isolated_python.utils.settings import Settings
+
+
+async def run(settings: Settings, code: str) -> CodeExecutionResult:
+    code_executor = CodeExecutor(settings=settings)
+    context_mock = MagicMock(spec=Context)
+    context_mock.session_id = "session"
+    try:
+        responses = await code_executor.run_python_code(python_code=code, ctx=context_mock)
+    finally:
+        await code_executor.stop()
+    assert isinstance(responses[0], CodeExecutionResult)
+    return responses[0]
+
+
+async def test_memory_limit(settings: Settings) -> None:
+    settings.max_memory_bytes = 512 * 1024 * 1024
+    result = await run(settings, "data = bytearray(1024 * 1024 * 1024)")
+
+    assert result.status == "failure"
+    assert result.limit_exceeded == "memory"
+    assert "MemoryError" in (result.error or "")
+
+
+async def test_cpu_time_limit(settings: Settings) -> None:
+    settings.max_cpu_seconds = 1
+    settings.code_timeout_seconds = 20
+    result = await run(settings, "while True:\n    pass")
+
+    assert result.status == "failure"
+    assert result.limit_exceeded == "cpu_time"
+
+
+async def test_cpu_time_limit_in_session(settings: Settings) -> None:
+    settings.session_mode = True
+    settings.max_cpu_seconds = 1
+    settings.code_timeout_seconds = 20
+    result = await run(settings, "while True:\n    pass")
+
+    assert result.status == "failure"
+    assert result.limit_exceeded == "cpu_time"
+
+
+@pytest.mark.skipif(os.geteuid() == 0, reason="the process limit does not apply to root")
+async def test_process_limit(settings: Settings) -> None:
+    settings.max_processes = 1
+    code = textwrap.dedent("""
+    import subprocess
+    subprocess.run(["true"])
+    """).strip()
+    result = await run(settings, code)
+
+    assert result.limit_exceeded == "processes"
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        # a single file which is too large
+        'with open("./output/file.bin", "wb") as f:\n    f.write(b"0" * 2000)',
+        # all files together are too large
+        'for i in range(3):\n    with open(f"./output/file_{i}.bin", "wb") as f:\n        f.write(b"0" * 600)',
+    ],
+    ids=["file", "directory"],
+)
+async def test_output_size_limit(settings: Settings, code: str) -> None:
+    settings.max_output_directory_bytes = 1000
+    code_executor = CodeExecutor(settings=settings)
+    responses = await code_executor.run_python_code(python_code=code, ctx=MagicMock(spec=Context))
+    await code_executor.stop()
+
+    # the output files are discarded
+    assert len(responses) == 1
+    assert isinstance(responses[0], CodeExecutionResult)
+    assert responses[0].status == "failure"
+    assert responses[0].limit_exceeded == "output_size"
+
+
+async def test_timeout_is_reported_as_limit(settings: Settings) -> None:
+    settings.code_timeout_seconds = 1
+    result = await run(settings, "import time\ntime.sleep(5)")
+
+    assert result.limit_exceeded == "timeout"
+    assert "TimeoutError" in (result.error or "")
@@ -0,0 +1,99 @@
+import textwrap
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from fastmcp import Context
+from fastmcp.utilities.types import File
+from mcp.types import EmbeddedResource, TextResourceContents
+
+from mcp_run_isolated_python.code_executor import CodeExecutionResult, CodeExecutor
+from mcp_run_isolated_python.context_manager import code_sandbox
+from mcp_run_isolated_python.utils.settings import Settings
+
+
+async def test_result(code_executor: CodeExecutor) -> None:
+    code = textwrap.dedent("""
+    result({"a": 1})
+    # only the last one is returned
+    result({"values": [1.5, 2.5], "names": {"x"}})
+    print("done")
+    """)
+    responses = await code_executor.run_python_code(python_code=code, ctx=MagicMock(spec=Context))
+
+    assert responses[0] == CodeExecutionResult(status="success", output="done", return_value_format="json")
+    assert len(responses) == 2
+    block = responses[1]
+    assert isinstance(block, EmbeddedResource)
+    assert isinstance(block.resource, TextResourceContents)
+    assert block.resource.mime_type == "application/json"
+    assert block.resource.text == '{"values":[1.5,2.5],"names":["x"]}'
+
+
+async def test_result_failures(code_executor: CodeExecutor) -> None:
+    context_mock = MagicMock(spec=Context)
+
+    # not json serializable
+    responses = await code_executor.run_python_code(python_code="result(object())", ctx=context_mock)
+    assert len(responses) == 1
+    assert isinstance(responses[0], CodeExecutionResult)
+    assert responses[0].status == "failure"
+    assert "is not JSON serializable" in (responses[0].error or "")
+
+    # the value of a failed run is not returned
+    responses = await code_executor.run_python_code(python_code="result(1)\nraise ValueError", ctx=context_mock)
+    assert len(responses) == 1
+    assert isinstance(responses[0], CodeExecutionResult)
+    assert responses[0].return_value_format is None
+
+
+async def test_result_size_limit(settings: Settings) -> None:
+    settings.max_return_value_bytes = 100
+    code_executor = CodeExecutor(settings=settings)
+
+    responses = await code_executor.run_python_code(python_code="result('x' * 1000)", ctx=MagicMock(spec=Context))
+
+    assert len(responses) == 1
+    assert isinstance(responses[0], CodeExecutionResult)
+    assert responses[0].status == "failure"
+    assert responses[0].limit_exceeded == "return_value_size"
+    await code_executor.stop()
+
+
+async def test_last_expression(settings: Settings) -> None:
+    settings.return_last_expression = True
+    code = textwrap.dedent("""
+    values = [1, 2, 3]
+    sum(values)
+    """)
+
+    async with code_sandbox(settings=settings) as sandbox:
+        result = await sandbox.eval(code)
+        assert result.return_value_format == "json"
+        assert result.value() == 6
+
+        # `None` is not returned, neither are values which can not be serialized
+        result = await sandbox.eval("print('x')")
+        assert result.return_value is None
+        result = await sandbox.eval("object()")
+        assert result.status == "success"
+        assert result.return_value is None
+        assert "Could not return the value of the last expression" in (result.error or "")
+
+
+async def test_symlinks_are_not_followed(code_executor: CodeExecutor, tmp_path: Path) -> None:
+    secret = tmp_path / "secret.txt"
+    secret.write_text('"secret"')
+
+    code = textwrap.dedent(f"""
+    import os
+    os.symlink({str(secret)!r}, ".return_value.json")
+    os.symlink({str(secret)!r}, "output/secret.txt")
+    with open("output/data.txt", "w") as f:
+        f.write("hi")
+    """)
+    responses = await code_executor.run_python_code(python_code=code, ctx=MagicMock(spec=Context))
+
+    assert responses[0] == CodeExecutionResult(status="success", output="")
+    assert len(responses) == 2
+    assert isinstance(responses[1], File)
+    assert responses[1].data == b"hi"
@@ -0,0 +1,36 @@
+from unittest.mock import MagicMock
+
+from fastmcp import Context
+
+from mcp_run_isolated_python.code_executor import CodeExecutionResult, CodeExecutor
+from mcp_run_isolated_python.utils.settings import Settings
+from mcp_run_isolated_python.utils.startup import startup_profile
+
+
+async def test_ready_after_start(settings: Settings) -> None:
+    code_executor = CodeExecutor(settings=settings)
+    assert not code_executor.ready
+
+    try:
+        await code_executor.start()
+        assert code_executor.ready
+    finally:
+        await code_executor.stop()
+    assert not code_executor.ready
+
+    for phase in ("sandbox pre-check", "worker pool", "warm-up execution"):
+        assert phase in startup_profile.phases
+
+
+async def test_execution_waits_for_background_start(settings: Settings) -> None:
+    code_executor = CodeExecutor(settings=settings)
+    try:
+        code_executor.start_in_background()
+        responses = await code_executor.run_python_code(python_code="print('hi')", ctx=MagicMock(spec=Context))
+        assert code_executor.ready
+    finally:
+        await code_executor.stop()
+
+    assert isinstance(responses[0], CodeExecutionResult)
+    assert responses[0].status == "success"
+    assert responses[0].output == "hi"
@@ -0,0 +1,68 @@
+import textwrap
+from unittest.mock import MagicMock, call
+
+from fastmcp import Context
+
+from mcp_run_isolated_python.code_executor import CodeExecutor
+from mcp_run_isolated_python.output_streamer import MAX_LINE_BYTES, OutputStreamer
+from mcp_run_isolated_python.utils.settings import Settings
+
+
+async def test_output_is_streamed(code_executor: CodeExecutor) -> None:
+    context_mock = MagicMock(spec=Context)
+
+    code = textwrap.dedent("""
+    import sys
+    print("line 1")
+    print("warning", file=sys.stderr)
+    print("line 2")
+    print("no line break", end="")
+    """).strip()
+    await code_executor.run_python_code(python_code=code, ctx=context_mock)
+
+    # stdout & stderr are separate pipes, so only the order within a stream is guaranteed
+    calls = context_mock.log.await_args_list
+    assert [c for c in calls if c.kwargs["logger_name"] == "stdout"] == [
+        call("line 1", level="info", logger_name="stdout"),
+        call("line 2", level="info", logger_name="stdout"),
+        call("no line break", level="info", logger_name="stdout"),
+    ]
+    assert [c for c in calls if c.kwargs["logger_name"] == "stderr"] == [
+        call("warning", level="warning", logger_name="stderr"),
+    ]
+
+
+async def test_output_is_streamed_before_timeout(settings: Settings) -> None:
+    settings.code_timeout_seconds = 1
+    code_executor = CodeExecutor(settings=settings)
+    context_mock = MagicMock(spec=Context)
+
+    code = textwrap.dedent("""
+    import time
+    print("started")
+    time.sleep(5)
+    """).strip()
+    await code_executor.run_python_code(python_code=code, ctx=context_mock)
+    await code_executor.stop()
+
+    context_mock.log.assert_awaited_once_with("started", level="info", logger_name="stdout")
+
+
+async def test_long_lines_are_split() -> None:
+    context_mock = MagicMock(spec=Context)
+    streamer = OutputStreamer(ctx=context_mock)
+
+    await streamer.feed("stdout", b"a" * (MAX_LINE_BYTES + 1))
+    context_mock.log.assert_awaited_once_with("a" * MAX_LINE_BYTES, level="info", logger_name="stdout")
+
+    await streamer.flush()
+    assert context_mock.log.await_args_list[-1] == call("a", level="info", logger_name="stdout")
+
+
+async def test_streaming_stops_if_client_is_gone() -> None:
+    context_mock = MagicMock(spec=Context)
+    context_mock.log.side_effect = RuntimeError("client disconnected")
+    streamer = OutputStreamer(ctx=context_mock)
+
+    await streamer.feed("stdout", b"line 1\nline 2\n")
+    context_mock.log.assert_awaited_once()
@@ -3,6 +3,7 @@ from typing import Any
 from unittest.mock import MagicMock
 
 import pytest
+from fastmcp import Context
 from fastmcp.utilities.types import Audio, File, Image
 
 from mcp_run_isolated_python.code_executor import CodeExecutionResult, CodeExecutor
@@ -138,13 +139,13 @@ from mcp_run_isolated_python.code_executor import CodeExecutionResult, CodeExecu
         ),
     ],
 )
-def test_success(
+async def test_success(
     code: str, expected_output: str, expected_file_data: list[dict[str, Any]], code_executor: CodeExecutor
 ) -> None:
-    context_mock = MagicMock()
+    context_mock = MagicMock(spec=Context)
 
     code = textwrap.dedent(code).strip()
-    responses = code_executor.run_python_code(python_code=code, ctx=context_mock)
+    responses = await code_executor.run_python_code(python_code=code, ctx=context_mock)
 
     # first item is the code execution result, the rest are files
     response = responses.pop(0)
@@ -0,0 +1,54 @@
+import textwrap
+from pathlib import Path
+
+import pytest
+
+from mcp_run_isolated_python.context_manager import code_sandbox
+from mcp_run_isolated_python.utils.settings import Settings
+
+
+async def test_eval(settings: Settings) -> None:
+    code = textwrap.dedent("""
+    with open("output/data.csv", "w") as f:
+        f.write("a,b")
+    print("done")
+    """).strip()
+
+    async with code_sandbox(settings=settings) as sandbox:
+        result = await sandbox.eval(code)
+
+    assert result.status == "success"
+    assert result.output == "done"
+    assert len(result.files) == 1
+    assert result.files[0].name == "data.csv"
+    assert result.files[0].data == b"a,b"
+
+
+async def test_eval_many(settings: Settings) -> None:
+    codes = [f"print({i})" for i in range(5)] + ["open('output/x.txt', 'w').write('x')", "raise ValueError"]
+
+    async with code_sandbox(settings=settings) as sandbox:
+        results = await sandbox.eval_many(codes, batch_size=3)
+
+    assert [result.output for result in results[:5]] == [str(i) for i in range(5)]
+    assert [file.data for file in results[5].files] == [b"x"]
+    assert results[6].status == "failure"
+    assert "ValueError" in (results[6].error or "")
+
+
+async def test_large_files_are_read_on_demand(settings: Settings, tmp_path: Path) -> None:
+    settings.output_file_store_directory = tmp_path / "files"
+    settings.inline_output_file_max_bytes = 10
+
+    async with code_sandbox(settings=settings) as sandbox:
+        result = await sandbox.eval("open('output/large.bin', 'wb').write(bytes(100))")
+        file = result.files[0]
+        assert file.kind == "resource"
+        assert file.data is None
+        assert await sandbox.read_file(file) == bytes(100)
+
+
+async def test_url_with_options() -> None:
+    with pytest.raises(ValueError, match="can not be used with `url`"):
+        async with code_sandbox(url="http://localhost:6400/mcp", dependencies=["numpy"]):
+            pass
@@ -0,0 +1,135 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from fastmcp import Context
+
+from mcp_run_isolated_python.code_executor import CodeExecutionResult, CodeExecutor
+from mcp_run_isolated_python.dispatcher import Dispatcher
+from mcp_run_isolated_python.executor_daemon import ExecutorDaemon
+from mcp_run_isolated_python.utils.settings import InterpreterProfile, Settings
+
+
+@asynccontextmanager
+async def running_daemons(settings: Settings, directory: Path, count: int = 3) -> AsyncIterator[list[ExecutorDaemon]]:
+    daemons = []
+    try:
+        for index in range(count):
+            # daemons on the same host need their own workspaces, the startup sweep would remove the others'
+            daemon_settings = settings.model_copy(update={"workspace_directory": directory / f"workspaces-{index}"})
+            daemon = ExecutorDaemon(settings=daemon_settings, address=f"unix:{directory / f'daemon-{index}.sock'}")
+            await daemon.start()
+            daemons.append(daemon)
+
+        settings.executor_daemons = [daemon.address for daemon in daemons]
+        yield daemons
+    finally:
+        for daemon in daemons:
+            await daemon.stop()
+
+
+@asynccontextmanager
+async def running_code_executor(settings: Settings) -> AsyncIterator[CodeExecutor]:
+    code_executor = CodeExecutor(settings=settings)
+    await code_executor.start()
+    try:
+        yield code_executor
+    finally:
+        await code_executor.stop()
+
+
+async def run(code_executor: CodeExecutor, code: str, ctx: Context | None = None) -> CodeExecutionResult:
+    responses = await code_executor.run_python_code(python_code=code, ctx=ctx or MagicMock(spec=Context))
+    assert isinstance(responses[0], CodeExecutionResult)
+    return responses[0]
+
+
+async def test_execute_on_daemon(settings: Settings, tmp_path: Path) -> None:
+    async with running_daemons(settings, tmp_path), running_code_executor(settings) as code_executor:
+        assert code_executor.ready
+
+        ctx = MagicMock(spec=Context)
+        result = await run(code_executor, "print('hello from a daemon')", ctx=ctx)
+
+    assert result.status == "success"
+    assert result.output == "hello from a daemon"
+    # streamed through the daemon
+    ctx.log.assert_any_call("hello from a daemon", level="info", logger_name="stdout")
+
+
+async def test_unknown_profile_on_daemon(settings: Settings, tmp_path: Path) -> None:
+    async with running_daemons(settings, tmp_path, count=1) as daemons:
+        # only the server knows the profile
+        settings.profiles = {
+            "other": InterpreterProfile(path_to_python_interpreter=settings.path_to_python_interpreter)
+        }
+        async with running_code_executor(settings) as code_executor:
+            responses = await code_executor.run_python_code(
+                python_code="print(1)", ctx=MagicMock(spec=Context), profile="other"
+            )
+
+            # the connection is kept & works for the next request
+            result = await run(code_executor, "print(2)")
+            assert result.output == "2"
+            assert daemons[0].health()["ready"]
+
+    assert isinstance(responses[0], CodeExecutionResult)
+    assert responses[0].status == "failure"
+    assert "Unknown profile `other` on the executor daemon" in (responses[0].error or "")
+
+
+async def test_least_loaded_daemon(settings: Settings, tmp_path: Path) -> None:
+    async with running_daemons(settings, tmp_path) as daemons, running_code_executor(settings) as code_executor:
+        dispatcher = code_executor.backend
+        assert isinstance(dispatcher, Dispatcher)
+
+        tasks = [asyncio.create_task(run(code_executor, "import time; time.sleep(1)")) for _ in daemons]
+        await asyncio.sleep(0.5)
+        assert [daemon.active_executions for daemon in dispatcher.daemons] == [1, 1, 1]
+
+        results = await asyncio.gather(*tasks)
+    assert all(result.status == "success" for result in results)
+
+
+async def test_session_stays_on_its_daemon(settings: Settings, tmp_path: Path) -> None:
+    settings.session_mode = True
+    ctx = MagicMock(spec=Context)
+    ctx.session_id = "session"
+
+    async with running_daemons(settings, tmp_path), running_code_executor(settings) as code_executor:
+        await run(code_executor, "x = 41", ctx=ctx)
+        # keep the other daemons busy, so they would be picked otherwise
+        other_ctx = MagicMock(spec=Context)
+        other_ctx.session_id = "other session"
+        other = asyncio.create_task(run(code_executor, "import time; time.sleep(1)", ctx=other_ctx))
+        result = await run(code_executor, "print(x + 1)", ctx=ctx)
+        await other
+
+    assert result.status == "success"
+    assert result.output == "42"
+
+
+async def test_unhealthy_daemon_is_skipped(settings: Settings, tmp_path: Path) -> None:
+    async with running_daemons(settings, tmp_path) as daemons, running_code_executor(settings) as code_executor:
+        await daemons[0].stop()
+
+        results = [await run(code_executor, "print(1)") for _ in range(3)]
+        assert all(result.status == "success" for result in results)
+
+        dispatcher = code_executor.backend
+        assert isinstance(dispatcher, Dispatcher)
+        await dispatcher.check_health()
+        assert [daemon.healthy for daemon in dispatcher.daemons] == [False, True, True]
+
+
+async def test_no_daemon_available(settings: Settings, tmp_path: Path) -> None:
+    settings.executor_daemons = [f"unix:{tmp_path / 'missing.sock'}"]
+
+    async with running_code_executor(settings) as code_executor:
+        assert not code_executor.ready
+        result = await run(code_executor, "print(1)")
+
+    assert result.status == "failure"
+    assert "No executor daemon is available" in (result.error or "")
@@ -0,0 +1,47 @@
+import platform
+import shutil
+import subprocess  # noqa: S404
+from pathlib import Path
+
+import pytest
+
+from mcp_run_isolated_python.environment_cache import EnvironmentCache, EnvironmentCacheError
+
+pytestmark = pytest.mark.skipif(shutil.which("uv") is None, reason="needs uv")
+
+PYTHON_VERSION = ".".join(platform.python_version_tuple()[:2])
+
+
+def test_environment_is_reused(tmp_path: Path) -> None:
+    environment_cache = EnvironmentCache(directory=tmp_path)
+    python = environment_cache.get_or_create(python_version=PYTHON_VERSION, dependencies=[])
+    p = subprocess.run([python, "-c", "import sys; print(sys.prefix)"], capture_output=True, text=True, check=True)  # noqa: S603
+    assert Path(p.stdout.strip()) == python.parent.parent
+
+    # a second server with the same python version & dependencies
+    assert EnvironmentCache(directory=tmp_path).get_or_create(python_version=PYTHON_VERSION, dependencies=[]) == python
+
+
+def test_environment_is_read_only(tmp_path: Path) -> None:
+    python = EnvironmentCache(directory=tmp_path).get_or_create(python_version=PYTHON_VERSION, dependencies=[])
+    environment = python.parent.parent
+    assert not environment.stat().st_mode & 0o222
+    assert (environment / "requirements.lock").read_text() == ""
+
+
+def test_lockfile_is_used(tmp_path: Path) -> None:
+    lockfile = tmp_path / "requirements.lock"
+    lockfile.write_text("")
+    environment_cache = EnvironmentCache(directory=tmp_path / "environments")
+
+    # nothing to resolve, the lockfile already pins everything
+    python = environment_cache.get_or_create(python_version=PYTHON_VERSION, dependencies=["numpy"], lockfile=lockfile)
+    assert python == environment_cache.get_or_create(python_version=PYTHON_VERSION, dependencies=[])
+
+
+def test_failed_build_leaves_nothing_behind(tmp_path: Path) -> None:
+    environment_cache = EnvironmentCache(directory=tmp_path)
+    with pytest.raises(EnvironmentCacheError):
+        environment_cache.get_or_create(python_version="1.0", dependencies=[])
+
+    assert not [path for path in tmp_path.iterdir() if path.is_dir() and path.name != "locks"]
@@ -0,0 +1,90 @@
+import textwrap
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from fastmcp import Context
+from fastmcp.utilities.types import File
+from mcp.types import ResourceLink
+
+from mcp_run_isolated_python import file_store as file_store_module
+from mcp_run_isolated_python.code_executor import CodeExecutionResult, CodeExecutor
+from mcp_run_isolated_python.file_store import FileStore
+from mcp_run_isolated_python.utils.settings import Settings
+
+
+async def test_large_files_are_returned_as_resources(settings: Settings, tmp_path: Path) -> None:
+    settings.output_file_store_directory = tmp_path
+    settings.inline_output_file_max_bytes = 10
+    code_executor = CodeExecutor(settings=settings)
+    await code_executor.start()
+    context_mock = MagicMock(spec=Context)
+
+    code = textwrap.dedent("""
+    with open("./output/large.csv", "w") as f:
+        f.write("a,b\\n" * 100)
+    with open("./output/small.txt", "w") as f:
+        f.write("hi")
+    """).strip()
+    responses = await code_executor.run_python_code(python_code=code, ctx=context_mock)
+
+    result, large, small = responses
+    assert isinstance(result, CodeExecutionResult)
+    assert result.status == "success"
+    assert isinstance(small, File)
+    assert small.data == b"hi"
+    assert isinstance(large, ResourceLink)
+    assert large.name == "large.csv"
+    assert large.mime_type == "text/csv"
+    assert large.size == 400
+
+    assert code_executor.file_store is not None
+    stored = await code_executor.file_store.read(str(large.uri).removeprefix("output-files://"))
+    assert stored is not None
+    assert stored[1] == b"a,b\n" * 100
+
+    await code_executor.stop()
+
+
+async def test_store_eviction(settings: Settings, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    settings.output_file_store_directory = tmp_path / "store"
+    settings.output_file_store_max_bytes = 10
+    settings.output_file_store_ttl_seconds = 60
+    file_store = FileStore(settings=settings)
+    await file_store.start()
+
+    stored_files = []
+    for name in ("a", "b", "c"):
+        path = tmp_path / name
+        path.write_bytes(name.encode() * 4)
+        with path.open("rb") as source:
+            stored_files.append(file_store.store(source, name=name, mime_type="text/plain"))
+    a, b, c = stored_files
+
+    # the oldest file is removed to stay below the size limit
+    assert await file_store.read(a.file_id) is None
+    assert await file_store.read(b.file_id) == (b, b"bbbb")
+
+    # and everything expires after the ttl
+    now = file_store_module.time.time()
+    monkeypatch.setattr(file_store_module.time, "time", lambda: now + 61)
+    assert await file_store.read(c.file_id) is None
+
+
+async def test_start_keeps_other_files(settings: Settings, tmp_path: Path) -> None:
+    settings.output_file_store_directory = tmp_path
+    (tmp_path / "user.txt").write_text("keep me")
+    file_store = FileStore(settings=settings)
+    await file_store.start()
+
+    path = tmp_path / "a"
+    path.write_bytes(b"a")
+    with path.open("rb") as source:
+        stored_file = file_store.store(source, name="a", mime_type="text/plain")
+
+    # only the files of the store are removed on a restart
+    restarted_file_store = FileStore(settings=settings)
+    await restarted_file_store.start()
+    assert not (file_store.directory / stored_file.file_id).exists()
+    assert (tmp_path / "user.txt").read_text() == "keep me"
+    assert (tmp_path / "a").exists()
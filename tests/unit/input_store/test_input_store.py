@@ -0,0 +1,149 @@
+import base64
+import hashlib
+import json
+import textwrap
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from fastmcp import Client, Context
+
+from mcp_run_isolated_python.code_executor import CodeExecutionResult, CodeExecutor
+from mcp_run_isolated_python.input_store import InputStore, InputStoreError
+from mcp_run_isolated_python.mcp_server import create_mcp
+from mcp_run_isolated_python.utils.settings import Settings
+
+
+@pytest.fixture
+async def input_store(settings: Settings, tmp_path: Path) -> InputStore:
+    settings.input_store_directory = tmp_path / "inputs"
+    input_store = InputStore(settings=settings)
+    await input_store.start()
+    return input_store
+
+
+async def test_put_is_addressed_by_content(input_store: InputStore) -> None:
+    stored = await input_store.put(b"a,b\n1,2")
+    assert stored.input_id == hashlib.sha256(b"a,b\n1,2").hexdigest()
+    assert stored.size == 7
+
+    # uploading the same content again stores nothing new
+    assert await input_store.put(b"a,b\n1,2") == stored
+    assert [path.name for path in input_store.directory.iterdir()] == [stored.input_id]
+
+
+async def test_stage_copies_read_only(input_store: InputStore, tmp_path: Path) -> None:
+    stored = await input_store.put(b"data")
+    workspace = tmp_path / "workspace"
+    workspace.mkdir()
+
+    input_store.stage({"data.csv": stored.input_id}, workspace)
+
+    staged = workspace / "input" / "data.csv"
+    assert staged.read_bytes() == b"data"
+    assert not staged.stat().st_mode & 0o222
+
+    with pytest.raises(InputStoreError, match="does not exist"):
+        input_store.stage({"other.csv": "unknown"}, workspace)
+    with pytest.raises(InputStoreError, match="Invalid input file name"):
+        input_store.stage({"../escape": stored.input_id}, workspace)
+
+
+async def test_changing_a_staged_file_does_not_change_the_store(input_store: InputStore, tmp_path: Path) -> None:
+    stored = await input_store.put(b"data")
+    workspace = tmp_path / "workspace"
+    workspace.mkdir()
+    input_store.stage({"data.csv": stored.input_id}, workspace)
+
+    staged = workspace / "input" / "data.csv"
+    staged.chmod(0o644)
+    staged.write_bytes(b"changed")
+
+    assert (input_store.directory / stored.input_id).read_bytes() == b"data"
+    input_store.stage({"data.csv": stored.input_id}, workspace)
+    assert staged.read_bytes() == b"data"
+
+
+async def test_stage_does_not_follow_symlinks(input_store: InputStore, tmp_path: Path) -> None:
+    stored = await input_store.put(b"data")
+    workspace = tmp_path / "workspace"
+    workspace.mkdir()
+    victim = tmp_path / "victim"
+    victim.mkdir()
+
+    # left behind by the code of an earlier call of a session
+    (workspace / "input").symlink_to(victim)
+    input_store.stage({"data.csv": stored.input_id}, workspace)
+    assert not (workspace / "input").is_symlink()
+    assert list(victim.iterdir()) == []
+
+    (workspace / "input" / "other.csv").symlink_to(victim / "other.csv")
+    input_store.stage({"other.csv": stored.input_id}, workspace)
+    assert not (workspace / "input" / "other.csv").is_symlink()
+    assert list(victim.iterdir()) == []
+
+
+async def test_least_recently_used_files_are_removed(settings: Settings, input_store: InputStore) -> None:
+    settings.input_store_max_bytes = 10
+    first = await input_store.put(b"1" * 4)
+    second = await input_store.put(b"2" * 4)
+    # uploading it again makes it the most recently used
+    await input_store.put(b"1" * 4)
+    await input_store.put(b"3" * 4)
+
+    assert (input_store.directory / first.input_id).exists()
+    assert not (input_store.directory / second.input_id).exists()
+
+
+async def test_too_large(settings: Settings, input_store: InputStore) -> None:
+    settings.max_input_file_bytes = 3
+    with pytest.raises(InputStoreError, match="too large"):
+        await input_store.put(b"1234")
+    assert list(input_store.directory.iterdir()) == []
+
+
+async def test_run_with_input_files(settings: Settings, tmp_path: Path) -> None:
+    settings.input_store_directory = tmp_path / "inputs"
+    code_executor = CodeExecutor(settings=settings)
+    try:
+        await code_executor.start()
+        assert code_executor.input_store is not None
+        stored = await code_executor.input_store.put(b"1\n2\n3\n")
+
+        code = textwrap.dedent("""
+        import mmap
+        with open("input/numbers.txt", "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            print(sum(int(line) for line in m.read().split()))
+        """).strip()
+        responses = await code_executor.run_python_code(
+            python_code=code, ctx=MagicMock(spec=Context), input_files={"numbers.txt": stored.input_id}
+        )
+    finally:
+        await code_executor.stop()
+
+    assert isinstance(responses[0], CodeExecutionResult)
+    assert responses[0].status == "success"
+    assert responses[0].output == "6"
+
+
+async def test_input_files_not_enabled(code_executor: CodeExecutor) -> None:
+    responses = await code_executor.run_python_code(
+        python_code="print(1)", ctx=MagicMock(spec=Context), input_files={"data.csv": "abc"}
+    )
+
+    assert isinstance(responses[0], CodeExecutionResult)
+    assert responses[0].status == "failure"
+    assert responses[0].error == "Input files are not enabled on this server"
+
+
+async def test_upload_tool(settings: Settings, tmp_path: Path) -> None:
+    settings.input_store_directory = tmp_path / "inputs"
+
+    async with Client(create_mcp(settings)) as client:
+        uploaded = await client.call_tool("upload_input_file", {"content_base64": base64.b64encode(b"hi").decode()})
+        result = await client.call_tool(
+            "run_python_code",
+            {"python_code": "print(open('input/a.txt').read())", "input_files": {"a.txt": uploaded.data.input_id}},
+        )
+
+    assert json.loads(result.content[0].text)[0]["output"] == "hi"
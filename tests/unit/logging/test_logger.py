@@ -0,0 +1,78 @@
+import io
+import logging
+
+import pytest
+import structlog
+
+from mcp_run_isolated_python.utils.logger import QueueLogger, SampleEvents, TruncateFields, configure_logging
+
+
+@pytest.fixture(autouse=True)
+def reset_logging():
+    yield
+    configure_logging()
+
+
+def test_truncate_fields() -> None:
+    truncate = TruncateFields(max_length=10)
+    event_dict = truncate(None, "info", {"event": "Code executed", "stdout": "x" * 100, "stderr": "short"})
+
+    assert event_dict["stdout"] == "x" * 10 + "..."
+    assert event_dict["stdout_length"] == 100
+    assert len(event_dict["stdout_sha256"]) == 16
+    assert event_dict["stderr"] == "short"
+    assert "stderr_length" not in event_dict
+
+
+def test_sample_events() -> None:
+    sample = SampleEvents(every=3)
+
+    kept = 0
+    for _ in range(9):
+        try:
+            sample(None, "info", {"event": "Code executed"})
+            kept += 1
+        except structlog.DropEvent:
+            pass
+    assert kept == 3
+
+    # the first of each kind is always logged, warnings are never dropped
+    assert sample(None, "info", {"event": "Ready"})
+    for _ in range(5):
+        assert sample(None, "warning", {"event": "Code executed"})
+
+
+def test_queue_logger_writes_in_order() -> None:
+    file = io.StringIO()
+    queue_logger = QueueLogger(file=file)
+    for i in range(100):
+        queue_logger.msg(str(i))
+    queue_logger.close()
+
+    assert file.getvalue().splitlines() == [str(i) for i in range(100)]
+
+
+def test_queue_logger_drops_instead_of_blocking() -> None:
+    file = io.StringIO()
+    queue_logger = QueueLogger(file=file, max_queued_lines=1)
+    for i in range(10_000):
+        queue_logger.msg(str(i))
+    queue_logger.close()
+
+    lines = file.getvalue().splitlines()
+    assert len(lines) < 10_001
+    assert "Dropped log lines" in lines[-1] or len(lines) == 10_000
+
+
+def test_json_format(capsys: pytest.CaptureFixture[str]) -> None:
+    configure_logging(log_level=logging.INFO, log_format="json", max_field_length=5)
+    logger = structlog.getLogger("test")
+    logger.info("Running python code...", code="print('hello world')")
+    logger.debug("Not logged")
+    structlog.get_config()["logger_factory"]().close()
+
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 1
+    assert '"event": "Running python code..."' in lines[0]
+    assert '"code": "print..."' in lines[0]
+    assert '"code_length": 20' in lines[0]
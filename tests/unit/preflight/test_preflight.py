@@ -0,0 +1,117 @@
+import shlex
+import textwrap
+from pathlib import Path
+from unittest import mock
+from unittest.mock import MagicMock
+
+import pytest
+from fastmcp import Context
+
+from mcp_run_isolated_python.code_executor import CodeExecutionResult, CodeExecutor
+from mcp_run_isolated_python.preflight import Preflight
+from mcp_run_isolated_python.utils.settings import Settings
+from mcp_run_isolated_python.worker_pool import WorkerPool
+
+
+@pytest.mark.parametrize(
+    "code,expected_error",
+    [
+        pytest.param("print(", "SyntaxError: '(' was never closed", id="syntax errors"),
+        pytest.param("1+1\n   print(1)", "IndentationError: unexpected indent", id="indentation errors"),
+        pytest.param("return 1", "SyntaxError: 'return' outside function", id="compile errors"),
+        pytest.param(
+            "import json\nimport not_installed.sub",
+            "ModuleNotFoundError: No module named 'not_installed'",
+            id="imports",
+        ),
+        pytest.param(
+            '"""docstring"""\nfrom not_installed import x',
+            "ModuleNotFoundError: No module named 'not_installed'",
+            id="from imports",
+        ),
+    ],
+)
+async def test_fails_without_a_sandbox(code: str, expected_error: str, code_executor: CodeExecutor) -> None:
+    with mock.patch.object(WorkerPool, "acquire", side_effect=AssertionError("no sandbox should be used")):
+        responses = await code_executor.run_python_code(python_code=code, ctx=MagicMock(spec=Context))
+
+    response = responses[0]
+    assert isinstance(response, CodeExecutionResult)
+    assert response.status == "failure"
+    assert response.error is not None
+    assert expected_error in response.error
+
+
+async def test_imports(settings: Settings) -> None:
+    preflight = Preflight(settings=settings)
+
+    code = textwrap.dedent("""
+        import json, os.path
+        from collections import OrderedDict
+        from . import relative
+
+        print("hi")
+        # might have been written by the code itself
+        import not_installed
+
+        def f():
+            import inside_a_function
+    """)
+    result = await preflight.check(code)
+    assert result.error is None
+    assert result.imports == {"json", "os", "collections", "not_installed"}
+
+    # sessions might have written the module in an earlier call
+    result = await preflight.check("import not_installed", check_imports=False)
+    assert result.error is None
+
+
+async def test_namespace_packages(settings: Settings, tmp_path: Path) -> None:
+    # a directory without `__init__.py` on the path of the sandbox interpreter
+    (tmp_path / "lib" / "namespace_package" / "sub").mkdir(parents=True)
+    interpreter = tmp_path / "python"
+    interpreter.write_text(
+        f"#!/bin/sh\nPYTHONPATH={shlex.quote(str(tmp_path / 'lib'))} "
+        f'exec {shlex.quote(str(settings.path_to_python_interpreter))} "$@"\n'
+    )
+    interpreter.chmod(0o755)
+    settings.path_to_python_interpreter = interpreter
+    preflight = Preflight(settings=settings)
+
+    result = await preflight.check("import namespace_package.sub")
+    assert result.error is None
+    result = await preflight.check("from namespace_package import sub\nimport not_installed")
+    assert result.error == "ModuleNotFoundError: No module named 'not_installed'"
+
+
+async def test_cache(settings: Settings) -> None:
+    settings.preflight_cache_max_entries = 1
+    preflight = Preflight(settings=settings)
+
+    first = await preflight.check("import json")
+    assert await preflight.check("import json") is first
+
+    await preflight.check("import os")
+    assert await preflight.check("import json") is not first
+
+
+async def test_unknown_interpreter(settings: Settings, tmp_path: Path) -> None:
+    settings.path_to_python_interpreter = tmp_path / "missing"
+    preflight = Preflight(settings=settings)
+
+    # nothing is checked, the sandbox reports the errors instead
+    result = await preflight.check("print(")
+    assert result.error is None
+
+
+async def test_prefers_workers_with_the_modules_loaded(worker_pool: WorkerPool) -> None:
+    first = await worker_pool.acquire()
+    second = await worker_pool.acquire()
+    assert "json" in first.modules
+    second.modules |= {"numpy"}
+    # idle, like after a reset
+    worker_pool._idle.extend([first, second])
+
+    worker = await worker_pool.acquire(modules=frozenset({"numpy"}))
+    assert worker is second
+    await worker_pool.release(worker)
@@ -0,0 +1,78 @@
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from fastmcp import Context
+
+from mcp_run_isolated_python.code_executor import CodeExecutionResult, CodeExecutor
+from mcp_run_isolated_python.result_cache import ResultCache
+from mcp_run_isolated_python.utils.settings import DEFAULT_PROFILE, InterpreterProfile, Settings
+
+
+@pytest.fixture
+def interpreter(settings: Settings, tmp_path: Path) -> Path:
+    # another path to the same interpreter, it shows up as `sys.executable`
+    path = tmp_path / "python"
+    path.symlink_to(settings.path_to_python_interpreter)
+    return path
+
+
+def test_for_profile(settings: Settings, interpreter: Path) -> None:
+    settings.worker_pool_size = 0
+    settings.profiles = {
+        "other": InterpreterProfile(
+            path_to_python_interpreter=interpreter, installed_python_dependencies=["numpy"], worker_pool_size=2
+        )
+    }
+
+    assert settings.for_profile(None) is settings
+    assert settings.for_profile(DEFAULT_PROFILE) is settings
+
+    other = settings.for_profile("other")
+    assert other.path_to_python_interpreter == interpreter
+    assert other.installed_python_dependencies == ["numpy"]
+    assert other.worker_pool_size == 2
+    # not set by the profile
+    assert other.path_to_srt_settings == settings.path_to_srt_settings
+    assert other.profiles == {}
+
+    with pytest.raises(ValueError, match="Unknown profile"):
+        settings.for_profile("missing")
+
+
+def test_default_is_reserved(settings: Settings, interpreter: Path) -> None:
+    with pytest.raises(ValueError, match="another name"):
+        Settings.model_validate(
+            settings.model_dump()
+            | {"profiles": {DEFAULT_PROFILE: InterpreterProfile(path_to_python_interpreter=interpreter)}}
+        )
+
+
+async def test_run_with_profile(settings: Settings, interpreter: Path) -> None:
+    settings.profiles = {"other": InterpreterProfile(path_to_python_interpreter=interpreter, worker_pool_size=1)}
+    code_executor = CodeExecutor(settings=settings)
+    try:
+        await code_executor.start()
+        ctx = MagicMock(spec=Context)
+
+        responses = await code_executor.run_python_code(
+            python_code="import sys\nprint(sys.executable)", ctx=ctx, profile="other"
+        )
+        assert responses == [CodeExecutionResult(status="success", output=str(interpreter))]
+
+        responses = await code_executor.run_python_code(python_code="import sys\nprint(sys.executable)", ctx=ctx)
+        assert isinstance(responses[0], CodeExecutionResult)
+        assert responses[0].output != str(interpreter)
+
+        with pytest.raises(ValueError, match="Unknown profile"):
+            await code_executor.run_python_code(python_code="print(1)", ctx=ctx, profile="missing")
+    finally:
+        await code_executor.stop()
+
+
+def test_result_cache_key(settings: Settings, interpreter: Path) -> None:
+    settings.profiles = {"other": InterpreterProfile(path_to_python_interpreter=interpreter)}
+    result_cache = ResultCache(settings=settings)
+
+    assert result_cache.key("print(1)") == result_cache.key("print(1)", profile=DEFAULT_PROFILE)
+    assert result_cache.key("print(1)") != result_cache.key("print(1)", profile="other")
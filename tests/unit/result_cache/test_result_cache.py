@@ -0,0 +1,137 @@
+import textwrap
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from fastmcp import Context
+from fastmcp.utilities.types import File
+
+from mcp_run_isolated_python import result_cache
+from mcp_run_isolated_python.code_executor import CodeExecutionResult, CodeExecutor
+from mcp_run_isolated_python.result_cache import ResultCache
+from mcp_run_isolated_python.utils.settings import Settings
+
+
+async def test_lru_eviction(settings: Settings) -> None:
+    settings.result_cache_max_entries = 2
+    cache = ResultCache(settings=settings)
+
+    await cache.put("a", b"a")
+    await cache.put("b", b"b")
+    assert await cache.get("a") == b"a"
+
+    # "b" is the least recently used entry now
+    await cache.put("c", b"c")
+    assert await cache.get("a") == b"a"
+    assert await cache.get("b") is None
+    assert await cache.get("c") == b"c"
+
+
+async def test_size_eviction(settings: Settings) -> None:
+    settings.result_cache_max_bytes = 10
+    cache = ResultCache(settings=settings)
+
+    await cache.put("a", b"a" * 6)
+    await cache.put("b", b"b" * 6)
+    assert await cache.get("a") is None
+    assert await cache.get("b") == b"b" * 6
+
+    # too large for the cache at all
+    await cache.put("c", b"c" * 11)
+    assert await cache.get("c") is None
+    assert await cache.get("b") == b"b" * 6
+
+
+async def test_ttl(settings: Settings, monkeypatch: pytest.MonkeyPatch) -> None:
+    settings.result_cache_ttl_seconds = 10
+    cache = ResultCache(settings=settings)
+    await cache.put("a", b"a")
+
+    now = result_cache.time.time()
+    monkeypatch.setattr(result_cache.time, "time", lambda: now + 11)
+    assert await cache.get("a") is None
+
+
+async def test_disk_backend_survives_restarts(settings: Settings, tmp_path: Path) -> None:
+    settings.result_cache_directory = tmp_path
+    settings.result_cache_max_entries = 2
+
+    cache = ResultCache(settings=settings)
+    await cache.start()
+    for key in ("a", "b", "c"):
+        await cache.put(key, key.encode())
+
+    restarted_cache = ResultCache(settings=settings)
+    await restarted_cache.start()
+    assert await restarted_cache.get("a") is None
+    assert await restarted_cache.get("b") == b"b"
+    assert await restarted_cache.get("c") == b"c"
+
+
+def test_key_depends_on_environment(settings: Settings) -> None:
+    key = ResultCache(settings=settings).key("print(1)")
+    assert ResultCache(settings=settings).key("print(1)") == key
+    assert ResultCache(settings=settings).key("print(2)") != key
+
+    settings.installed_python_dependencies = ["numpy"]
+    assert ResultCache(settings=settings).key("print(1)") != key
+
+    # the code might fail with other limits
+    settings.installed_python_dependencies = []
+    settings.max_memory_bytes = 1024 * 1024 * 1024
+    assert ResultCache(settings=settings).key("print(1)") != key
+
+
+async def test_code_executor_returns_cached_results(settings: Settings) -> None:
+    settings.result_cache = True
+    code_executor = CodeExecutor(settings=settings)
+    context_mock = MagicMock(spec=Context)
+
+    code = textwrap.dedent("""
+    import uuid
+    print(uuid.uuid4())
+    with open("./output/file.txt", "w") as f:
+        f.write("hi")
+    """).strip()
+    responses = await code_executor.run_python_code(python_code=code, ctx=context_mock)
+    cached_responses = await code_executor.run_python_code(python_code=code, ctx=context_mock)
+    await code_executor.stop()
+
+    assert isinstance(responses[0], CodeExecutionResult)
+    assert cached_responses[0] == responses[0]
+    assert isinstance(cached_responses[1], File)
+    assert cached_responses[1].data == b"hi"
+    assert cached_responses[1]._name == "file.txt"
+
+
+async def test_timeouts_are_not_cached(settings: Settings) -> None:
+    settings.result_cache = True
+    settings.code_timeout_seconds = 1
+    code_executor = CodeExecutor(settings=settings)
+    context_mock = MagicMock(spec=Context)
+
+    code = textwrap.dedent("""
+    import time
+    time.sleep(5)
+    """).strip()
+    responses = await code_executor.run_python_code(python_code=code, ctx=context_mock)
+    await code_executor.stop()
+
+    assert responses[0].status == "failure"
+    assert code_executor._result_cache is not None
+    assert await code_executor._result_cache.get(code_executor._result_cache.key(code)) is None
+
+
+async def test_exceeded_limits_are_not_cached(settings: Settings) -> None:
+    settings.result_cache = True
+    settings.max_return_value_bytes = 100
+    code_executor = CodeExecutor(settings=settings)
+
+    code = "result('x' * 1000)"
+    responses = await code_executor.run_python_code(python_code=code, ctx=MagicMock(spec=Context))
+    await code_executor.stop()
+
+    assert isinstance(responses[0], CodeExecutionResult)
+    assert responses[0].limit_exceeded == "return_value_size"
+    assert code_executor._result_cache is not None
+    assert await code_executor._result_cache.get(code_executor._result_cache.key(code)) is None
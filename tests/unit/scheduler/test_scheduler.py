@@ -0,0 +1,181 @@
+import asyncio
+import textwrap
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from fastmcp import Context
+
+from mcp_run_isolated_python.code_executor import CodeExecutionResult, CodeExecutor
+from mcp_run_isolated_python.scheduler import QueueTimeoutError, Scheduler, SchedulerBusyError
+from mcp_run_isolated_python.utils.settings import Settings
+
+
+async def hold(scheduler: Scheduler, client: str, started: list[str], release: asyncio.Event):
+    async with scheduler.slot(client):
+        started.append(client)
+        await release.wait()
+
+
+async def test_busy(settings: Settings) -> None:
+    settings.max_concurrent_executions = 1
+    settings.max_queued_executions = 1
+    scheduler = Scheduler(settings=settings, capacity=lambda: settings.max_concurrent_executions)
+    started: list[str] = []
+    release = asyncio.Event()
+
+    running = asyncio.create_task(hold(scheduler, "a", started, release))
+    queued = asyncio.create_task(hold(scheduler, "a", started, release))
+    await asyncio.sleep(0.1)
+    assert scheduler.queued == 1
+
+    # rejected right away, instead of waiting
+    with pytest.raises(SchedulerBusyError):
+        async with scheduler.slot("b"):
+            pass
+
+    release.set()
+    await asyncio.gather(running, queued)
+    assert started == ["a", "a"]
+    assert scheduler.queued == 0
+
+
+async def test_fairness(settings: Settings) -> None:
+    settings.max_concurrent_executions = 1
+    scheduler = Scheduler(settings=settings, capacity=lambda: settings.max_concurrent_executions)
+    started: list[str] = []
+    releases = [asyncio.Event() for _ in range(4)]
+
+    # client "a" queues many executions before client "b" arrives
+    tasks = [asyncio.create_task(hold(scheduler, "a", started, releases[0]))]
+    await asyncio.sleep(0.05)
+    tasks.append(asyncio.create_task(hold(scheduler, "a", started, releases[1])))
+    tasks.append(asyncio.create_task(hold(scheduler, "a", started, releases[2])))
+    await asyncio.sleep(0.05)
+    tasks.append(asyncio.create_task(hold(scheduler, "b", started, releases[3])))
+    await asyncio.sleep(0.05)
+
+    for release in releases:
+        release.set()
+    await asyncio.gather(*tasks)
+
+    # "b" goes before the queued executions of "a"
+    assert started == ["a", "b", "a", "a"]
+
+
+async def test_fairness_prefers_clients_without_running_executions(settings: Settings) -> None:
+    settings.max_concurrent_executions = 2
+    scheduler = Scheduler(settings=settings, capacity=lambda: settings.max_concurrent_executions)
+    started: list[str] = []
+    release_a, release_b, release_rest = asyncio.Event(), asyncio.Event(), asyncio.Event()
+
+    tasks = [
+        asyncio.create_task(hold(scheduler, "a", started, release_a)),
+        asyncio.create_task(hold(scheduler, "b", started, release_b)),
+    ]
+    await asyncio.sleep(0.05)
+    # "b" queued first, but is still running an execution when "a" frees its slot
+    tasks.append(asyncio.create_task(hold(scheduler, "b", started, release_rest)))
+    await asyncio.sleep(0.05)
+    tasks.append(asyncio.create_task(hold(scheduler, "c", started, release_rest)))
+    await asyncio.sleep(0.05)
+
+    release_a.set()
+    await asyncio.sleep(0.05)
+    assert started == ["a", "b", "c"]
+
+    release_b.set()
+    release_rest.set()
+    await asyncio.gather(*tasks)
+
+
+async def test_waiters_start_when_capacity_grows(settings: Settings) -> None:
+    capacity = 1
+    scheduler = Scheduler(settings=settings, capacity=lambda: capacity)
+    started: list[str] = []
+    release = asyncio.Event()
+
+    tasks = [asyncio.create_task(hold(scheduler, client, started, release)) for client in ("a", "b")]
+    await asyncio.sleep(0.05)
+    assert started == ["a"]
+
+    # e.g. an executor daemon became healthy
+    capacity = 2
+    scheduler.capacity_changed()
+    await asyncio.sleep(0.05)
+    assert started == ["a", "b"]
+
+    # also noticed when the next execution arrives, the waiting one goes first
+    tasks.append(asyncio.create_task(hold(scheduler, "c", started, release)))
+    await asyncio.sleep(0.05)
+    capacity = 3
+    tasks.append(asyncio.create_task(hold(scheduler, "d", started, release)))
+    await asyncio.sleep(0.05)
+    assert started == ["a", "b", "c"]
+
+    release.set()
+    await asyncio.gather(*tasks)
+
+
+async def test_queue_timeout(settings: Settings) -> None:
+    settings.max_concurrent_executions = 1
+    settings.code_timeout_seconds = 2
+    scheduler = Scheduler(settings=settings, capacity=lambda: settings.max_concurrent_executions)
+    release = asyncio.Event()
+    running = asyncio.create_task(hold(scheduler, "a", [], release))
+    await asyncio.sleep(0.05)
+
+    # rejected once it could not run for at least a second anymore
+    started_at = time.monotonic()
+    with pytest.raises(QueueTimeoutError):
+        async with scheduler.slot("b"):
+            pass
+    assert time.monotonic() - started_at < 1.5
+    assert scheduler.queued == 0
+
+    release.set()
+    await running
+
+
+async def test_cancelled_while_queued(settings: Settings) -> None:
+    settings.max_concurrent_executions = 1
+    scheduler = Scheduler(settings=settings, capacity=lambda: settings.max_concurrent_executions)
+    started: list[str] = []
+    release = asyncio.Event()
+
+    running = asyncio.create_task(hold(scheduler, "a", started, release))
+    await asyncio.sleep(0.05)
+    queued = asyncio.create_task(hold(scheduler, "b", started, release))
+    await asyncio.sleep(0.05)
+    queued.cancel()
+    await asyncio.gather(queued, return_exceptions=True)
+    assert scheduler.queued == 0
+
+    # the slot is not lost
+    release.set()
+    await running
+    async with scheduler.slot("c"):
+        pass
+
+
+async def test_waiting_counts_against_timeout(settings: Settings, code_executor: CodeExecutor) -> None:
+    settings.max_concurrent_executions = 1
+    settings.code_timeout_seconds = 4
+    ctx = MagicMock(spec=Context)
+    ctx.client_id = "client"
+
+    # the second execution waits for the first one, so it has less than 1.5 seconds left to run
+    code = textwrap.dedent("""
+        import time
+        time.sleep(2.5)
+        print("done")
+    """)
+    first, second = await asyncio.gather(
+        code_executor.run_python_code(python_code=code, ctx=ctx),
+        code_executor.run_python_code(python_code=code, ctx=ctx),
+    )
+
+    assert first == [CodeExecutionResult(status="success", output="done")]
+    assert isinstance(second[0], CodeExecutionResult)
+    assert second[0].status == "failure"
+    assert second[0].limit_exceeded == "timeout"
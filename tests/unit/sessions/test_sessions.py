@@ -0,0 +1,135 @@
+import asyncio
+import textwrap
+from unittest.mock import MagicMock
+
+import pytest
+from fastmcp import Context
+
+from mcp_run_isolated_python.code_executor import CodeExecutionResult, CodeExecutor
+from mcp_run_isolated_python.sessions import SessionManager
+from mcp_run_isolated_python.utils.settings import Settings
+from mcp_run_isolated_python.worker_pool import SandboxWorker
+from mcp_run_isolated_python.workspaces import WorkspaceManager
+
+
+async def test_state_persists_within_session(session_manager: SessionManager) -> None:
+    async with session_manager.worker("a") as worker:
+        code = textwrap.dedent("""
+        import json
+        counter = 1
+        with open("./file.txt", "w") as f:
+            f.write("hi")
+        with open("./output/file.txt", "w") as f:
+            f.write("hi")
+        """).strip()
+        result = await worker.run(code, timeout=10)
+        assert result.returncode == 0
+
+    async with session_manager.worker("a") as same_worker:
+        assert same_worker is worker
+        code = textwrap.dedent("""
+        import os
+        counter += 1
+        print(counter, json.dumps("ok"), os.path.exists("./file.txt"), os.listdir("./output"))
+        """).strip()
+        result = await same_worker.run(code, timeout=10)
+        assert result.returncode == 0
+        assert result.stdout.decode().strip() == '2 "ok" True []'
+
+
+async def test_sessions_are_isolated(session_manager: SessionManager) -> None:
+    async with session_manager.worker("a") as worker:
+        result = await worker.run("secret = 1", timeout=10)
+        assert result.returncode == 0
+
+    async with session_manager.worker("b") as other_worker:
+        assert other_worker is not worker
+        result = await other_worker.run('print("secret" in globals())', timeout=10)
+        assert result.stdout.decode().strip() == "False"
+
+
+async def test_session_restarts_after_timeout(session_manager: SessionManager) -> None:
+    async with session_manager.worker("a") as worker:
+        await worker.run("counter = 1", timeout=10)
+        result = await worker.run("import time; time.sleep(5)", timeout=1)
+        assert result.timed_out
+
+    # the state is lost, but the session can be used again
+    async with session_manager.worker("a") as new_worker:
+        assert new_worker is not worker
+        result = await new_worker.run('print("counter" in globals())', timeout=10)
+        assert result.stdout.decode().strip() == "False"
+
+
+async def test_idle_sessions_are_evicted(
+    session_manager: SessionManager, workspaces: WorkspaceManager, settings: Settings
+) -> None:
+    async with session_manager.worker("a") as worker:
+        await worker.run("counter = 1", timeout=10)
+
+    settings.session_idle_timeout_seconds = 0
+    await session_manager.evict_idle_sessions()
+    assert not worker.alive
+
+    # the workspace is removed in the background
+    await workspaces.stop()
+    assert not worker.workspace.exists()
+
+
+async def test_least_recently_used_session_is_evicted(session_manager: SessionManager) -> None:
+    async with session_manager.worker("a") as worker_a:
+        pass
+    async with session_manager.worker("b") as worker_b:
+        pass
+    async with session_manager.worker("a"):
+        pass
+
+    # `max_sessions` is 2, so "b" has to make room
+    async with session_manager.worker("c"):
+        pass
+    assert worker_a.alive
+    assert not worker_b.alive
+
+
+async def test_sessions_start_concurrently(session_manager: SessionManager, monkeypatch: pytest.MonkeyPatch) -> None:
+    starting = 0
+    max_starting = 0
+    start = SandboxWorker.start
+
+    async def slow_start(worker: SandboxWorker):
+        nonlocal starting, max_starting
+        starting += 1
+        max_starting = max(max_starting, starting)
+        await asyncio.sleep(0.5)
+        starting -= 1
+        await start(worker)
+
+    monkeypatch.setattr(SandboxWorker, "start", slow_start)
+
+    async def get_worker(session_id: str) -> SandboxWorker:
+        async with session_manager.worker(session_id) as worker:
+            return worker
+
+    a, same_a, b = await asyncio.gather(get_worker("a"), get_worker("a"), get_worker("b"))
+    # the start of one session does not block the others, calls of the same session share it
+    assert max_starting == 2
+    assert a is same_a
+    assert a is not b
+
+
+async def test_code_executor_uses_mcp_session(settings: Settings) -> None:
+    settings.session_mode = True
+    code_executor = CodeExecutor(settings=settings)
+    context_mock = MagicMock(spec=Context)
+    context_mock.session_id = "session"
+
+    await code_executor.run_python_code(python_code="counter = 41", ctx=context_mock)
+    response = await code_executor.run_python_code(python_code="print(counter + 1)", ctx=context_mock)
+    assert response == [CodeExecutionResult(status="success", output="42", error=None)]
+
+    context_mock.session_id = "other session"
+    response = await code_executor.run_python_code(python_code="print(counter + 1)", ctx=context_mock)
+    assert response[0].status == "failure"
+    assert "NameError" in response[0].error
+
+    await code_executor.stop()
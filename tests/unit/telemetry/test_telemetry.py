@@ -0,0 +1,48 @@
+import json
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from fastmcp import Context
+from opentelemetry import metrics, trace
+
+from mcp_run_isolated_python.code_executor import CodeExecutor
+from mcp_run_isolated_python.utils.otel import configure_telemetry
+
+pytest.importorskip("opentelemetry.sdk", reason="needs the `telemetry` extra")
+
+
+async def test_spans_and_metrics_are_written_to_file(code_executor: CodeExecutor, tmp_path: Path) -> None:
+    # the providers can only be set once per process
+    telemetry_file = tmp_path / "telemetry.jsonl"
+    configure_telemetry(telemetry_file=telemetry_file)
+
+    await code_executor.run_python_code('print("hi")', ctx=MagicMock(spec=Context))
+    await code_executor.run_python_code("raise ValueError()", ctx=MagicMock(spec=Context))
+    trace.get_tracer_provider().force_flush()  # ty:ignore[unresolved-attribute]
+    metrics.get_meter_provider().force_flush()  # ty:ignore[unresolved-attribute]
+
+    records = [json.loads(line) for line in telemetry_file.read_text().splitlines()]
+    span_names = {record["name"] for record in records if "span_id" in record.get("context", {})}
+    assert {
+        "run_python_code",
+        "queue_wait",
+        "acquire_worker",
+        "sandbox_spawn",
+        "execute",
+        "collect_output",
+    } <= span_names
+
+    data_points = {}
+    for record in records:
+        for resource_metrics in record.get("resource_metrics", []):
+            for scope_metrics in resource_metrics["scope_metrics"]:
+                for metric in scope_metrics["metrics"]:
+                    data_points[metric["name"]] = metric["data"]["data_points"]
+
+    executions = {
+        point["attributes"]["result"]: point["value"] for point in data_points["mcp_run_isolated_python.executions"]
+    }
+    assert executions == {"success": 1, "failure": 1}
+    assert "mcp_run_isolated_python.execution.duration" in data_points
+    assert "mcp_run_isolated_python.output.size" in data_points
@@ -0,0 +1,186 @@
+import asyncio
+import subprocess  # noqa: S404
+import textwrap
+
+import pytest
+
+from mcp_run_isolated_python.utils.processes import ProcessReaper, list_processes
+from mcp_run_isolated_python.utils.settings import Settings
+from mcp_run_isolated_python.worker_pool import WorkerPool
+from mcp_run_isolated_python.workspaces import WorkspaceManager
+
+
+async def test_reuse_and_recycle(worker_pool: WorkerPool) -> None:
+    worker = await worker_pool.acquire()
+    result = await worker.run('print("run 1")', timeout=10)
+    assert result.returncode == 0
+    assert result.stdout.decode().strip() == "run 1"
+    await worker_pool.release(worker)
+
+    # second run is executed by the same worker
+    reused_worker = await worker_pool.acquire()
+    assert reused_worker is worker
+    result = await reused_worker.run('print("run 2")', timeout=10)
+    assert result.stdout.decode().strip() == "run 2"
+    await worker_pool.release(reused_worker)
+
+    # `worker_max_runs` is reached, so it is replaced
+    new_worker = await worker_pool.acquire()
+    assert new_worker is not worker
+    await worker_pool.release(new_worker)
+
+
+async def test_runs_are_isolated(worker_pool: WorkerPool) -> None:
+    worker = await worker_pool.acquire()
+    code = textwrap.dedent("""
+    import builtins, sys
+    _print = builtins.print
+    builtins.print = lambda *args, **kwargs: _print("HIJACKED", *args, **kwargs)
+    sys.modules["json"] = None
+    leaked = 1
+    """).strip()
+    result = await worker.run(code, timeout=10)
+    assert result.returncode == 0
+    await worker_pool.release(worker)
+
+    worker = await worker_pool.acquire()
+    code = textwrap.dedent("""
+    import json
+    print("run 2", "leaked" in globals())
+    """).strip()
+    result = await worker.run(code, timeout=10)
+    assert result.returncode == 0
+    assert result.stdout.decode().strip() == "run 2 False"
+    await worker_pool.release(worker)
+
+
+async def test_reset_cleans_workspace(worker_pool: WorkerPool) -> None:
+    worker = await worker_pool.acquire()
+    code = textwrap.dedent("""
+    with open("./file.txt", "w") as f:
+        f.write("hi")
+    with open("./output/file.txt", "w") as f:
+        f.write("hi")
+    """).strip()
+    result = await worker.run(code, timeout=10)
+    assert result.returncode == 0
+    await worker_pool.release(worker)
+
+    # the workspace is reset in the background, before the worker is handed out again
+    reused_worker = await worker_pool.acquire()
+    assert reused_worker is worker
+    assert [path.name for path in worker.workspace.iterdir()] == ["output"]
+    assert list(worker.output_path.iterdir()) == []
+    await worker_pool.release(worker)
+
+
+async def test_recycle_after_timeout(worker_pool: WorkerPool) -> None:
+    worker = await worker_pool.acquire()
+    result = await worker.run('import time\nprint("started", flush=True)\ntime.sleep(10)', timeout=1)
+    assert result.timed_out
+    assert result.stdout.decode().strip() == "started"
+    assert not worker.alive
+    await worker_pool.release(worker)
+
+    new_worker = await worker_pool.acquire()
+    assert new_worker is not worker
+    await worker_pool.release(new_worker)
+
+
+async def test_recycle_after_crash(worker_pool: WorkerPool) -> None:
+    worker = await worker_pool.acquire()
+    result = await worker.run("import os, signal\nos.kill(os.getppid(), signal.SIGKILL)", timeout=10)
+    assert result.crashed
+    assert not worker.alive
+    await worker_pool.release(worker)
+
+
+async def test_recycle_after_leftover_processes(worker_pool: WorkerPool) -> None:
+    worker = await worker_pool.acquire()
+    result = await worker.run("import subprocess\nsubprocess.Popen(['sleep', '30'])", timeout=10)
+    assert result.returncode == 0
+    assert not worker.alive
+    await worker_pool.release(worker)
+
+
+async def test_preload_dependencies(settings: Settings, workspaces: WorkspaceManager) -> None:
+    settings.installed_python_dependencies = ["structlog>=25.5.0", "not-installed-package"]
+    settings.preload_python_dependencies = True
+    worker_pool = WorkerPool(settings=settings, workspaces=workspaces)
+
+    worker = await worker_pool.acquire()
+    code = textwrap.dedent("""
+    import sys
+    print("structlog" in sys.modules, "structlog" in globals())
+    """).strip()
+    result = await worker.run(code, timeout=10)
+    await worker_pool.release(worker)
+    await worker_pool.stop()
+
+    # the module is already loaded, but the namespace of the code is still clean
+    assert result.returncode == 0
+    assert result.stdout.decode().strip() == "True False"
+
+
+def running(pid: int) -> bool:
+    process = list_processes().get(pid)
+    return process is not None and process[2] != "Z"
+
+
+# starts a process which leaves the process group of the sandbox & prints its pid
+ESCAPE = textwrap.dedent("""
+    import subprocess, sys
+    p = subprocess.Popen(
+        [sys.executable, "-c", "import time; time.sleep(60)"],
+        start_new_session=True,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    print(p.pid, flush=True)
+""")
+
+
+@pytest.mark.skipif(not list_processes(), reason="needs /proc")
+async def test_timeout_kills_the_whole_tree(worker_pool: WorkerPool) -> None:
+    worker = await worker_pool.acquire()
+    result = await worker.run(f"{ESCAPE}\nimport time\ntime.sleep(10)", timeout=2)
+    assert result.timed_out
+    await worker_pool.release(worker)
+
+    # still a descendant of the sandbox when it timed out
+    assert not running(int(result.stdout.decode()))
+
+
+@pytest.mark.skipif(not list_processes(), reason="needs /proc")
+async def test_orphaned_processes_are_killed_after_the_run(worker_pool: WorkerPool) -> None:
+    worker = await worker_pool.acquire()
+    result = await worker.run(ESCAPE, timeout=10)
+    assert result.returncode == 0
+
+    # left the process group & its parent exited, the worker adopted & killed it
+    assert not running(int(result.stdout.decode()))
+    await worker_pool.release(worker)
+
+
+@pytest.mark.skipif(not list_processes(), reason="needs /proc")
+async def test_reaper_only_kills_processes_of_sandboxes() -> None:
+    process_reaper = ProcessReaper()
+    # e.g. one the application embedding the server started
+    other = subprocess.Popen(["sleep", "60"], start_new_session=True)  # noqa: S607, ASYNC220
+    # stands in for a process which stayed in the session of an already stopped sandbox
+    leftover = subprocess.Popen(["sleep", "60"], start_new_session=True)  # noqa: S607, ASYNC220
+    process_reaper.add(leftover.pid)
+    process_reaper.discard(leftover.pid)
+    try:
+        await process_reaper.reap()
+        await asyncio.sleep(0.5)
+        # reaps the killed process
+        await process_reaper.reap()
+
+        assert not running(leftover.pid)
+        assert running(other.pid)
+        assert process_reaper.leaked == 1
+    finally:
+        other.kill()
+        other.wait()
@@ -0,0 +1,51 @@
+from pathlib import Path
+
+from mcp_run_isolated_python.utils.settings import Settings
+from mcp_run_isolated_python.workspaces import WorkspaceManager
+
+
+def _list(directory: Path) -> list[Path]:
+    return list(directory.iterdir())
+
+
+async def test_workspaces_are_created_ahead_of_time(settings: Settings, tmp_path: Path) -> None:
+    settings.workspace_directory = tmp_path
+    settings.workspace_pool_size = 2
+    workspaces = WorkspaceManager(settings=settings)
+    await workspaces.start()
+
+    workspace = await workspaces.acquire()
+    assert workspace.parent == tmp_path
+    assert [path.name for path in workspace.iterdir()] == ["output"]
+
+    # the pool is refilled in the background
+    await workspaces.stop()
+    assert _list(tmp_path) == [workspace]
+
+
+async def test_workspaces_are_removed_in_the_background(settings: Settings, tmp_path: Path) -> None:
+    settings.workspace_directory = tmp_path
+    settings.workspace_pool_size = 0
+    workspaces = WorkspaceManager(settings=settings)
+    await workspaces.start()
+
+    workspace = await workspaces.acquire()
+    (workspace / "file.txt").write_text("hi")
+    spill_path = WorkspaceManager.spill_path(workspace, "stdout")
+    spill_path.write_text("hi")
+    workspaces.release(workspace)
+
+    await workspaces.stop()
+    assert _list(tmp_path) == []
+
+
+async def test_orphans_are_removed_on_startup(settings: Settings, tmp_path: Path) -> None:
+    settings.workspace_directory = tmp_path
+    settings.workspace_pool_size = 0
+    (tmp_path / "orphan" / "output").mkdir(parents=True)
+    (tmp_path / "orphan.stdout.txt").write_text("hi")
+
+    workspaces = WorkspaceManager(settings=settings)
+    await workspaces.start()
+    assert _list(tmp_path) == []
+    await workspaces.stop()